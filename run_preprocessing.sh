@@ -2,6 +2,7 @@
 
 # Script de preprocessing pour CityZN
 # Transforme les données brutes en dataset ML
+# Usage: ./run_preprocessing.sh [--incremental]
 
 echo "╔═══════════════════════════════════════════════════════════════╗"
 echo "║  🔧 PREPROCESSING CITYZN - CRÉATION DATASET ML               ║"
@@ -40,13 +41,15 @@ if [ ! -f "data/raw/bike/bike_sensors_metadata.json" ]; then
     MISSING_DATA=1
 fi
 
-if [ ! -d "data/raw/bike" ] || [ -z "$(ls -A data/raw/bike/bike_counters_*.json 2>/dev/null)" ]; then
-    echo "   ❌ Aucun fichier bike_counters_*.json trouvé"
+# Partitions journalières (counters/*.parquet) ou anciens fichiers bike_counters_YYYYMMDD_HHMMSS.json
+if [ -z "$(ls data/raw/bike/counters/*.parquet data/raw/bike/bike_counters_[0-9]*_[0-9]*.json 2>/dev/null)" ]; then
+    echo "   ❌ Aucune donnée de comptage trouvée (counters/*.parquet ou bike_counters_YYYYMMDD_HHMMSS.json)"
     MISSING_DATA=1
 fi
 
-if [ ! -d "data/raw/weather" ] || [ -z "$(ls -A data/raw/weather/weather_data.json 2>/dev/null)" ]; then
-    echo "   ❌ Aucun fichier weather_data.json trouvé"
+# Archive journalière (archive/weather_YYYY-MM-DD.parquet) ou anciens fichiers weather_data*.json
+if [ -z "$(ls data/raw/weather/archive/weather_*.parquet data/raw/weather/weather_data*.json 2>/dev/null)" ]; then
+    echo "   ❌ Aucune donnée météo trouvée (archive/weather_*.parquet ou weather_data*.json)"
     MISSING_DATA=1
 fi
 
@@ -66,7 +69,7 @@ echo "║  📊 LANCEMENT PREPROCESSING                                   ║"
 echo "╚═══════════════════════════════════════════════════════════════╝"
 echo ""
 
-python src/preprocessing/create_ml_dataset_v3.py
+python src/preprocessing/create_ml_dataset_v3.py "$@"
 
 # Vérifier le résultat
 if [ $? -eq 0 ]; then
@@ -76,6 +79,7 @@ if [ $? -eq 0 ]; then
     echo "╚═══════════════════════════════════════════════════════════════╝"
     echo ""
     echo "📂 Fichiers générés:"
+    echo "   • data/processed/final_dataset_v3/ (Parquet partitionné par date)"
     echo "   • data/processed/final_dataset_v3.csv"
     echo "   • data/processed/edges_static_v3.gpkg"
     echo ""
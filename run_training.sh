@@ -23,7 +23,7 @@ echo "📦 Activation de l'environnement..."
 source .venv/bin/activate
 
 # Vérifier dataset preprocessing
-if [ ! -f "data/processed/final_dataset_v3.csv" ]; then
+if [ ! -d "data/processed/final_dataset_v3" ] && [ ! -f "data/processed/final_dataset_v3.csv" ]; then
     echo ""
     echo "❌ Dataset v3 non trouvé!"
     echo "💡 Lancez d'abord: ./run_preprocessing.sh"
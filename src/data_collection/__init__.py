@@ -5,9 +5,17 @@ Contient les scripts de collecte pour chaque source de données
 
 # Exposer les modules de collecte
 __all__ = [
+    'counter_store',
+    'counter_watermarks',
     'fetch_bike_counters',
     'fetch_bike_infrastructure',
+    'fetch_engine',
     'fetch_osm_network',
     'fetch_weather',
-    'main_data_collection'
+    'geojson_stream',
+    'http_cache',
+    'main_data_collection',
+    'osm_features',
+    'osm_pbf',
+    'weather_store'
 ]
@@ -0,0 +1,182 @@
+"""
+Stockage des comptages vélo en partitions Parquet journalières
+data/raw/bike/counters/bike_counts_YYYY-MM-DD.parquet : une partition par jour de données,
+uniquement (counter_id, timestamp, count). Les métadonnées des capteurs (nom, position…)
+restent dans bike_sensors_metadata.json et ne sont pas répétées à chaque mesure.
+
+Les nouvelles mesures sont ajoutées à la partition de leur jour : une mesure déjà présente
+(même capteur, même heure) est remplacée, la partition n'est réécrite (de façon atomique)
+que si son contenu change. Ajouter deux fois les mêmes mesures ne modifie donc rien.
+
+Les anciens fichiers horaires bike_counters_YYYYMMDD_HHMMSS.json restent lisibles
+(read_legacy_file, et le chargement du preprocessing) et peuvent être convertis :
+    python src/data_collection/counter_store.py --migrate [--delete-legacy]
+
+Lecture typique:
+    df = pd.concat(read_partition(path) for path in list_partitions(DATA_RAW_DIR / STORE_DIRNAME))
+"""
+
+import re
+import sys
+import json
+import argparse
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Dossier des partitions (dans data/raw/bike)
+STORE_DIRNAME = "counters"
+
+# bike_counts_YYYY-MM-DD.parquet
+_PARTITION_RE = re.compile(r"^bike_counts_(\d{4}-\d{2}-\d{2})\.parquet$")
+# Anciens fichiers horaires bike_counters_YYYYMMDD_HHMMSS.json
+_LEGACY_RE = re.compile(r"^bike_counters_\d{8}_\d{6}\.json$")
+
+COUNTER_STORE_FIELDS = ['counter_id', 'timestamp', 'count']
+SCHEMA = pa.schema([
+    ('counter_id', pa.string()),
+    ('timestamp', pa.timestamp('s')),
+    ('count', pa.int32()),
+])
+
+
+def partition_path(store_dir, day):
+    """Chemin de la partition d'un jour ('YYYY-MM-DD')"""
+    return store_dir / f"bike_counts_{day}.parquet"
+
+
+def list_partitions(store_dir):
+    """Liste triée des partitions journalières"""
+    if not store_dir.is_dir():
+        return []
+    return sorted(path for path in store_dir.glob("bike_counts_*.parquet") if _PARTITION_RE.match(path.name))
+
+
+def partition_date(path):
+    """Jour d'une partition ('YYYY-MM-DD'), None si nom non reconnu"""
+    match = _PARTITION_RE.match(path.name)
+    return match.group(1) if match else None
+
+
+def records_frame(records):
+    """DataFrame typé (COUNTER_STORE_FIELDS) à partir d'enregistrements (dicts) de mesures"""
+    df = pd.DataFrame.from_records(
+        [{field: record.get(field) for field in COUNTER_STORE_FIELDS} for record in records],
+        columns=COUNTER_STORE_FIELDS
+    )
+    df['counter_id'] = df['counter_id'].astype(str)
+    df['timestamp'] = pd.to_datetime(df['timestamp']).astype('datetime64[s]')
+    df['count'] = pd.to_numeric(df['count'], errors='coerce').fillna(0).astype('int32')
+    return df
+
+
+def read_partition(path):
+    """DataFrame (COUNTER_STORE_FIELDS) d'une partition"""
+    return pq.read_table(path, schema=SCHEMA).to_pandas()
+
+
+def read_range(store_dir, start, end):
+    """Mesures des partitions de start (inclus) à end (exclu), datetimes naïfs en heure locale"""
+    days = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq='D')
+    paths = [partition_path(store_dir, day.strftime('%Y-%m-%d')) for day in days]
+    frames = [read_partition(path) for path in paths if path.exists()]
+    if not frames:
+        return records_frame([])
+    df = pd.concat(frames, ignore_index=True)
+    return df[(df['timestamp'] >= start) & (df['timestamp'] < end)].reset_index(drop=True)
+
+
+def read_legacy_file(path):
+    """DataFrame (COUNTER_STORE_FIELDS) d'un ancien fichier horaire JSON"""
+    with open(path, encoding='utf-8') as f:
+        return records_frame(json.load(f).get('records', []))
+
+
+def _write_partition(df, path):
+    """Écriture atomique d'une partition"""
+    table = pa.Table.from_pandas(df[COUNTER_STORE_FIELDS], schema=SCHEMA, preserve_index=False)
+    tmp_path = path.with_suffix('.tmp')
+    pq.write_table(table, tmp_path)
+    tmp_path.replace(path)
+
+
+def append_frame(store_dir, df):
+    """
+    Ajoute des mesures (DataFrame COUNTER_STORE_FIELDS) aux partitions de leurs jours
+
+    Returns:
+        (partitions écrites, nombre de partitions inchangées)
+    """
+    store_dir.mkdir(parents=True, exist_ok=True)
+    written, unchanged = [], 0
+
+    for day, new in df.groupby(df['timestamp'].dt.strftime('%Y-%m-%d'), sort=True):
+        path = partition_path(store_dir, day)
+        existing = read_partition(path) if path.exists() else None
+
+        merged = new if existing is None else pd.concat([existing, new], ignore_index=True)
+        merged = (
+            merged.drop_duplicates(['counter_id', 'timestamp'], keep='last')
+            .sort_values(['timestamp', 'counter_id'])
+            .reset_index(drop=True)
+        )
+
+        if existing is not None and merged.equals(existing):
+            unchanged += 1
+            continue
+
+        _write_partition(merged, path)
+        written.append(path)
+
+    return written, unchanged
+
+
+def append_records(store_dir, records):
+    """Ajoute des mesures (dicts counter_id, timestamp, count…) ; voir append_frame"""
+    if not records:
+        return [], 0
+    return append_frame(store_dir, records_frame(records))
+
+
+def migrate_legacy(bike_dir, store_dir, delete_legacy=False):
+    """
+    Convertit les anciens fichiers horaires JSON en partitions
+
+    Returns:
+        nombre de fichiers convertis
+    """
+    legacy_files = sorted(path for path in bike_dir.glob("bike_counters_*.json") if _LEGACY_RE.match(path.name))
+    if not legacy_files:
+        return 0
+
+    df = pd.concat([read_legacy_file(path) for path in legacy_files], ignore_index=True)
+    written, unchanged = append_frame(store_dir, df)
+    print(f"   ✅ {len(legacy_files)} fichiers horaires → {len(written)} partitions écrites, {unchanged} inchangées")
+
+    if delete_legacy:
+        for path in legacy_files:
+            path.unlink()
+        print(f"   🗑️  {len(legacy_files)} fichiers horaires supprimés")
+
+    return len(legacy_files)
+
+
+if __name__ == "__main__":
+    BASE_DIR = Path(__file__).parent.parent.parent
+    DATA_RAW_DIR = BASE_DIR / "data" / "raw" / "bike"
+
+    parser = argparse.ArgumentParser(description="Stockage des comptages vélo en partitions journalières")
+    parser.add_argument('--migrate', action='store_true',
+                        help="Convertir les fichiers horaires bike_counters_*.json en partitions")
+    parser.add_argument('--delete-legacy', action='store_true',
+                        help="Supprimer les fichiers horaires après conversion")
+    args = parser.parse_args()
+
+    if not args.migrate:
+        parser.print_help()
+        sys.exit(0)
+
+    print("📦 Conversion des fichiers horaires en partitions journalières...")
+    migrate_legacy(DATA_RAW_DIR, DATA_RAW_DIR / STORE_DIRNAME, delete_legacy=args.delete_legacy)
@@ -0,0 +1,88 @@
+"""
+Collecte incrémentale des compteurs vélo : niveau haut (watermark) par capteur
+Pour chaque capteur, la dernière heure complète reçue est conservée dans
+data/raw/bike/bike_counters_watermarks.json. La collecte suivante ne demande que les heures
+depuis ce watermark, moins une marge (overlap_hours) pour reprendre les corrections tardives
+de l'API ; un capteur sans watermark est collecté sur les default_days derniers jours.
+
+Les heures collectées sont ajoutées aux partitions journalières (counter_store) : une
+mesure déjà stockée est remplacée, une partition n'est réécrite que si son contenu change
+(relancer la collecte ne modifie rien).
+
+Utilisation typique:
+    watermarks = load_watermarks(DATA_RAW_DIR / WATERMARKS_FILENAME)
+    start, end = fetch_window(watermarks.get(pdc_id), now)
+"""
+
+import json
+from datetime import datetime, timedelta
+
+# Fichier des watermarks (dans data/raw/bike)
+WATERMARKS_FILENAME = "bike_counters_watermarks.json"
+
+# Heures reprises avant le watermark (corrections tardives)
+DEFAULT_OVERLAP_HOURS = 3
+# Historique collecté pour un capteur sans watermark
+DEFAULT_DAYS = 7
+
+
+def last_complete_hour(now):
+    """Début de l'heure en cours : les heures strictement avant sont complètes"""
+    return now.replace(minute=0, second=0, microsecond=0)
+
+
+def fetch_window(watermark, now, overlap_hours=DEFAULT_OVERLAP_HOURS, default_days=DEFAULT_DAYS):
+    """
+    Heures à collecter pour un capteur
+
+    Args:
+        watermark: dernière heure reçue (datetime), None si jamais collecté
+        now: date de la collecte
+
+    Returns:
+        (début inclus, fin exclue), heures entières
+    """
+    end = last_complete_hour(now)
+    if watermark is None:
+        start = end - timedelta(days=default_days)
+    else:
+        start = last_complete_hour(watermark) - timedelta(hours=overlap_hours)
+        start = max(start, end - timedelta(days=default_days))
+    return start, end
+
+
+def load_watermarks(path):
+    """Watermarks {pdc_id: datetime} (vide si le fichier est absent ou illisible)"""
+    if not path.exists():
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            raw = json.load(f).get('watermarks', {})
+        return {pdc_id: datetime.fromisoformat(value) for pdc_id, value in raw.items()}
+    except (ValueError, OSError) as e:
+        print(f"   ⚠️  Watermarks illisibles ({e}), collecte complète")
+        return {}
+
+
+def save_watermarks(watermarks, path):
+    """Écrit les watermarks, de façon atomique"""
+    data = {
+        'updated_at': datetime.now().isoformat(),
+        'watermarks': {pdc_id: value.isoformat() for pdc_id, value in sorted(watermarks.items())},
+    }
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    tmp_path.replace(path)
+    return path
+
+
+def update_watermarks(watermarks, records):
+    """Watermarks avancés à la dernière heure reçue de chaque capteur (jamais reculés)"""
+    updated = dict(watermarks)
+    for record in records:
+        timestamp = datetime.fromisoformat(record['timestamp'])
+        pdc_id = record['counter_id']
+        if pdc_id not in updated or timestamp > updated[pdc_id]:
+            updated[pdc_id] = timestamp
+    return updated
@@ -3,16 +3,41 @@ Script de collecte des données des compteurs vélo Eco-Counter
 Source: API Eco-Visio - Métropole de Lyon
 Enregistre:
   - Les données des capteurs (fichier unique mis à jour)
-  - Les données de comptage (fichier par timestamp)
+  - Les données de comptage (partitions Parquet journalières, data_collection.counter_store)
+
+Les capteurs sont interrogés en parallèle (data_collection.fetch_engine) : session partagée,
+nombre de requêtes simultanées et débit vers l'API bornés, nouvelles tentatives sur 429/5xx.
+
+Collecte incrémentale (data_collection.counter_watermarks) : seules les heures complètes
+depuis la dernière collecte de chaque capteur (moins une marge) sont demandées, puis
+ajoutées aux partitions journalières existantes.
+
+Usage:
+    python src/data_collection/fetch_bike_counters.py [--workers 8] [--rate 10]
+    python src/data_collection/fetch_bike_counters.py --full-days 7   # ignorer les watermarks
+
+La liste des capteurs passe par le cache HTTP (data_collection.http_cache, 1 jour) ; les
+comptages, différents à chaque collecte, ne sont pas mis en cache.
 """
 
+import sys
 import json
-import requests
+import argparse
 from datetime import datetime, timedelta
 from pathlib import Path
 
 # Configuration
 BASE_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from data_collection.fetch_engine import FetchEngine, DEFAULT_MAX_WORKERS, DEFAULT_RATE_PER_HOST
+from data_collection.counter_watermarks import (
+    WATERMARKS_FILENAME, DEFAULT_OVERLAP_HOURS, DEFAULT_DAYS,
+    fetch_window, load_watermarks, save_watermarks, update_watermarks
+)
+from data_collection.counter_store import STORE_DIRNAME, append_records, read_range
+from data_collection.http_cache import ResponseCache
+
 DATA_RAW_DIR = BASE_DIR / "data" / "raw" / "bike"
 DATA_RAW_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -42,16 +67,16 @@ def format_date_for_api(date_obj):
     return date_obj.strftime("%d%%2F%m%%2F%Y")
 
 
-def fetch_sensors_list():
+def fetch_sensors_list(engine=None, url=SENSORS_LIST_URL):
     """
     Récupère la liste des capteurs vélo et leurs informations
     Retourne: dict {idPdc: {name, lat, lon, flows, total, lastDay}}
     """
     print("\n🚴 Récupération liste des capteurs Eco-Counter...")
+    engine = engine or FetchEngine()
     
     try:
-        response = requests.get(SENSORS_LIST_URL, timeout=30)
-        response.raise_for_status()
+        response = engine.get(url, source='bike_sensors', timeout=30)
         sensors_raw = response.json()
         
         if not isinstance(sensors_raw, list):
@@ -92,28 +117,34 @@ def fetch_sensors_list():
         return None
 
 
-def fetch_counter_data(pdc_id, sensor_info, start_date, end_date):
+def fetch_counter_data(pdc_id, sensor_info, start_date, end_date, engine=None, base_url=API_BASE_URL):
     """
     Récupère les données de comptage pour un capteur spécifique
+    (engine: FetchEngine partagé entre les capteurs, une session par appel sinon)
+
+    L'API renvoie des valeurs horaires à partir de minuit du jour de début : seules les
+    heures dans [start_date, end_date) sont gardées, sans les dernières heures encore
+    sans valeur (pas encore remontées par le capteur).
     """
     if not sensor_info['flows']:
         return []
     
+    day_start = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    
     try:
         flow_ids_str = ";".join(sensor_info['flows'])
         
         url = (
-            f"{API_BASE_URL}/{pdc_id}"
+            f"{base_url}/{pdc_id}"
             f"?idOrganisme={ORGANISME_ID}"
             f"&idPdc={pdc_id}"
             f"&debut={format_date_for_api(start_date)}"
-            f"&fin={format_date_for_api(end_date)}"
+            f"&fin={format_date_for_api(end_date - timedelta(microseconds=1))}"
             f"&interval=3"  # 3 = horaire
             f"&flowIds={flow_ids_str}"
         )
         
-        response = requests.get(url, timeout=40)
-        response.raise_for_status()
+        response = (engine or FetchEngine(max_workers=1)).get(url)
         raw_data = response.json()
         
         # Parser les données
@@ -126,6 +157,7 @@ def fetch_counter_data(pdc_id, sensor_info, start_date, end_date):
             raw_list = []
         
         # Reconstituer les timestamps et parser les valeurs
+        last_value = None
         for i, point in enumerate(raw_list):
             # Extraire date et count selon le format
             if isinstance(point, (list, tuple)) and len(point) >= 2:
@@ -138,11 +170,16 @@ def fetch_counter_data(pdc_id, sensor_info, start_date, end_date):
             
             try:
                 hours_from_start = i
-                timestamp = start_date + timedelta(hours=hours_from_start)
+                timestamp = day_start + timedelta(hours=hours_from_start)
                 count_val = int(count_str) if count_str not in (None, '') else 0
             except Exception:
                 continue
             
+            if timestamp < start_date or timestamp >= end_date:
+                continue
+            if count_str not in (None, ''):
+                last_value = len(series)
+            
             series.append({
                 "counter_id": pdc_id,
                 "counter_name": sensor_info['name'],
@@ -156,13 +193,75 @@ def fetch_counter_data(pdc_id, sensor_info, start_date, end_date):
                 "lon": sensor_info['lon']
             })
         
-        return series
+        # Heures finales sans valeur : non remontées, reprises à la prochaine collecte
+        return series[:last_value + 1] if last_value is not None else []
         
     except Exception as e:
         print(f"   ⚠️  Erreur PDC {pdc_id} ({sensor_info['name']}): {e}")
         return []
 
 
+def fetch_all_counters(sensors_map, windows, engine, base_url=API_BASE_URL):
+    """
+    Récupère les données de comptage de tous les capteurs en parallèle
+
+    Args:
+        windows: {pdc_id: (début, fin)} heures à collecter par capteur (fetch_window)
+
+    Returns:
+        (liste des mesures, nombre de capteurs avec des données), mesures triées par capteur
+    """
+    pdc_ids = [pdc_id for pdc_id, sensor_info in sorted(sensors_map.items()) if sensor_info['flows']]
+
+    def fetch(pdc_id):
+        start_date, end_date = windows[pdc_id]
+        return fetch_counter_data(pdc_id, sensors_map[pdc_id], start_date, end_date, engine, base_url)
+
+    series_by_sensor = {}
+    for pdc_id, series in engine.map(fetch, pdc_ids):
+        if isinstance(series, Exception):
+            print(f"   ⚠️  Erreur PDC {pdc_id}: {series}")
+            series = []
+        series_by_sensor[pdc_id] = series
+
+        name = sensors_map[pdc_id]['name'][:40]
+        print(f"   Capteur {pdc_id}: {name}... " + (f"✓ {len(series)} mesures" if series else "✗"))
+
+    all_time_series = [record for pdc_id in pdc_ids for record in series_by_sensor[pdc_id]]
+    successful_counters = sum(1 for series in series_by_sensor.values() if series)
+    return all_time_series, successful_counters
+
+
+def sensor_statistics(counts):
+    """
+    Statistiques par capteur d'un DataFrame de comptages (counter_store)
+
+    Returns:
+        dict {counter_id: {total, count, max, min, avg}}
+    """
+    stats = counts.groupby('counter_id')['count'].agg(['sum', 'size', 'max', 'min', 'mean'])
+    return {
+        sensor_id: {
+            "total": int(row['sum']),
+            "count": int(row['size']),
+            "max": int(row['max']),
+            "min": int(row['min']),
+            "avg": float(row['mean'])
+        }
+        for sensor_id, row in stats.iterrows()
+    }
+
+
+def _hour_record(row, sensors_map):
+    """Mesure (ligne du counter_store) avec le nom du capteur, pour le résumé"""
+    return {
+        "counter_id": row['counter_id'],
+        "counter_name": sensors_map.get(row['counter_id'], {}).get('name'),
+        "timestamp": row['timestamp'].isoformat(),
+        "count": int(row['count'])
+    }
+
+
 def export_sensors_to_geojson(sensors_map, stats_by_sensor):
     """
     Exporte les capteurs en GeoJSON pour visualisation
@@ -223,22 +322,33 @@ def export_sensors_to_geojson(sensors_map, stats_by_sensor):
         return None
 
 
-def main():
+def main(max_workers=DEFAULT_MAX_WORKERS, rate_per_host=DEFAULT_RATE_PER_HOST,
+         overlap_hours=DEFAULT_OVERLAP_HOURS, full_days=None, offline=False):
     """
     Point d'entrée principal
+
+    Args:
+        max_workers: nombre de capteurs interrogés simultanément
+        rate_per_host: requêtes par seconde maximum vers l'API Eco-Visio
+        overlap_hours: heures reprises avant le watermark de chaque capteur
+        full_days: si renseigné, ignorer les watermarks et collecter ce nombre de jours
+        offline: ne lire que le cache HTTP (liste des capteurs ; aucun comptage collecté)
     """
     print("="*60)
     print("🚴 COLLECTE COMPTEURS VÉLO ECO-COUNTER")
     print("="*60)
     
-    # Configuration de la période (7 derniers jours)
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=7)
+    # Configuration de la période : depuis le watermark de chaque capteur (7 jours sans watermark)
+    now = datetime.now()
+    watermarks_path = DATA_RAW_DIR / WATERMARKS_FILENAME
+    watermarks = {} if full_days else load_watermarks(watermarks_path)
+    default_days = full_days or DEFAULT_DAYS
     
-    print(f"\nPériode: {start_date.strftime('%d/%m/%Y')} → {end_date.strftime('%d/%m/%Y')}")
+    engine = FetchEngine(max_workers=max_workers, rate_per_host=rate_per_host,
+                         cache=ResponseCache(offline=offline))
     
     # 1. Récupérer la liste des capteurs
-    sensors_map = fetch_sensors_list()
+    sensors_map = fetch_sensors_list(engine)
     if not sensors_map:
         print("❌ Impossible de récupérer la liste des capteurs")
         return None
@@ -253,98 +363,46 @@ def main():
     }
     save_json(sensors_metadata, "bike_sensors_metadata", timestamped=False)
     
+    if offline:
+        print("\n📴 Mode hors ligne : comptages non collectés (pas de cache pour les comptages)")
+        return None
+    
     # 3. Récupérer les données de comptage pour chaque capteur
-    print("\n📊 Récupération données de comptage...")
-    all_time_series = []
-    successful_counters = 0
+    windows = {
+        pdc_id: fetch_window(watermarks.get(pdc_id), now, overlap_hours, default_days)
+        for pdc_id in sensors_map
+    }
+    start_date = min(start for start, _ in windows.values())
+    end_date = max(end for _, end in windows.values())
+    n_incremental = sum(1 for pdc_id in sensors_map if pdc_id in watermarks)
     
-    for pdc_id, sensor_info in sorted(sensors_map.items()):
-        if not sensor_info['flows']:
-            continue
-        
-        print(f"   Capteur {pdc_id}: {sensor_info['name'][:40]}...", end=" ")
-        
-        series = fetch_counter_data(pdc_id, sensor_info, start_date, end_date)
-        
-        if series:
-            all_time_series.extend(series)
-            successful_counters += 1
-            print(f"✓ {len(series)} mesures")
-        else:
-            print("✗")
+    print(f"\nPériode: {start_date.strftime('%d/%m/%Y %H:%M')} → {end_date.strftime('%d/%m/%Y %H:%M')}")
+    print(f"   • {n_incremental}/{len(sensors_map)} capteurs depuis leur watermark (marge {overlap_hours}h)")
+    
+    print(f"\n📊 Récupération données de comptage ({max_workers} requêtes simultanées)...")
+    fetch_start = datetime.now()
+    all_time_series, successful_counters = fetch_all_counters(sensors_map, windows, engine)
+    print(f"   ⏱️  {(datetime.now() - fetch_start).total_seconds():.1f}s")
+    engine.print_summary()
     
     if not all_time_series:
         print("❌ Aucune donnée de comptage récupérée")
         return None
     
-    # 4. Calculer les statistiques
-    stats_by_sensor = {}
-    for record in all_time_series:
-        sensor_id = record["counter_id"]
-        count = record["count"]
-        
-        if sensor_id not in stats_by_sensor:
-            stats_by_sensor[sensor_id] = {
-                "total": 0,
-                "count": 0,
-                "max": 0,
-                "min": float('inf')
-            }
-        
-        stats_by_sensor[sensor_id]["total"] += count
-        stats_by_sensor[sensor_id]["count"] += 1
-        stats_by_sensor[sensor_id]["max"] = max(stats_by_sensor[sensor_id]["max"], count)
-        stats_by_sensor[sensor_id]["min"] = min(stats_by_sensor[sensor_id]["min"], count)
-    
-    # Calculer moyennes
-    for sensor_id, stats in stats_by_sensor.items():
-        stats["avg"] = stats["total"] / stats["count"] if stats["count"] > 0 else 0
-        if stats["min"] == float('inf'):
-            stats["min"] = 0
+    # 4. Ajouter les données aux partitions journalières
+    print("\n💾 Sauvegarde des données (partitions journalières)...")
+    saved_files, unchanged = append_records(DATA_RAW_DIR / STORE_DIRNAME, all_time_series)
+    print(f"   ✅ {len(saved_files)} partitions écrites (un fichier par jour), {unchanged} inchangées")
     
-    # 5. Grouper les données par timestamp (heure)
-    print("\n💾 Sauvegarde des données par timestamp...")
+    # Les watermarks n'avancent qu'une fois les partitions écrites
+    save_watermarks(update_watermarks(watermarks, all_time_series), watermarks_path)
     
-    data_by_timestamp = {}
-    for record in all_time_series:
-        timestamp = record["timestamp"]
-        if timestamp not in data_by_timestamp:
-            data_by_timestamp[timestamp] = []
-        data_by_timestamp[timestamp].append(record)
-    
-    # Sauvegarder un fichier par timestamp
-    saved_files = []
-    for timestamp_iso, records in sorted(data_by_timestamp.items()):
-        # Convertir timestamp ISO en format pour nom de fichier
-        dt = datetime.fromisoformat(timestamp_iso)
-        timestamp_str = dt.strftime("%Y%m%d_%H%M%S")
-        
-        hourly_data = {
-            "metadata": {
-                "source": "Eco-Counter via API Eco-Visio (DONNÉES RÉELLES)",
-                "api_url": API_BASE_URL,
-                "organisme": f"Métropole de Lyon (ID: {ORGANISME_ID})",
-                "collection_timestamp": datetime.now().isoformat(),
-                "data_timestamp": timestamp_iso,
-                "counters_count": len(records),
-                "licence": "Données ouvertes Eco-Counter / Métropole de Lyon"
-            },
-            "records": records,
-            "summary": {
-                "total_passages": sum(r["count"] for r in records),
-                "avg_passages": round(sum(r["count"] for r in records) / len(records), 1) if records else 0
-            }
-        }
-        
-        # Sauvegarder avec le timestamp dans le nom
-        filepath = DATA_RAW_DIR / f"bike_counters_{timestamp_str}.json"
-        with open(filepath, 'w', encoding='utf-8') as f:
-            import json
-            json.dump(hourly_data, f, indent=2, ensure_ascii=False)
-        
-        saved_files.append(filepath)
-    
-    print(f"   ✅ {len(saved_files)} fichiers créés (un par heure)")
+    # 5. Statistiques sur les default_days derniers jours des partitions (et non sur la seule
+    # fenêtre incrémentale de cette collecte, quelques heures)
+    stats_start = end_date - timedelta(days=default_days)
+    counts = read_range(DATA_RAW_DIR / STORE_DIRNAME, stats_start, end_date)
+    stats_by_sensor = sensor_statistics(counts)
+    print(f"   📊 Statistiques sur {default_days} jours: {len(counts):,} mesures, {len(stats_by_sensor)} capteurs")
     
     # Créer aussi un fichier de résumé global
     summary_result = {
@@ -355,17 +413,22 @@ def main():
             "successful_counters": successful_counters,
             "records_count": len(all_time_series),
             "files_count": len(saved_files),
-            "period": {
+            "collected_period": {
                 "start": start_date.isoformat(),
+                "end": end_date.isoformat()
+            },
+            "period": {
+                "start": stats_start.isoformat(),
                 "end": end_date.isoformat(),
-                "days": 7
+                "days": default_days
             }
         },
         "summary": {
-            "total_passages": sum(t["count"] for t in all_time_series),
-            "avg_per_hour": round(sum(t["count"] for t in all_time_series) / len(all_time_series), 1),
-            "max_hour": max(all_time_series, key=lambda x: x["count"]),
-            "min_hour": min(all_time_series, key=lambda x: x["count"])
+            "records_count": len(counts),
+            "total_passages": int(counts['count'].sum()),
+            "avg_per_hour": round(float(counts['count'].mean()), 1) if len(counts) else 0,
+            "max_hour": _hour_record(counts.loc[counts['count'].idxmax()], sensors_map) if len(counts) else None,
+            "min_hour": _hour_record(counts.loc[counts['count'].idxmin()], sensors_map) if len(counts) else None
         }
     }
     
@@ -379,7 +442,7 @@ def main():
     print("✅ COLLECTE TERMINÉE")
     print("="*60)
     print(f"Capteurs réussis: {successful_counters}/{len(sensors_map)}")
-    print(f"Fichiers horaires créés: {len(saved_files)}")
+    print(f"Partitions journalières écrites: {len(saved_files)}")
     print(f"Total passages: {summary_result['summary']['total_passages']:,}")
     print(f"Moyenne par heure: {summary_result['summary']['avg_per_hour']:.1f}")
     print(f"\n📁 Fichiers créés dans: {DATA_RAW_DIR}")
@@ -388,4 +451,17 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Collecte des compteurs vélo Eco-Counter")
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f"Capteurs interrogés simultanément (défaut: {DEFAULT_MAX_WORKERS})")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE_PER_HOST,
+                        help=f"Requêtes par seconde maximum vers l'API (défaut: {DEFAULT_RATE_PER_HOST:g})")
+    parser.add_argument('--overlap-hours', type=int, default=DEFAULT_OVERLAP_HOURS,
+                        help=f"Heures reprises avant le watermark de chaque capteur (défaut: {DEFAULT_OVERLAP_HOURS})")
+    parser.add_argument('--full-days', type=int,
+                        help="Ignorer les watermarks et collecter ce nombre de jours")
+    parser.add_argument('--offline', action='store_true',
+                        help="Ne lire que le cache HTTP (aucune requête réseau)")
+    args = parser.parse_args()
+
+    main(args.workers, args.rate, args.overlap_hours, args.full_days, args.offline)
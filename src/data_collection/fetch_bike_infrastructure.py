@@ -2,72 +2,198 @@
 Script de collecte des infrastructures cyclables de Lyon
 Source: API Grand Lyon - Plan des modes doux (pistes cyclables, voies vertes, etc.)
 Enregistre: GeoJSON des infrastructures cyclables
+
+La couche (OGC API Features) est paginée : la première page donne le nombre total
+d'objets (numberMatched), les pages suivantes (fenêtres startIndex) sont téléchargées en
+parallèle (--workers) ; sans numberMatched, les liens "next" sont suivis. Les pages sont
+fusionnées dans l'ordre des gid et écrites au fil de l'eau (geojson_stream).
+
+Les réponses sont conservées dans le cache HTTP (data_collection.http_cache) : une collecte
+répétée ne coûte qu'une requête conditionnelle par page tant que la couche ne change pas.
+
+Usage:
+    python src/data_collection/fetch_bike_infrastructure.py [--offline] [--workers 4] [--page-size 1000]
 """
 
+import sys
 import json
-import requests
+import heapq
+import argparse
+import tempfile
 from datetime import datetime
 from pathlib import Path
 
 # Configuration
 BASE_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from data_collection.fetch_engine import FetchEngine
+from data_collection.geojson_stream import FeatureCollectionWriter, dump_feature, request_fingerprint, same_request
+from data_collection.http_cache import ResponseCache
 DATA_RAW_DIR = BASE_DIR / "data" / "raw" / "bike"
 DATA_RAW_DIR.mkdir(parents=True, exist_ok=True)
 
-# URL de l'API Grand Lyon pour les pistes cyclables
+# URL de l'API Grand Lyon pour les pistes cyclables (pages : &startIndex=…&limit=…)
 BIKE_INFRASTRUCTURE_URL = (
     "https://data.grandlyon.com/fr/geoserv/ogc/features/v1/collections/"
     "metropole-de-lyon:pvo_patrimoine_voirie.pvoplanmodesdoux/items?"
-    "f=application/geo%2Bjson&crs=EPSG:4171&startIndex=0&sortby=gid"
+    "f=application/geo%2Bjson&crs=EPSG:4171&sortby=gid"
 )
 
+# Objets par page et pages téléchargées simultanément
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_WORKERS = 4
+# Garde-fou du suivi des liens "next" (boucle de pagination côté serveur)
+MAX_PAGES = 1000
 
-def save_json(data, filename, timestamped=False):
-    """Sauvegarde données JSON"""
-    if timestamped:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filepath = DATA_RAW_DIR / f"{filename}_{timestamp}.json"
-    else:
-        filepath = DATA_RAW_DIR / f"{filename}.json"
-    
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    
-    print(f"✅ Sauvegardé : {filepath.name}")
-    return filepath
 
+def page_url(start_index, limit, base_url=BIKE_INFRASTRUCTURE_URL):
+    """URL d'une page de la couche"""
+    return f"{base_url}&startIndex={start_index}&limit={limit}"
 
-def fetch_bike_infrastructure():
-    """
-    Récupère les infrastructures cyclables de la Métropole de Lyon
-    Retourne: GeoJSON avec pistes cyclables, voies vertes, etc.
-    """
-    print("\n🚴 Récupération infrastructures cyclables Grand Lyon...")
-    
+
+def _next_link(page):
+    """Lien vers la page suivante (OGC API Features : links rel="next"), None si dernière page"""
+    for link in page.get('links', []):
+        if link.get('rel') == 'next' and link.get('href'):
+            return link['href']
+    return None
+
+
+def _fetch_page(engine, url):
+    """Page GeoJSON de la couche (FeatureCollection)"""
+    page = engine.get(url, source='bike_infrastructure', timeout=60).json()
+    if not isinstance(page, dict) or page.get('type') != 'FeatureCollection':
+        raise ValueError("Format GeoJSON invalide")
+    return page
+
+
+def _feature_gid(feature):
+    props = feature.get('properties') or {}
+    gid = props.get('gid', feature.get('id'))
     try:
-        # Récupérer les données
-        response = requests.get(BIKE_INFRASTRUCTURE_URL, timeout=60)
-        response.raise_for_status()
-        
-        geojson_data = response.json()
-        
-        # Vérifier le format GeoJSON
-        if not isinstance(geojson_data, dict) or geojson_data.get('type') != 'FeatureCollection':
-            raise ValueError("Format GeoJSON invalide")
-        
-        features = geojson_data.get('features', [])
-        
-        # Analyser les types d'infrastructures
-        infra_types = {}
-        total_length_km = 0
-        
+        return int(gid)
+    except (TypeError, ValueError):
+        return -1
+
+
+def _spool_page(page, path):
+    """Écrit les features d'une page triées par gid : une ligne « gid <tab> feature JSON »"""
+    features = sorted(page.get('features', []), key=_feature_gid)
+    with open(path, 'w', encoding='utf-8') as f:
         for feature in features:
+            f.write(f"{_feature_gid(feature)}\t{dump_feature(feature)}\n")
+    return len(features)
+
+
+def _read_spool(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            gid, feature_json = line.rstrip('\n').split('\t', 1)
+            yield int(gid), feature_json
+
+
+def download_pages(engine, tmp_dir, page_size=DEFAULT_PAGE_SIZE, base_url=BIKE_INFRASTRUCTURE_URL):
+    """
+    Télécharge toutes les pages de la couche dans tmp_dir (un fichier par page)
+
+    Returns:
+        (fichiers des pages, nombre d'objets annoncé par le serveur ou None)
+    """
+    first = _fetch_page(engine, page_url(0, page_size, base_url))
+    paths = [tmp_dir / "page_0.tsv"]
+    returned = _spool_page(first, paths[0])
+    matched = first.get('numberMatched')
+
+    if isinstance(matched, int):
+        # Le serveur peut plafonner la taille des pages : fenêtres de la taille reçue
+        step = min(page_size, returned) if returned else page_size
+        starts = list(range(step, matched, step)) if returned < matched else []
+        print(f"   ⏳ {matched} objets, {len(starts) + 1} page(s) de {step}, "
+              f"{engine.max_workers} requête(s) simultanée(s)...")
+
+        def fetch_window(index):
+            path = tmp_dir / f"page_{index + 1}.tsv"
+            _spool_page(_fetch_page(engine, page_url(starts[index], step, base_url)), path)
+            return path
+
+        results = dict(engine.map(fetch_window, range(len(starts))))
+        for index in range(len(starts)):
+            if isinstance(results[index], Exception):
+                raise results[index]
+            paths.append(results[index])
+        return paths, matched
+
+    # Sans numberMatched : liens "next", séquentiellement
+    page, url = first, _next_link(first)
+    while url and page.get('features'):
+        if len(paths) >= MAX_PAGES:
+            raise ValueError(f"pagination interrompue après {MAX_PAGES} pages")
+        page = _fetch_page(engine, url)
+        paths.append(tmp_dir / f"page_{len(paths)}.tsv")
+        _spool_page(page, paths[-1])
+        url = _next_link(page)
+    print(f"   ⏳ {len(paths)} page(s) suivies (liens next)")
+    return paths, None
+
+
+def _infra_type(props):
+    return props.get('type') or props.get('typologie') or props.get('nature') or 'Inconnu'
+
+
+def simplified_feature(feature):
+    """Feature réduite à la géométrie et aux informations clés (export simplifié)"""
+    props = feature.get('properties', {})
+
+    # Garder seulement les propriétés essentielles
+    simplified_props = {
+        'id': props.get('gid') or props.get('id'),
+        'type': props.get('type') or props.get('typologie') or props.get('nature'),
+        'name': props.get('nom') or props.get('name'),
+        'width': props.get('largeur') or props.get('width'),
+        'surface': props.get('revetement') or props.get('surface'),
+        'sens': props.get('sens'),
+        'statut': props.get('statut'),
+    }
+
+    return {
+        'type': 'Feature',
+        'geometry': feature.get('geometry'),
+        'properties': {k: v for k, v in simplified_props.items() if v is not None}
+    }
+
+
+def write_infrastructure(page_paths, filepath, simplified_path, number_matched=None, fingerprint=None):
+    """
+    Fusionne les pages dans l'ordre des gid (doublons entre pages écartés) et écrit le
+    fichier complet et sa version simplifiée (géométries + infos clés, pour visualisation)
+
+    Args:
+        fingerprint: empreinte de la requête (request_fingerprint), enregistrée dans les métadonnées
+
+    Returns:
+        métadonnées du fichier complet
+    """
+    infra_types = {}
+    total_length_km = 0
+    last_gid = None
+
+    with FeatureCollectionWriter(filepath) as writer, \
+            FeatureCollectionWriter(simplified_path, wrapped=False) as simplified:
+        for gid, feature_json in heapq.merge(*(_read_spool(path) for path in page_paths), key=lambda x: x[0]):
+            # Couche modifiée pendant la collecte : un objet peut apparaître sur deux pages
+            if gid == last_gid and gid >= 0:
+                continue
+            last_gid = gid
+
+            writer.write(feature_json)
+            feature = json.loads(feature_json)
             props = feature.get('properties', {})
-            
-            # Extraire le type d'infrastructure
-            infra_type = props.get('type') or props.get('typologie') or props.get('nature') or 'Inconnu'
+
+            # Analyser les types d'infrastructures
+            infra_type = _infra_type(props)
             infra_types[infra_type] = infra_types.get(infra_type, 0) + 1
-            
+
             # Calculer longueur si disponible
             length = props.get('longueur') or props.get('length') or props.get('shape_length')
             if length:
@@ -75,120 +201,127 @@ def fetch_bike_infrastructure():
                     total_length_km += float(length) / 1000  # Convertir m en km
                 except (ValueError, TypeError):
                     pass
-        
-        # Créer le résultat avec métadonnées enrichies
-        result = {
-            "metadata": {
-                "source": "Grand Lyon - Plan des modes doux",
-                "api_url": BIKE_INFRASTRUCTURE_URL,
-                "timestamp": datetime.now().isoformat(),
-                "total_features": len(features),
-                "total_length_km": round(total_length_km, 2),
-                "infrastructure_types": infra_types,
-                "crs": "EPSG:4171 (RGF93)",
-                "licence": "Licence Ouverte / Open Licence",
-                "description": "Pistes cyclables, voies vertes, bandes cyclables, zones 30, etc.",
-                "apport": "Réseau cyclable complet pour calcul d'accessibilité et routing vélo"
-            },
-            "geojson": geojson_data
-        }
-        
-        # Statistiques par type
-        print(f"   → {len(features)} segments d'infrastructure")
-        print(f"   → Longueur totale: {total_length_km:.1f} km")
-        print(f"   → Types d'infrastructures:")
-        for infra_type, count in sorted(infra_types.items(), key=lambda x: x[1], reverse=True):
-            print(f"      • {infra_type}: {count}")
-        
-        return result
-        
-    except Exception as e:
-        print(f"❌ Erreur récupération infrastructures: {e}")
-        return None
 
+            simplified.write(dump_feature(simplified_feature(feature)))
 
-def export_simplified_geojson(result):
+        writer.metadata.update({
+            "source": "Grand Lyon - Plan des modes doux",
+            "api_url": BIKE_INFRASTRUCTURE_URL,
+            "timestamp": datetime.now().isoformat(),
+            "total_features": writer.count,
+            "number_matched": number_matched,
+            "pages": len(page_paths),
+            "total_length_km": round(total_length_km, 2),
+            "infrastructure_types": infra_types,
+            "crs": "EPSG:4171 (RGF93)",
+            "licence": "Licence Ouverte / Open Licence",
+            "description": "Pistes cyclables, voies vertes, bandes cyclables, zones 30, etc.",
+            "apport": "Réseau cyclable complet pour calcul d'accessibilité et routing vélo",
+            "request_fingerprint": fingerprint,
+        })
+        simplified.metadata.update({
+            'source': 'Grand Lyon - Plan des modes doux (simplifié)',
+            'timestamp': datetime.now().isoformat()
+        })
+
+    return writer.metadata
+
+
+def fetch_bike_infrastructure(engine=None, page_size=DEFAULT_PAGE_SIZE, keep_unchanged=True):
     """
-    Exporte une version simplifiée du GeoJSON (seulement géométries + infos clés)
+    Récupère les infrastructures cyclables de la Métropole de Lyon (toutes les pages)
+    et écrit bike_infrastructure.json et bike_infrastructure_simplified.geojson
+
+    Args:
+        keep_unchanged: fichiers existants conservés si toutes les pages viennent du cache et
+            qu'ils ont été produits par la même requête (URL, taille de page)
+
+    Returns:
+        (fichier, métadonnées) ; métadonnées None si le fichier existant est conservé,
+        (None, None) en cas d'échec
     """
-    print("\n📍 Export GeoJSON simplifié...")
-    
+    print("\n🚴 Récupération infrastructures cyclables Grand Lyon...")
+    engine = engine or FetchEngine(max_workers=DEFAULT_WORKERS)
+    filepath = DATA_RAW_DIR / "bike_infrastructure.json"
+    simplified_path = DATA_RAW_DIR / "bike_infrastructure_simplified.geojson"
+    fingerprint = request_fingerprint({"source": "wfs", "api_url": BIKE_INFRASTRUCTURE_URL, "page_size": page_size})
+
     try:
-        geojson_data = result['geojson']
-        features_simplified = []
-        
-        for feature in geojson_data.get('features', []):
-            props = feature.get('properties', {})
-            
-            # Garder seulement les propriétés essentielles
-            simplified_props = {
-                'id': props.get('gid') or props.get('id'),
-                'type': props.get('type') or props.get('typologie') or props.get('nature'),
-                'name': props.get('nom') or props.get('name'),
-                'width': props.get('largeur') or props.get('width'),
-                'surface': props.get('revetement') or props.get('surface'),
-                'sens': props.get('sens'),
-                'statut': props.get('statut'),
-            }
-            
-            features_simplified.append({
-                'type': 'Feature',
-                'geometry': feature.get('geometry'),
-                'properties': {k: v for k, v in simplified_props.items() if v is not None}
-            })
-        
-        geojson_simplified = {
-            'type': 'FeatureCollection',
-            'metadata': {
-                'source': 'Grand Lyon - Plan des modes doux (simplifié)',
-                'timestamp': datetime.now().isoformat()
-            },
-            'features': features_simplified
-        }
-        
-        filepath = DATA_RAW_DIR / "bike_infrastructure_simplified.geojson"
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(geojson_simplified, f, indent=2, ensure_ascii=False)
-        
-        print(f"   ✅ Version simplifiée exportée: {filepath.name}")
-        return filepath
-        
+        with tempfile.TemporaryDirectory(prefix="bike_infra_pages_", dir=DATA_RAW_DIR) as tmp:
+            page_paths, matched = download_pages(engine, Path(tmp), page_size, BIKE_INFRASTRUCTURE_URL)
+
+            if (keep_unchanged and engine.stats()['downloaded_bytes'] == 0
+                    and same_request(filepath, fingerprint) and simplified_path.exists()):
+                print(f"   ✓ Couche inchangée, {filepath.name} conservé")
+                return filepath, None
+
+            metadata = write_infrastructure(page_paths, filepath, simplified_path, matched, fingerprint)
     except Exception as e:
-        print(f"   ⚠️  Erreur export simplifié: {e}")
-        return None
+        print(f"❌ Erreur récupération infrastructures: {e}")
+        return None, None
+
+    if matched is not None and metadata['total_features'] != matched:
+        print(f"   ⚠️  {metadata['total_features']} objets reçus pour {matched} annoncés "
+              f"(couche modifiée pendant la collecte ?)")
+
+    # Statistiques par type
+    print(f"   → {metadata['total_features']} segments d'infrastructure ({metadata['pages']} pages)")
+    print(f"   → Longueur totale: {metadata['total_length_km']:.1f} km")
+    print(f"   → Types d'infrastructures:")
+    for infra_type, count in sorted(metadata['infrastructure_types'].items(), key=lambda x: x[1], reverse=True):
+        print(f"      • {infra_type}: {count}")
+
+    return filepath, metadata
 
 
-def main():
+def main(offline=False, workers=DEFAULT_WORKERS, page_size=DEFAULT_PAGE_SIZE):
     """
     Point d'entrée principal
+
+    Args:
+        offline: ne lire que le cache HTTP (aucune requête réseau)
+        workers: pages téléchargées simultanément
+        page_size: objets par page
     """
     print("="*60)
     print("🚴 COLLECTE INFRASTRUCTURES CYCLABLES LYON")
     print("="*60)
     
     # Récupérer les données
-    result = fetch_bike_infrastructure()
+    engine = FetchEngine(max_workers=workers, cache=ResponseCache(offline=offline))
+    filepath, metadata = fetch_bike_infrastructure(engine, page_size)
+    engine.print_summary()
     
-    if not result:
+    if filepath is None:
         print("❌ Échec de la collecte")
         return None
     
-    # Sauvegarder le fichier complet (pas de timestamp, écrase à chaque collecte)
-    filepath = save_json(result, "bike_infrastructure", timestamped=False)
+    # Couche inchangée (cache ou 304) : fichiers existants conservés
+    if metadata is None:
+        return filepath
     
-    # Exporter version simplifiée pour visualisation
-    export_simplified_geojson(result)
+    print(f"✅ Sauvegardé : {filepath.name}")
+    print(f"   ✅ Version simplifiée exportée: bike_infrastructure_simplified.geojson")
     
     # Résumé
     print("\n" + "="*60)
     print("✅ COLLECTE TERMINÉE")
     print("="*60)
-    print(f"Total segments: {result['metadata']['total_features']}")
-    print(f"Longueur totale: {result['metadata']['total_length_km']} km")
+    print(f"Total segments: {metadata['total_features']}")
+    print(f"Longueur totale: {metadata['total_length_km']} km")
     print(f"\n📁 Fichiers créés dans: {DATA_RAW_DIR}")
     
     return filepath
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Collecte des infrastructures cyclables Grand Lyon")
+    parser.add_argument('--offline', action='store_true',
+                        help="Ne lire que le cache HTTP (aucune requête réseau)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"Pages téléchargées simultanément (défaut: {DEFAULT_WORKERS})")
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f"Objets par page (défaut: {DEFAULT_PAGE_SIZE})")
+    args = parser.parse_args()
+
+    main(offline=args.offline, workers=args.workers, page_size=args.page_size)
@@ -0,0 +1,368 @@
+"""
+Moteur de requêtes HTTP concurrentes pour la collecte
+Une session requests partagée (pool de connexions keep-alive) est utilisée par un pool de
+threads de taille bornée :
+- limitation du débit par hôte (intervalle minimal entre deux requêtes vers un même hôte)
+- nouvelles tentatives sur 429 / 5xx / erreurs réseau, attente exponentielle avec jitter
+  (Retry-After respecté s'il est fourni)
+- latences de toutes les requêtes, résumées en percentiles en fin de collecte
+- cache disque optionnel des réponses (data_collection.http_cache) : requêtes avec une
+  source servies depuis le cache tant qu'elles sont valides, puis revalidées (ETag /
+  Last-Modified) ; mode hors ligne
+- lecture en flux des réponses volumineuses (stream) : contenu lu par blocs, copié dans le
+  cache au fil de la lecture
+
+Utilisation typique:
+    engine = FetchEngine(max_workers=8, rate_per_host=10)
+    results = engine.map(lambda pdc_id: fetch_counter_data(pdc_id, ..., engine=engine), pdc_ids)
+    engine.print_summary()
+"""
+
+import time
+import random
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from data_collection.http_cache import OfflineCacheMiss, cached_response, request_key
+
+# Valeurs par défaut
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_RATE_PER_HOST = 10.0  # requêtes par seconde et par hôte
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE_S = 0.5
+DEFAULT_BACKOFF_MAX_S = 30.0
+DEFAULT_TIMEOUT_S = 40
+
+# Lecture en flux : taille des blocs lus et fin de contenu conservée (BodyReader.tail)
+STREAM_CHUNK_BYTES = 64 * 1024
+STREAM_TAIL_BYTES = 4096
+
+# Codes HTTP pour lesquels une nouvelle tentative a un sens
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def make_session(pool_size=DEFAULT_MAX_WORKERS):
+    """Session requests avec un pool de connexions dimensionné pour pool_size threads"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class HostRateLimiter:
+    """Intervalle minimal entre deux requêtes vers un même hôte (partagé entre threads)"""
+
+    def __init__(self, rate_per_host=DEFAULT_RATE_PER_HOST):
+        self.interval = 1.0 / rate_per_host if rate_per_host else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _retry_after_s(response):
+    """Délai demandé par le serveur (Retry-After en secondes), None sinon"""
+    value = response.headers.get('Retry-After')
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _percentile(sorted_values, q):
+    """Percentile (rang le plus proche) d'une liste triée"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class BodyReader:
+    """
+    Contenu d'une réponse lu en flux, interface fichier (read) pour un parseur incrémental
+
+    Args:
+        chunks: itérable de blocs (bytes)
+        on_bytes: appelé avec la taille de chaque bloc reçu
+        tee: fichier binaire recevant une copie du contenu (cache)
+    """
+
+    def __init__(self, chunks, on_bytes=None, tee=None):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+        self._on_bytes = on_bytes
+        self._tee = tee
+        self.tail = b''  # derniers octets reçus (messages d'erreur en fin de contenu)
+
+    def _next_chunk(self):
+        for chunk in self._chunks:
+            if chunk:
+                if self._on_bytes is not None:
+                    self._on_bytes(len(chunk))
+                if self._tee is not None:
+                    self._tee.write(chunk)
+                self.tail = (self.tail + chunk)[-STREAM_TAIL_BYTES:]
+                return chunk
+        return b''
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            parts = [self._buffer]
+            while chunk := self._next_chunk():
+                parts.append(chunk)
+            self._buffer = b''
+            return b''.join(parts)
+
+        if not self._buffer:
+            self._buffer = self._next_chunk()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def drain(self):
+        """Lit (et copie) la fin du contenu non consommée par le parseur"""
+        self._buffer = b''
+        while self._next_chunk():
+            pass
+
+
+class FetchEngine:
+    """
+    Requêtes HTTP concurrentes avec session partagée, limitation par hôte et nouvelles tentatives
+
+    Args:
+        max_workers: nombre maximal de requêtes simultanées
+        rate_per_host: requêtes par seconde et par hôte (0 = pas de limite)
+        max_retries: nouvelles tentatives après la première requête
+        backoff_base_s, backoff_max_s: attente avant la tentative n : uniforme dans
+                                       [0, min(backoff_max_s, backoff_base_s * 2**n)]
+        timeout: timeout par requête (s)
+        session: session requests à utiliser (défaut: make_session(max_workers))
+        cache: ResponseCache (None: pas de cache)
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, rate_per_host=DEFAULT_RATE_PER_HOST,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_base_s=DEFAULT_BACKOFF_BASE_S,
+                 backoff_max_s=DEFAULT_BACKOFF_MAX_S, timeout=DEFAULT_TIMEOUT_S, session=None,
+                 cache=None):
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.timeout = timeout
+        self.session = session or make_session(max_workers)
+        self.rate_limiter = HostRateLimiter(rate_per_host)
+        self.cache = cache
+
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.counts = {'requests': 0, 'retries': 0, 'failures': 0,
+                       'cache_hits': 0, 'not_modified': 0, 'downloaded_bytes': 0}
+
+    def backoff_s(self, attempt, response=None):
+        """
+        Attente (s) avant la nouvelle tentative n° attempt (0 = première) : Retry-After de la
+        réponse si présent, sinon attente exponentielle avec jitter (voir backoff_base_s)
+        Aussi utilisée par les appelants qui retentent eux-mêmes (ex. tuiles Overpass)
+        """
+        retry_after = _retry_after_s(response) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max_s)
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** attempt))
+
+    def _record(self, latency, retry=False, failure=False):
+        with self._lock:
+            self.latencies.append(latency)
+            self.counts['requests'] += 1
+            self.counts['retries'] += retry
+            self.counts['failures'] += failure
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counts[name] += value
+
+    def get(self, url, source=None, **kwargs):
+        """GET (voir request)"""
+        return self.request('GET', url, source=source, **kwargs)
+
+    def post(self, url, source=None, **kwargs):
+        """POST (voir request)"""
+        return self.request('POST', url, source=source, **kwargs)
+
+    def request(self, method, url, source=None, **kwargs):
+        """
+        Requête avec cache, limitation par hôte et nouvelles tentatives
+
+        Args:
+            source: nom de la source pour le cache (SOURCE_TTL_S) ; None: pas de cache
+
+        Returns:
+            requests.Response (statut 2xx/3xx ; attribut from_cache si servie par le cache)
+
+        Raises:
+            requests.HTTPError pour un statut d'erreur définitif (4xx hors 429, ou après
+            la dernière tentative), requests.RequestException pour une erreur réseau,
+            OfflineCacheMiss en mode hors ligne si la réponse n'est pas en cache
+        """
+        if self.cache is None or source is None:
+            if self.cache is not None and self.cache.offline:
+                raise OfflineCacheMiss(f"hors ligne, requête sans cache: {method} {url}")
+            return self._send(method, url, **kwargs)
+
+        key = request_key(method, url, kwargs.get('data'), kwargs.get('params'))
+        entry, body = self.cache.load(key)
+
+        if entry is not None and (self.cache.offline or self.cache.is_fresh(entry, source)):
+            self._count('cache_hits')
+            return cached_response(entry, body, url)
+        if self.cache.offline:
+            raise OfflineCacheMiss(f"hors ligne, absent du cache: {method} {url}")
+
+        if entry is not None:
+            headers = dict(kwargs.pop('headers', None) or {})
+            headers.update(self.cache.conditional_headers(entry))
+            kwargs['headers'] = headers
+
+        response = self._send(method, url, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            self._count('not_modified')
+            self.cache.touch(key, entry, response)
+            return cached_response(entry, body, url)
+
+        if response.status_code == 200:
+            self.cache.store(key, response)
+        return response
+
+    @contextmanager
+    def stream(self, method, url, source=None, **kwargs):
+        """
+        Requête dont le contenu est lu en flux (réponses volumineuses), voir request
+
+        Produit un BodyReader. Avec une source, le contenu est copié dans le cache au fil de
+        la lecture et n'y est publié que si le bloc with se termine sans exception : lever
+        une exception après lecture d'un contenu invalide l'écarte du cache.
+        """
+        key = entry = None
+        if self.cache is not None and source is not None:
+            key = request_key(method, url, kwargs.get('data'), kwargs.get('params'))
+            entry = self.cache.load_entry(key)
+            if entry is not None and (self.cache.offline or self.cache.is_fresh(entry, source)):
+                self._count('cache_hits')
+                with self.cache.open_body(key) as f:
+                    yield BodyReader(iter(lambda: f.read(STREAM_CHUNK_BYTES), b''))
+                return
+        if self.cache is not None and self.cache.offline:
+            raise OfflineCacheMiss(f"hors ligne, absent du cache: {method} {url}")
+
+        if entry is not None:
+            headers = dict(kwargs.pop('headers', None) or {})
+            headers.update(self.cache.conditional_headers(entry))
+            kwargs['headers'] = headers
+
+        response = self._send(method, url, stream=True, **kwargs)
+        try:
+            if response.status_code == 304 and entry is not None:
+                self._count('not_modified')
+                self.cache.touch(key, entry, response)
+                with self.cache.open_body(key) as f:
+                    yield BodyReader(iter(lambda: f.read(STREAM_CHUNK_BYTES), b''))
+                return
+
+            writer = new_entry = None
+            if key is not None and response.status_code == 200:
+                writer, new_entry = self.cache.body_writer(key, response)
+            reader = BodyReader(response.iter_content(STREAM_CHUNK_BYTES),
+                                on_bytes=lambda n: self._count('downloaded_bytes', n), tee=writer)
+            try:
+                yield reader
+                if writer is not None:
+                    reader.drain()
+                    self.cache.commit_body(key, writer, new_entry)
+            except BaseException:
+                if writer is not None:
+                    self.cache.discard_body(writer)
+                raise
+        finally:
+            response.close()
+
+    def _send(self, method, url, **kwargs):
+        """Requête réseau avec limitation par hôte et nouvelles tentatives"""
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).netloc
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            self.rate_limiter.wait(host)
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(time.perf_counter() - start, retry=not last_attempt, failure=last_attempt)
+                if last_attempt:
+                    raise
+                time.sleep(self.backoff_s(attempt))
+                continue
+
+            retry = response.status_code in RETRY_STATUS and not last_attempt
+            self._record(time.perf_counter() - start, retry=retry, failure=response.status_code >= 400 and not retry)
+            if retry:
+                response.close()
+                time.sleep(self.backoff_s(attempt, response))
+                continue
+
+            response.raise_for_status()
+            if not kwargs.get('stream'):
+                self._count('downloaded_bytes', len(response.content))
+            return response
+
+    def map(self, func, items):
+        """
+        Applique func à chaque élément dans le pool de threads
+
+        Returns:
+            liste de (élément, résultat) dans l'ordre de fin des tâches ; une exception
+            levée par func est renvoyée comme résultat
+        """
+        results = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(func, item): item for item in items}
+            for future in as_completed(futures):
+                try:
+                    results.append((futures[future], future.result()))
+                except Exception as e:
+                    results.append((futures[future], e))
+        return results
+
+    def stats(self):
+        """Nombre de requêtes, nouvelles tentatives, échecs et percentiles de latence (ms)"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            stats = dict(self.counts)
+        for q in (50, 90, 99, 100):
+            value = _percentile(latencies, q)
+            stats[f"p{q}_ms"] = round(value * 1000, 1) if value is not None else None
+        return stats
+
+    def print_summary(self):
+        stats = self.stats()
+        print(f"\n🌐 Requêtes HTTP: {stats['requests']} ({stats['retries']} nouvelles tentatives, "
+              f"{stats['failures']} échecs), {stats['downloaded_bytes'] / 1e6:.1f} Mo téléchargés")
+        if self.cache is not None:
+            print(f"   Cache: {stats['cache_hits']} réponses servies sans requête, "
+                  f"{stats['not_modified']} revalidées (304)" + (" [hors ligne]" if self.cache.offline else ""))
+        if stats['requests']:
+            print(f"   Latence: p50 {stats['p50_ms']:.0f} ms, p90 {stats['p90_ms']:.0f} ms, "
+                  f"p99 {stats['p99_ms']:.0f} ms, max {stats['p100_ms']:.0f} ms")
@@ -2,15 +2,52 @@
 Script de collecte du réseau routier OpenStreetMap
 Source: API Overpass (OpenStreetMap)
 Enregistre: GeoJSON du réseau routier complet avec attributs
+
+La zone est découpée en tuiles (--grid, défaut : tuiles de la taille de Lyon centre)
+téléchargées en parallèle (--workers) ; chaque réponse est lue en flux (ijson si installé)
+et les ways sont écrits au fil de l'eau dans data/raw/osm/osm_network.json (JSON compact,
+une feature par ligne), dédoublonnés par osm_id entre tuiles. Une tuile en échec (timeout,
+réponse Overpass incomplète) est retentée puis découpée en 2 x 2.
+
+Usage:
+    python src/data_collection/fetch_osm_network.py                    # Lyon centre
+    python src/data_collection/fetch_osm_network.py --zone metropole   # Métropole + communes voisines
+    python src/data_collection/fetch_osm_network.py --bbox 45.55,4.65,45.95,5.10
+    python src/data_collection/fetch_osm_network.py --zone metropole --grid 6 --workers 2
+    python src/data_collection/fetch_osm_network.py --pbf rhone-alpes-latest.osm.pbf   # extrait local (osm_pbf)
+
+Pour les grandes zones, traiter le réseau en mode tuilé :
+    python src/preprocessing/create_ml_dataset_v3.py --tile-size-km 5
+
+Les réponses Overpass (par tuile) sont conservées dans le cache HTTP (data_collection.http_cache, 7 jours) ;
+--offline ne lit que le cache.
 """
 
+import sys
 import json
+import math
+import time
+import argparse
+import tempfile
 import requests
-from datetime import datetime
 from pathlib import Path
 
+try:
+    import ijson
+    _JSON_ERRORS = (ValueError, ijson.JSONError)
+except ImportError:  # lecture complète de chaque réponse
+    ijson = None
+    _JSON_ERRORS = (ValueError,)
+
 # Configuration
 BASE_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from data_collection.fetch_engine import FetchEngine
+from data_collection.http_cache import OfflineCacheMiss, ResponseCache
+from data_collection.geojson_stream import dump_feature, request_fingerprint, same_request
+from data_collection.osm_features import HIGHWAY_REGEX, NetworkWriter, way_feature
+from data_collection.osm_pbf import read_pbf_network
 DATA_RAW_DIR = BASE_DIR / "data" / "raw" / "osm"
 DATA_RAW_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -22,154 +59,244 @@ LYON_BBOX = {
     "east": 4.9
 }
 
+# Métropole de Lyon et communes voisines
+METROPOLE_BBOX = {
+    "south": 45.55,
+    "west": 4.65,
+    "north": 45.95,
+    "east": 5.10
+}
+
+ZONES = {
+    "lyon": LYON_BBOX,
+    "metropole": METROPOLE_BBOX
+}
+
 # URL de l'API Overpass
 OVERPASS_URL = "http://overpass-api.de/api/interpreter"
 
+# Requêtes Overpass simultanées (l'instance publique accorde ~2 créneaux par adresse IP)
+DEFAULT_WORKERS = 2
+# Nouvelles tentatives d'une tuile (réponse incomplète, coupure) avant découpage en 2 x 2
+TILE_RETRIES = 1
+MAX_SPLIT_DEPTH = 2
 
-def save_json(data, filename, timestamped=False):
-    """Sauvegarde données JSON"""
-    if timestamped:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filepath = DATA_RAW_DIR / f"{filename}_{timestamp}.json"
-    else:
-        filepath = DATA_RAW_DIR / f"{filename}.json"
-    
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    
-    print(f"✅ Sauvegardé : {filepath.name}")
-    return filepath
 
+def parse_bbox(value):
+    """Bounding box « sud,ouest,nord,est » (degrés WGS84)"""
+    try:
+        south, west, north, east = (float(v) for v in value.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bbox attendue: sud,ouest,nord,est (reçu {value!r})")
+    if south >= north or west >= east:
+        raise argparse.ArgumentTypeError(f"bbox vide: {value!r}")
+    return {"south": south, "west": west, "north": north, "east": east}
 
-def fetch_osm_network():
-    """
-    Récupère le réseau routier de Lyon via Overpass API
-    Retourne: GeoJSON avec LineString complètes et attributs détaillés
-    """
-    print("\n🗺️  Récupération réseau routier OpenStreetMap...")
-    print(f"   Zone: Lyon ({LYON_BBOX['south']}, {LYON_BBOX['west']}) - ({LYON_BBOX['north']}, {LYON_BBOX['east']})")
-    
-    # Requête Overpass avec out geom pour avoir les géométries complètes
-    overpass_query = f"""
-    [out:json][timeout:120];
+
+def overpass_timeout(bbox):
+    """Timeout Overpass (s) proportionnel à la surface (120s pour la bbox de Lyon centre)"""
+    area = (bbox['north'] - bbox['south']) * (bbox['east'] - bbox['west'])
+    lyon_area = (LYON_BBOX['north'] - LYON_BBOX['south']) * (LYON_BBOX['east'] - LYON_BBOX['west'])
+    return int(min(900, max(120, 120 * area / lyon_area)))
+
+
+def split_bbox(bbox, rows, cols):
+    """Découpe une bbox en rows x cols tuiles (ordre: sud → nord, ouest → est)"""
+    lat_step = (bbox['north'] - bbox['south']) / rows
+    lon_step = (bbox['east'] - bbox['west']) / cols
+    return [
+        {
+            "south": round(bbox['south'] + i * lat_step, 6),
+            "west": round(bbox['west'] + j * lon_step, 6),
+            "north": round(bbox['south'] + (i + 1) * lat_step, 6) if i < rows - 1 else bbox['north'],
+            "east": round(bbox['west'] + (j + 1) * lon_step, 6) if j < cols - 1 else bbox['east'],
+        }
+        for i in range(rows) for j in range(cols)
+    ]
+
+
+def auto_grid(bbox):
+    """Grille (lignes, colonnes) dont les tuiles ne dépassent pas la taille de la bbox de Lyon centre"""
+    lat_size = LYON_BBOX['north'] - LYON_BBOX['south']
+    lon_size = LYON_BBOX['east'] - LYON_BBOX['west']
+    rows = math.ceil((bbox['north'] - bbox['south']) / lat_size - 1e-9)
+    cols = math.ceil((bbox['east'] - bbox['west']) / lon_size - 1e-9)
+    return max(1, rows), max(1, cols)
+
+
+def parse_grid(value):
+    """Grille « N » (N x N) ou « LIGNESxCOLONNES »"""
+    try:
+        rows, _, cols = value.lower().partition('x')
+        rows, cols = int(rows), int(cols or rows)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"grille attendue: N ou LIGNESxCOLONNES (reçu {value!r})")
+    if rows < 1 or cols < 1:
+        raise argparse.ArgumentTypeError(f"grille vide: {value!r}")
+    return rows, cols
+
+
+def overpass_query(bbox, timeout):
+    """Requête Overpass des ways routiers d'une bbox (out geom : géométries complètes)"""
+    return f"""
+    [out:json][timeout:{timeout}];
     (
-      way["highway"~"^(motorway|trunk|primary|secondary|tertiary|residential|unclassified|cycleway|path|footway|pedestrian)$"]
-        ({LYON_BBOX['south']},{LYON_BBOX['west']},{LYON_BBOX['north']},{LYON_BBOX['east']});
+      way["highway"~"{HIGHWAY_REGEX}"]
+        ({bbox['south']},{bbox['west']},{bbox['north']},{bbox['east']});
     );
     out geom;
     """
-    
-    try:
-        print("   ⏳ Envoi requête Overpass (peut prendre 1-2 min)...")
-        
-        response = requests.post(
-            OVERPASS_URL, 
-            data={'data': overpass_query}, 
-            timeout=150
-        )
-        response.raise_for_status()
-        osm_data = response.json()
-        
-        print("   ✓ Données OSM reçues, conversion en GeoJSON...")
-        
-        # Convertir en GeoJSON
-        features = []
-        ways_count = 0
-        highway_types = {}
-        
-        for element in osm_data.get('elements', []):
-            if element.get('type') == 'way' and 'geometry' in element:
-                ways_count += 1
-                
-                # Extraire les coordonnées
-                coordinates = [[node['lon'], node['lat']] for node in element['geometry']]
-                
-                # Extraire les tags/propriétés
-                tags = element.get('tags', {})
-                highway_type = tags.get('highway', 'unknown')
-                highway_types[highway_type] = highway_types.get(highway_type, 0) + 1
-                
-                properties = {
-                    'osm_id': element.get('id'),
-                    'highway': highway_type,
-                    'name': tags.get('name', 'Sans nom'),
-                    'maxspeed': tags.get('maxspeed'),
-                    'lanes': tags.get('lanes'),
-                    'oneway': tags.get('oneway', 'no'),
-                    'surface': tags.get('surface'),
-                    'lit': tags.get('lit'),
-                    'cycleway': tags.get('cycleway'),
-                    'foot': tags.get('foot'),
-                    'bicycle': tags.get('bicycle'),
-                    'width': tags.get('width'),
-                    'access': tags.get('access'),
-                    'service': tags.get('service'),
-                }
-                
-                # Créer la feature GeoJSON
-                feature = {
-                    'type': 'Feature',
-                    'geometry': {
-                        'type': 'LineString',
-                        'coordinates': coordinates
-                    },
-                    'properties': {k: v for k, v in properties.items() if v is not None}
-                }
-                
-                features.append(feature)
-        
-        # Créer le GeoJSON complet
-        geojson = {
-            'type': 'FeatureCollection',
-            'features': features
-        }
-        
-        # Métadonnées
-        metadata = {
-            "source": "OpenStreetMap via Overpass API",
-            "api_url": OVERPASS_URL,
-            "bbox": LYON_BBOX,
-            "timestamp": datetime.now().isoformat(),
-            "ways_count": ways_count,
-            "features_count": len(features),
-            "highway_types": highway_types,
-            "crs": "EPSG:4326 (WGS84)",
-            "licence": "ODbL (Open Database License)",
-            "description": "Réseau routier complet avec géométries LineString et attributs détaillés",
-            "apport": "Géométrie du réseau, vitesse max, nb voies, sens unique, type de voie",
-            "usage": "GeoPandas: gdf = gpd.GeoDataFrame.from_features(data['geojson']['features'])"
-        }
-        
-        result = {
-            "metadata": metadata,
-            "geojson": geojson
-        }
-        
-        # Afficher statistiques
-        print(f"   ✓ {ways_count} segments routiers récupérés")
-        print(f"   → Types de voies:")
-        for highway_type, count in sorted(highway_types.items(), key=lambda x: x[1], reverse=True)[:10]:
-            print(f"      • {highway_type}: {count}")
-        
-        return result
-        
-    except requests.exceptions.Timeout:
-        print("❌ Timeout - L'API Overpass met trop de temps à répondre")
-        print("   💡 Essayez de réduire la zone ou réessayez plus tard")
-        return None
-    except Exception as e:
-        print(f"❌ Erreur récupération OSM: {e}")
-        return None
 
 
-def export_by_highway_type(result):
+class OverpassRuntimeError(requests.RequestException):
+    """Réponse Overpass tronquée (remark « runtime error » : timeout ou mémoire du serveur)"""
+
+
+def _iter_elements(reader):
+    """Éléments de la réponse Overpass, en flux si ijson est installé"""
+    if ijson is not None:
+        yield from ijson.items(reader, 'elements.item', use_float=True)
+    else:
+        yield from json.load(reader).get('elements', [])
+
+
+def fetch_tile(bbox, engine, out_path):
+    """
+    Télécharge les ways d'une tuile et les écrit dans out_path, une ligne par way :
+    osm_id <tab> highway <tab> feature JSON
+
+    Returns:
+        nombre de ways écrits
+    """
+    timeout = overpass_timeout(bbox)
+    count = 0
+    with engine.stream('POST', OVERPASS_URL, source='osm',
+                       data={'data': overpass_query(bbox, timeout)}, timeout=timeout + 30) as reader, \
+            open(out_path, 'w', encoding='utf-8') as out:
+        for element in _iter_elements(reader):
+            if element.get('type') != 'way' or 'geometry' not in element:
+                continue
+            coordinates = [[node['lon'], node['lat']] for node in element['geometry']]
+            feature = way_feature(element.get('id'), coordinates, element.get('tags', {}))
+            out.write(f"{element.get('id')}\t{feature['properties']['highway']}\t{dump_feature(feature)}\n")
+            count += 1
+
+        # Overpass signale un dépassement de timeout/mémoire par un « remark » après les
+        # éléments, avec un statut 200 : réponse incomplète, à ne pas garder en cache
+        reader.drain()
+        if b'"remark"' in reader.tail and b'runtime error' in reader.tail:
+            raise OverpassRuntimeError(f"réponse Overpass incomplète ({count} ways reçus)")
+    return count
+
+
+def fetch_tile_split(bbox, engine, tmp_dir, name, depth=0):
+    """
+    Télécharge une tuile avec nouvelles tentatives ; en cas d'échec, la tuile est découpée
+    en 2 x 2 sous-tuiles (jusqu'à MAX_SPLIT_DEPTH niveaux)
+
+    Returns:
+        liste des fichiers de ways de la tuile (dans l'ordre des sous-tuiles)
+    """
+    out_path = tmp_dir / f"tile_{name}.tsv"
+    for attempt in range(TILE_RETRIES + 1):
+        try:
+            fetch_tile(bbox, engine, out_path)
+            return [out_path]
+        except OfflineCacheMiss:
+            break
+        except (requests.RequestException, *_JSON_ERRORS) as e:
+            # Erreur JSON : réponse tronquée (connexion coupée en cours de lecture)
+            print(f"   ⚠️  Tuile {name}: {e} (tentative {attempt + 1}/{TILE_RETRIES + 1})")
+            time.sleep(engine.backoff_s(attempt))
+
+    if depth >= MAX_SPLIT_DEPTH or (engine.cache is not None and engine.cache.offline):
+        raise requests.RequestException(f"échec de la tuile {name}")
+
+    print(f"   ✂️  Tuile {name} découpée en 2 x 2")
+    paths = []
+    for i, sub_bbox in enumerate(split_bbox(bbox, 2, 2)):
+        paths += fetch_tile_split(sub_bbox, engine, tmp_dir, f"{name}.{i}", depth + 1)
+    return paths
+
+
+def fetch_osm_network(bbox=LYON_BBOX, engine=None, output_path=None, grid=None, keep_unchanged=True):
+    """
+    Récupère le réseau routier d'une zone via Overpass API, par tuiles téléchargées en parallèle
+    (engine.max_workers) ; les ways présents dans plusieurs tuiles sont dédoublonnés par osm_id
+
+    Args:
+        grid: (lignes, colonnes) ; défaut auto_grid(bbox)
+        keep_unchanged: fichier existant conservé si toutes les tuiles viennent du cache et
+            qu'il a été produit par la même requête (source, bbox, grille)
+
+    Returns:
+        (fichier, métadonnées) ; métadonnées None si le fichier existant est conservé,
+        (None, None) en cas d'échec
+    """
+    print("\n🗺️  Récupération réseau routier OpenStreetMap...")
+    print(f"   Zone: ({bbox['south']}, {bbox['west']}) - ({bbox['north']}, {bbox['east']})")
+
+    engine = engine or FetchEngine(max_workers=DEFAULT_WORKERS, rate_per_host=1, max_retries=2)
+    output_path = output_path or DATA_RAW_DIR / "osm_network.json"
+    rows, cols = grid or auto_grid(bbox)
+    tiles = split_bbox(bbox, rows, cols)
+    fingerprint = request_fingerprint({"source": "overpass", "api_url": OVERPASS_URL,
+                                       "bbox": bbox, "grid": [rows, cols]})
+    print(f"   ⏳ {len(tiles)} tuile(s) ({rows} x {cols}), {engine.max_workers} requête(s) simultanée(s)...")
+
+    with tempfile.TemporaryDirectory(prefix="osm_tiles_", dir=output_path.parent) as tmp:
+        tmp_dir = Path(tmp)
+        results = dict(engine.map(
+            lambda index: fetch_tile_split(tiles[index], engine, tmp_dir, str(index)),
+            range(len(tiles))
+        ))
+
+        failed = [index for index, result in results.items() if isinstance(result, Exception)]
+        if failed:
+            for index in failed:
+                print(f"❌ Erreur tuile {index}: {results[index]}")
+            return None, None
+
+        if (keep_unchanged and engine.stats()['downloaded_bytes'] == 0
+                and same_request(output_path, fingerprint)):
+            print(f"   ✓ Réseau inchangé (cache), {output_path.name} conservé")
+            return output_path, None
+
+        print("   ✓ Données OSM reçues, écriture du GeoJSON...")
+        with NetworkWriter(output_path) as writer:
+            for index in range(len(tiles)):
+                for tile_path in results[index]:
+                    with open(tile_path, encoding='utf-8') as f:
+                        for line in f:
+                            osm_id, highway, feature_json = line.rstrip('\n').split('\t', 2)
+                            writer.add(int(osm_id), highway, feature_json)
+            writer.metadata.update({
+                "source": "OpenStreetMap via Overpass API",
+                "api_url": OVERPASS_URL,
+                "bbox": bbox,
+                "grid": [rows, cols],
+                "request_fingerprint": fingerprint,
+            })
+
+    metadata = writer.metadata
+    print(f"   ✓ {metadata['ways_count']} segments routiers récupérés "
+          f"({writer.duplicates} doublons entre tuiles écartés)")
+    print(f"   → Types de voies:")
+    for highway_type, count in list(metadata['highway_types'].items())[:10]:
+        print(f"      • {highway_type}: {count}")
+
+    return output_path, metadata
+
+
+def export_by_highway_type(filepath):
     """
     Exporte des fichiers séparés par type de voie (optionnel)
     """
     print("\n📦 Export par type de voie...")
     
     try:
-        geojson_data = result['geojson']
+        with open(filepath, encoding='utf-8') as f:
+            geojson_data = json.load(f)['geojson']
         features_by_type = {}
         
         # Grouper par type de voie
@@ -201,32 +328,81 @@ def export_by_highway_type(result):
         print(f"   ⚠️  Erreur export par type: {e}")
 
 
-def main():
+def load_pbf_network(pbf_path, bbox=LYON_BBOX):
+    """
+    Réseau routier d'une zone à partir d'un extrait .osm.pbf local (voir osm_pbf)
+
+    Returns:
+        (fichier, métadonnées), (None, None) en cas d'échec
+    """
+    print("\n🗺️  Lecture de l'extrait OpenStreetMap local...")
+    print(f"   Fichier: {pbf_path}")
+    print(f"   Zone: ({bbox['south']}, {bbox['west']}) - ({bbox['north']}, {bbox['east']})")
+
+    output_path = DATA_RAW_DIR / "osm_network.json"
+    try:
+        metadata, skipped = read_pbf_network(pbf_path, output_path, bbox)
+    except (ImportError, OSError, RuntimeError) as e:
+        print(f"❌ Erreur lecture PBF: {e}")
+        return None, None
+
+    print(f"   ✓ {metadata['ways_count']} segments routiers extraits"
+          + (f" ({skipped} sans géométrie, nœuds hors de l'extrait)" if skipped else ""))
+    print(f"   → Types de voies:")
+    for highway_type, count in list(metadata['highway_types'].items())[:10]:
+        print(f"      • {highway_type}: {count}")
+
+    return output_path, metadata
+
+
+def main(bbox=LYON_BBOX, offline=False, grid=None, workers=DEFAULT_WORKERS, pbf=None):
     """
     Point d'entrée principal
+
+    Args:
+        bbox: zone à collecter
+        offline: ne lire que le cache HTTP (aucune requête réseau)
+        grid: découpage (lignes, colonnes) de la zone ; défaut auto_grid(bbox)
+        workers: requêtes Overpass simultanées
+        pbf: extrait .osm.pbf local à lire au lieu de l'API Overpass
     """
     print("="*60)
     print("🗺️  COLLECTE RÉSEAU ROUTIER OPENSTREETMAP")
     print("="*60)
     
-    # Récupérer les données
-    result = fetch_osm_network()
+    if pbf is not None:
+        filepath, metadata = load_pbf_network(Path(pbf), bbox)
+        if filepath is None:
+            print("❌ Échec de la collecte")
+            return None
+        print(f"✅ Sauvegardé : {filepath.name}")
+        print(f"Total segments: {metadata['ways_count']}")
+        return filepath
+    
+    # Récupérer les données (Overpass : peu de nouvelles tentatives, requêtes longues)
+    engine = FetchEngine(max_workers=workers, rate_per_host=1, max_retries=2,
+                         cache=ResponseCache(offline=offline))
+    filepath, metadata = fetch_osm_network(bbox, engine, grid=grid)
+    engine.print_summary()
     
-    if not result:
+    if filepath is None:
         print("❌ Échec de la collecte")
         return None
     
-    # Sauvegarder le fichier complet
-    filepath = save_json(result, "osm_network", timestamped=False)
+    # Réponses inchangées (cache) : fichier existant conservé
+    if metadata is None:
+        return filepath
+    
+    print(f"✅ Sauvegardé : {filepath.name}")
     
     # Exporter par type (optionnel, utile pour analyses spécifiques)
-    # export_by_highway_type(result)
+    # export_by_highway_type(filepath)
     
     # Résumé
     print("\n" + "="*60)
     print("✅ COLLECTE TERMINÉE")
     print("="*60)
-    print(f"Total segments: {result['metadata']['ways_count']}")
+    print(f"Total segments: {metadata['ways_count']}")
     print(f"Format: GeoJSON avec LineString")
     print(f"\n📁 Fichier créé dans: {DATA_RAW_DIR}")
     
@@ -234,4 +410,21 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Collecte du réseau routier OpenStreetMap")
+    parser.add_argument('--zone', choices=sorted(ZONES), default='lyon',
+                        help="Zone prédéfinie (défaut: lyon)")
+    parser.add_argument('--bbox', type=parse_bbox,
+                        help="Zone personnalisée: sud,ouest,nord,est (prioritaire sur --zone)")
+    parser.add_argument('--grid', type=parse_grid,
+                        help="Découpage en tuiles: N (N x N) ou LIGNESxCOLONNES "
+                             "(défaut: tuiles de la taille de Lyon centre)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"Requêtes Overpass simultanées (défaut: {DEFAULT_WORKERS})")
+    parser.add_argument('--offline', action='store_true',
+                        help="Ne lire que le cache HTTP (aucune requête réseau)")
+    parser.add_argument('--pbf', type=Path,
+                        help="Extrait OSM local (.osm.pbf) à lire au lieu de l'API Overpass (pyosmium requis)")
+    args = parser.parse_args()
+
+    main(args.bbox or ZONES[args.zone], offline=args.offline, grid=args.grid, workers=args.workers,
+         pbf=args.pbf)
@@ -1,16 +1,33 @@
 """
 Script de collecte des données météorologiques
 Source: Open-Meteo Archive API (gratuit, pas de clé nécessaire)
-Enregistre: Données météo horaires avec timestamp
+Enregistre: archive météo horaire, une partition Parquet par jour
+(data/raw/weather/archive/weather_YYYY-MM-DD.parquet, voir weather_store)
+
+Seuls les jours absents de l'archive (ou incomplets : jours récents pas encore publiés)
+sont demandés à l'API, par plages contiguës d'au plus --chunk-days jours téléchargées en
+parallèle. L'historique s'accumule d'une collecte à l'autre.
+
+Usage:
+    python src/data_collection/fetch_weather.py [--offline]              # 7 derniers jours
+    python src/data_collection/fetch_weather.py --days 30
+    python src/data_collection/fetch_weather.py --start 2025-01-01 --end 2025-12-31
 """
 
-import json
-import requests
-from datetime import datetime, timedelta
+import sys
+import argparse
+from datetime import date, datetime, timedelta
 from pathlib import Path
 
 # Configuration
 BASE_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from data_collection.fetch_engine import FetchEngine
+from data_collection.http_cache import ResponseCache
+from data_collection.weather_store import (
+    HOURLY_VARIABLES, STORE_DIRNAME, TIMEZONE, append_frame, day_ranges, hourly_frame, missing_days, read_range
+)
 DATA_RAW_DIR = BASE_DIR / "data" / "raw" / "weather"
 DATA_RAW_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -21,217 +38,150 @@ LYON_LON = 4.8357
 # API Open-Meteo
 OPEN_METEO_ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
 
+# Période par défaut, taille des plages demandées et requêtes simultanées
+DEFAULT_DAYS = 7
+DEFAULT_CHUNK_DAYS = 92
+DEFAULT_WORKERS = 4
+
+
+def range_url(start, end):
+    """URL Open-Meteo des mesures horaires du jour start au jour end inclus"""
+    return (
+        f"{OPEN_METEO_ARCHIVE_URL}?"
+        f"latitude={LYON_LAT}&longitude={LYON_LON}"
+        f"&start_date={start}"
+        f"&end_date={end}"
+        f"&hourly={','.join(HOURLY_VARIABLES)}"
+        f"&timezone={TIMEZONE}"
+    )
 
-def save_json(data, filename, timestamped=True):
-    """Sauvegarde données JSON"""
-    if timestamped:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filepath = DATA_RAW_DIR / f"{filename}_{timestamp}.json"
-    else:
-        filepath = DATA_RAW_DIR / f"{filename}.json"
-    
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    
-    print(f"✅ Sauvegardé : {filepath.name}")
-    return filepath
 
+def fetch_range(engine, start, end):
+    """Mesures horaires d'une plage de jours (DataFrame de l'archive, voir weather_store)"""
+    response = engine.get(range_url(start, end), source='weather', timeout=30)
+    hourly = response.json().get("hourly", {})
+    if not hourly.get("time"):
+        raise ValueError("Aucune donnée reçue de l'API")
+    return hourly_frame(hourly)
 
-def fetch_weather_data(days=7):
+
+def fetch_weather_data(start, end, engine=None, store_dir=None, chunk_days=DEFAULT_CHUNK_DAYS):
     """
-    Récupère les données météo historiques pour Lyon
-    
+    Complète l'archive météo de Lyon du jour start au jour end inclus
+
     Args:
-        days: Nombre de jours en arrière (défaut: 7)
-    
+        engine: FetchEngine (cache HTTP éventuel, requêtes simultanées)
+        store_dir: dossier de l'archive (défaut: data/raw/weather/archive)
+        chunk_days: nombre maximal de jours par requête
+
     Returns:
-        dict avec métadonnées et données météo horaires
+        dict: jours demandés, plages, partitions écrites / inchangées, plages en échec
     """
-    print(f"\n🌤️  Récupération données météo Open-Meteo ({days} derniers jours)...")
+    store_dir = store_dir or DATA_RAW_DIR / STORE_DIRNAME
+    engine = engine or FetchEngine(max_workers=DEFAULT_WORKERS)
+    print(f"\n🌤️  Récupération données météo Open-Meteo ({start} → {end})...")
     print(f"   Localisation: Lyon ({LYON_LAT}, {LYON_LON})")
-    
-    # Période
-    end_date = datetime.now().date()
-    start_date = (datetime.now() - timedelta(days=days)).date()
-    
-    try:
-        # Construire l'URL avec tous les paramètres météo
-        url = (
-            f"{OPEN_METEO_ARCHIVE_URL}?"
-            f"latitude={LYON_LAT}&longitude={LYON_LON}"
-            f"&start_date={start_date}"
-            f"&end_date={end_date}"
-            f"&hourly=temperature_2m,precipitation,rain,snowfall,snow_depth,"
-            f"wind_speed_10m,wind_direction_10m,wind_gusts_10m,"
-            f"cloud_cover,relative_humidity_2m,surface_pressure,"
-            f"weather_code,visibility,is_day"
-            f"&timezone=Europe/Paris"
-        )
-        
-        print("   ⏳ Récupération en cours...")
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Parser les données horaires
-        hourly = data.get("hourly", {})
-        timestamps = hourly.get("time", [])
-        
-        if not timestamps:
-            raise ValueError("Aucune donnée reçue de l'API")
-        
-        print(f"   ✓ {len(timestamps)} mesures horaires reçues")
-        
-        # Construire le dataset structuré
-        weather_data = []
-        for i, timestamp_str in enumerate(timestamps):
-            dt = datetime.fromisoformat(timestamp_str)
-            
-            # Extraire toutes les variables
-            temp = hourly.get("temperature_2m", [])[i]
-            precip = hourly.get("precipitation", [])[i]
-            rain = hourly.get("rain", [])[i]
-            snowfall = hourly.get("snowfall", [])[i]
-            snow_depth = hourly.get("snow_depth", [])[i]
-            wind_speed = hourly.get("wind_speed_10m", [])[i]
-            wind_dir = hourly.get("wind_direction_10m", [])[i]
-            wind_gusts = hourly.get("wind_gusts_10m", [])[i]
-            cloud = hourly.get("cloud_cover", [])[i]
-            humidity = hourly.get("relative_humidity_2m", [])[i]
-            pressure = hourly.get("surface_pressure", [])[i]
-            weather_code = hourly.get("weather_code", [])[i]
-            visibility = hourly.get("visibility", [])[i]
-            is_day = hourly.get("is_day", [])[i]
-            
-            # Calculer des indicateurs dérivés
-            is_raining = (rain or 0) > 0.1
-            is_snowing = (snowfall or 0) > 0.1
-            is_adverse_weather = (rain or 0) > 0.5 or (wind_speed or 0) > 30
-            
-            weather_data.append({
-                "timestamp": dt.isoformat(),
-                "date": dt.date().isoformat(),
-                "hour": dt.hour,
-                "day_of_week": dt.weekday(),
-                "is_weekend": dt.weekday() >= 5,
-                "temperature_c": temp,
-                "precipitation_mm": precip,
-                "rain_mm": rain,
-                "snowfall_mm": snowfall,
-                "snow_depth_cm": snow_depth,
-                "wind_speed_kmh": wind_speed,
-                "wind_direction_deg": wind_dir,
-                "wind_gusts_kmh": wind_gusts,
-                "cloud_cover_pct": cloud,
-                "humidity_pct": humidity,
-                "pressure_hpa": pressure,
-                "weather_code": weather_code,
-                "visibility_m": visibility,
-                "is_day": is_day,
-                "is_raining": is_raining,
-                "is_snowing": is_snowing,
-                "is_adverse_weather": is_adverse_weather
-            })
-        
-        # Calculer les statistiques
-        temps = [d["temperature_c"] for d in weather_data if d["temperature_c"] is not None]
-        rains = [d["rain_mm"] for d in weather_data if d["rain_mm"] is not None]
-        
-        avg_temp = sum(temps) / len(temps) if temps else 0
-        total_rain = sum(rains)
-        rainy_hours = sum(1 for d in weather_data if d["is_raining"])
-        adverse_hours = sum(1 for d in weather_data if d["is_adverse_weather"])
-        
-        # Métadonnées
-        metadata = {
-            "source": "Open-Meteo Archive API",
-            "api_url": OPEN_METEO_ARCHIVE_URL,
-            "location": {
-                "city": "Lyon, France",
-                "latitude": LYON_LAT,
-                "longitude": LYON_LON
-            },
-            "timestamp": datetime.now().isoformat(),
-            "records_count": len(weather_data),
-            "period": {
-                "start": start_date.isoformat(),
-                "end": end_date.isoformat(),
-                "days": days
-            },
-            "granularity": "hourly",
-            "timezone": "Europe/Paris",
-            "variables": [
-                "température 2m",
-                "précipitations totales",
-                "pluie",
-                "neige",
-                "vitesse du vent 10m",
-                "direction du vent",
-                "rafales",
-                "couverture nuageuse",
-                "humidité relative",
-                "pression de surface",
-                "code météo WMO",
-                "visibilité"
-            ],
-            "licence": "CC BY 4.0",
-            "description": "Données météo historiques horaires pour modélisation trafic cycliste",
-            "apport": "Impact météo sur mobilité : pluie -40-70%, vent fort -20-30%",
-            "summary": {
-                "avg_temperature_c": round(avg_temp, 1),
-                "total_rain_mm": round(total_rain, 1),
-                "rainy_hours": rainy_hours,
-                "rainy_hours_pct": round(rainy_hours / len(weather_data) * 100, 1) if weather_data else 0,
-                "adverse_weather_hours": adverse_hours,
-                "adverse_weather_hours_pct": round(adverse_hours / len(weather_data) * 100, 1) if weather_data else 0
-            }
-        }
-        
-        result = {
-            "metadata": metadata,
-            "weather_data": weather_data
-        }
-        
-        # Afficher statistiques
-        print(f"   → Température moyenne: {metadata['summary']['avg_temperature_c']}°C")
-        print(f"   → Pluie totale: {metadata['summary']['total_rain_mm']} mm")
-        print(f"   → Heures pluvieuses: {rainy_hours} ({metadata['summary']['rainy_hours_pct']}%)")
-        print(f"   → Heures météo défavorable: {adverse_hours} ({metadata['summary']['adverse_weather_hours_pct']}%)")
-        
-        return result
-        
-    except Exception as e:
-        print(f"❌ Erreur récupération météo: {e}")
-        return None
 
-def main():
+    days = missing_days(store_dir, start, end)
+    stats = {'missing_days': len(days), 'ranges': 0, 'written': 0, 'unchanged': 0, 'failed': []}
+    if not days:
+        print("   ✓ Période déjà complète dans l'archive")
+        return stats
+
+    ranges = day_ranges(days, chunk_days)
+    stats['ranges'] = len(ranges)
+    print(f"   ⏳ {len(days)} jour(s) à compléter en {len(ranges)} requête(s)...")
+
+    for (range_start, range_end), result in sorted(engine.map(lambda r: fetch_range(engine, *r), ranges)):
+        if isinstance(result, Exception):
+            print(f"   ⚠️  {range_start} → {range_end}: {result}")
+            stats['failed'].append((range_start.isoformat(), range_end.isoformat()))
+            continue
+        written, unchanged = append_frame(store_dir, result)
+        stats['written'] += len(written)
+        stats['unchanged'] += unchanged
+
+    print(f"   ✓ {stats['written']} partition(s) écrite(s), {stats['unchanged']} inchangée(s)")
+    return stats
+
+
+def summarize(weather_df):
+    """Statistiques d'une période (colonnes de l'archive)"""
+    n = len(weather_df)
+    rainy_hours = int(weather_df['is_raining'].sum()) if n else 0
+    adverse_hours = int(weather_df['is_adverse_weather'].sum()) if n else 0
+    return {
+        "records_count": n,
+        "avg_temperature_c": round(float(weather_df['temperature_c'].mean()), 1) if n else 0,
+        "total_rain_mm": round(float(weather_df['rain_mm'].sum()), 1) if n else 0,
+        "rainy_hours": rainy_hours,
+        "rainy_hours_pct": round(rainy_hours / n * 100, 1) if n else 0,
+        "adverse_weather_hours": adverse_hours,
+        "adverse_weather_hours_pct": round(adverse_hours / n * 100, 1) if n else 0,
+    }
+
+
+def main(offline=False, days=DEFAULT_DAYS, start=None, end=None, chunk_days=DEFAULT_CHUNK_DAYS,
+         workers=DEFAULT_WORKERS):
     """
     Point d'entrée principal
+
+    Args:
+        offline: ne lire que le cache HTTP (aucune requête réseau)
+        days: période jusqu'à aujourd'hui (si start n'est pas fourni)
+        start, end: période explicite (dates, end par défaut aujourd'hui)
+        chunk_days: nombre maximal de jours par requête
+        workers: requêtes simultanées
     """
     print("="*60)
     print("🌤️  COLLECTE DONNÉES MÉTÉOROLOGIQUES")
     print("="*60)
     
-    # Récupérer les données (7 derniers jours par défaut)
-    result = fetch_weather_data(days=7)
+    end = end or datetime.now().date()
+    start = start or end - timedelta(days=days)
+    store_dir = DATA_RAW_DIR / STORE_DIRNAME
+    
+    engine = FetchEngine(max_workers=workers, cache=ResponseCache(offline=offline))
+    stats = fetch_weather_data(start, end, engine, store_dir, chunk_days)
+    engine.print_summary()
     
-    if not result:
+    if stats['ranges'] and len(stats['failed']) == stats['ranges']:
         print("❌ Échec de la collecte")
         return None
     
-    # Sauvegarder avec timestamp
-    filepath = save_json(result, "weather_data", timestamped=False)
+    # Statistiques de la période, lues dans l'archive
+    summary = summarize(read_range(store_dir, start, end))
+    print(f"   → Température moyenne: {summary['avg_temperature_c']}°C")
+    print(f"   → Pluie totale: {summary['total_rain_mm']} mm")
+    print(f"   → Heures pluvieuses: {summary['rainy_hours']} ({summary['rainy_hours_pct']}%)")
+    print(f"   → Heures météo défavorable: {summary['adverse_weather_hours']} ({summary['adverse_weather_hours_pct']}%)")
     
     # Résumé
     print("\n" + "="*60)
     print("✅ COLLECTE TERMINÉE")
     print("="*60)
-    print(f"Total mesures: {result['metadata']['records_count']}")
-    print(f"Période: {result['metadata']['period']['days']} jours")
-    print(f"\n📁 Fichiers créés dans: {DATA_RAW_DIR}")
+    print(f"Total mesures: {summary['records_count']}")
+    print(f"Période: {start} → {end}")
+    print(f"\n📁 Archive: {store_dir}")
     
-    return filepath
+    return store_dir
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Collecte des données météo Open-Meteo")
+    parser.add_argument('--offline', action='store_true',
+                        help="Ne lire que le cache HTTP (aucune requête réseau)")
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS,
+                        help=f"Période jusqu'à aujourd'hui, en jours (défaut: {DEFAULT_DAYS})")
+    parser.add_argument('--start', type=date.fromisoformat,
+                        help="Début de période YYYY-MM-DD (prioritaire sur --days)")
+    parser.add_argument('--end', type=date.fromisoformat,
+                        help="Fin de période YYYY-MM-DD (défaut: aujourd'hui)")
+    parser.add_argument('--chunk-days', type=int, default=DEFAULT_CHUNK_DAYS,
+                        help=f"Jours par requête (défaut: {DEFAULT_CHUNK_DAYS})")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"Requêtes simultanées (défaut: {DEFAULT_WORKERS})")
+    args = parser.parse_args()
+
+    main(offline=args.offline, days=args.days, start=args.start, end=args.end,
+         chunk_days=args.chunk_days, workers=args.workers)
@@ -0,0 +1,110 @@
+"""
+Écriture en flux de fichiers GeoJSON (FeatureCollection)
+Les features sont écrites au fil de l'eau en JSON compact, une par ligne, dans un fichier
+temporaire renommé à la fermeture ; les métadonnées sont écrites en fin de fichier (leur
+contenu – comptages, types… – n'est connu qu'après la dernière feature).
+
+Formats :
+- wrapped=True : {"geojson": {"type": "FeatureCollection", "features": [...]}, "metadata": {...}}
+  (fichiers bruts de data/raw, lus par data['geojson']['features'])
+- wrapped=False : {"type": "FeatureCollection", "features": [...], "metadata": {...}}
+
+Utilisation:
+    with FeatureCollectionWriter(path) as writer:
+        writer.write(dump_feature(feature))
+        writer.metadata.update(source=...)
+
+Les collecteurs enregistrent dans les métadonnées l'empreinte de la requête qui a produit le
+fichier (request_fingerprint) : un fichier existant n'est conservé tel quel que s'il provient
+de la même requête (same_request).
+"""
+
+import json
+import hashlib
+
+# Fin de fichier lue pour retrouver les métadonnées
+METADATA_TAIL_BYTES = 1 << 16
+_METADATA_SEPARATOR = b'\n"metadata":'
+
+
+def dump_feature(feature):
+    """Feature en JSON compact (une ligne)"""
+    return json.dumps(feature, ensure_ascii=False, separators=(',', ':'))
+
+
+def request_fingerprint(request):
+    """Empreinte (sha256) d'une requête de collecte (dict : source, zone, découpage…)"""
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def read_metadata(path):
+    """
+    Métadonnées d'un fichier écrit par FeatureCollectionWriter, lues en fin de fichier
+    (sans charger les features) ; None si absent ou dans un autre format
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, 2)
+            f.seek(max(0, f.tell() - METADATA_TAIL_BYTES))
+            tail = f.read()
+        # Features sur une ligne chacune : seul le séparateur commence une ligne par "metadata"
+        start = tail.rfind(_METADATA_SEPARATOR)
+        if start < 0:
+            return None
+        metadata = json.loads(tail[start + len(_METADATA_SEPARATOR):].rstrip()[:-1])
+    except (OSError, ValueError):
+        return None
+    return metadata if isinstance(metadata, dict) else None
+
+
+def same_request(path, fingerprint):
+    """Le fichier existe et a été produit par la requête d'empreinte fingerprint"""
+    metadata = read_metadata(path)
+    return metadata is not None and metadata.get('request_fingerprint') == fingerprint
+
+
+class FeatureCollectionWriter:
+    """
+    Écriture en flux d'une FeatureCollection (voir le module)
+
+    Args:
+        path: fichier à écrire
+        wrapped: collection sous une clé "geojson", métadonnées à côté
+    """
+
+    def __init__(self, path, wrapped=True):
+        self.path = path
+        self.tmp_path = path.with_suffix('.tmp')
+        self.wrapped = wrapped
+        self.count = 0
+        self.metadata = {}
+        self._file = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.tmp_path, 'w', encoding='utf-8')
+        self._file.write(('{"geojson":' if self.wrapped else '') + '{"type":"FeatureCollection","features":[')
+        return self
+
+    def write(self, feature_json):
+        """Ajoute une feature (JSON compact)"""
+        self._file.write(('\n' if not self.count else ',\n') + feature_json)
+        self.count += 1
+
+    def final_metadata(self):
+        """Métadonnées écrites en fin de fichier (complétées par les sous-classes)"""
+        return self.metadata
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._file.close()
+            self.tmp_path.unlink(missing_ok=True)
+            return False
+
+        self.metadata = self.final_metadata()
+        self._file.write('\n]},\n"metadata":' if self.wrapped else '\n],\n"metadata":')
+        self._file.write(json.dumps(self.metadata, ensure_ascii=False, indent=2))
+        self._file.write('}\n')
+        self._file.close()
+        self.tmp_path.replace(self.path)
+        return False
@@ -0,0 +1,191 @@
+"""
+Cache disque des réponses HTTP de la collecte
+Chaque réponse est stockée sous une clé SHA-256 de (méthode, URL, corps de la requête) :
+<clé>.body (contenu brut) et <clé>.json (URL, statut, ETag, Last-Modified, date de stockage).
+
+Une source (osm, bike_infrastructure, weather…) a une durée de validité (SOURCE_TTL_S) :
+- réponse en cache plus récente que le TTL : servie sans requête
+- plus ancienne : requête conditionnelle (If-None-Match / If-Modified-Since) ; un 304
+  prolonge la réponse en cache sans retransférer le contenu
+- mode hors ligne : seules les réponses en cache sont servies, quel que soit leur âge
+
+Utilisé par FetchEngine (data_collection.fetch_engine) :
+    engine = FetchEngine(cache=ResponseCache())
+    response = engine.get(url, source='bike_infrastructure')
+"""
+
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from urllib.parse import urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+BASE_DIR = Path(__file__).parent.parent.parent
+DEFAULT_CACHE_DIR = BASE_DIR / "data" / "raw" / "http_cache"
+
+HOUR_S = 3600
+DAY_S = 24 * HOUR_S
+
+# Durée de validité (s) des réponses par source
+SOURCE_TTL_S = {
+    'osm': 7 * DAY_S,                   # réseau routier : change rarement
+    'bike_infrastructure': 7 * DAY_S,   # couche Grand Lyon : idem
+    'bike_sensors': DAY_S,              # liste des capteurs Eco-Visio
+    'weather': HOUR_S,                  # archive Open-Meteo : dernières heures complétées au fil de l'eau
+}
+DEFAULT_TTL_S = 0  # source inconnue : toujours revalider
+
+# En-têtes conservés avec la réponse
+_KEPT_HEADERS = ['Content-Type', 'Content-Encoding', 'ETag', 'Last-Modified']
+
+
+class OfflineCacheMiss(requests.RequestException):
+    """Mode hors ligne et réponse absente du cache"""
+
+
+def request_key(method, url, data=None, params=None):
+    """Clé de cache : SHA-256 de la méthode, de l'URL (avec params) et du corps"""
+    if params:
+        url = f"{url}{'&' if '?' in url else '?'}{urlencode(params, doseq=True)}"
+    if isinstance(data, dict):
+        body = urlencode(sorted(data.items()), doseq=True)
+    else:
+        body = data.decode() if isinstance(data, bytes) else (data or '')
+    return hashlib.sha256(f"{method.upper()}\n{url}\n{body}".encode()).hexdigest()
+
+
+def cached_response(entry, body, url):
+    """requests.Response reconstruite à partir d'une entrée du cache"""
+    response = requests.Response()
+    response.status_code = entry['status']
+    response.headers = CaseInsensitiveDict(entry.get('headers', {}))
+    response.url = url
+    response._content = body
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.from_cache = True
+    return response
+
+
+class ResponseCache:
+    """
+    Réponses HTTP sur disque
+
+    Args:
+        cache_dir: dossier du cache
+        offline: ne servir que des réponses en cache (aucune requête réseau)
+        ttl_s: durées de validité par source (défaut: SOURCE_TTL_S)
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, offline=False, ttl_s=None):
+        self.cache_dir = Path(cache_dir)
+        self.offline = offline
+        self.ttl_s = dict(SOURCE_TTL_S if ttl_s is None else ttl_s)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def ttl(self, source):
+        return self.ttl_s.get(source, DEFAULT_TTL_S)
+
+    def _paths(self, key):
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.body"
+
+    def load(self, key):
+        """(entrée, contenu) en cache, (None, None) si absente ou incomplète"""
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                entry = json.load(f)
+            return entry, body_path.read_bytes()
+        except (OSError, ValueError):
+            return None, None
+
+    def is_fresh(self, entry, source):
+        return time.time() - entry['stored_at'] < self.ttl(source)
+
+    def conditional_headers(self, entry):
+        """En-têtes de revalidation d'une entrée (vide si le serveur n'en a fourni aucun)"""
+        headers = {}
+        if entry['headers'].get('ETag'):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if entry['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    @staticmethod
+    def _new_entry(response):
+        entry = {
+            'url': response.url,
+            'status': response.status_code,
+            'headers': {name: response.headers[name] for name in _KEPT_HEADERS if name in response.headers},
+            'stored_at': time.time(),
+        }
+        # Le contenu est stocké décodé : ne pas garder Content-Encoding
+        entry['headers'].pop('Content-Encoding', None)
+        return entry
+
+    def store(self, key, response):
+        """Enregistre une réponse 200 (contenu puis métadonnées, écritures atomiques)"""
+        meta_path, body_path = self._paths(key)
+        entry = self._new_entry(response)
+
+        tmp_body = body_path.with_suffix('.body.tmp')
+        tmp_body.write_bytes(response.content)
+        tmp_body.replace(body_path)
+        self._write_entry(meta_path, entry)
+        return entry
+
+    def load_entry(self, key):
+        """Entrée en cache sans son contenu (lu ensuite par open_body), None si absente"""
+        meta_path, body_path = self._paths(key)
+        if not body_path.exists():
+            return None
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def open_body(self, key):
+        """Contenu en cache, ouvert en lecture binaire"""
+        return open(self._paths(key)[1], 'rb')
+
+    def body_writer(self, key, response):
+        """
+        Écriture en flux du contenu d'une réponse 200 (réponses volumineuses)
+        Le fichier temporaire n'est publié (avec les métadonnées) que par commit_body ;
+        sinon discard_body le supprime.
+        """
+        tmp_body = self._paths(key)[1].with_suffix(f'.body.{threading.get_ident()}.tmp')
+        return open(tmp_body, 'wb'), self._new_entry(response)
+
+    def commit_body(self, key, writer, entry):
+        meta_path, body_path = self._paths(key)
+        writer.close()
+        Path(writer.name).replace(body_path)
+        self._write_entry(meta_path, entry)
+        return entry
+
+    @staticmethod
+    def discard_body(writer):
+        writer.close()
+        Path(writer.name).unlink(missing_ok=True)
+
+    def touch(self, key, entry, response=None):
+        """Prolonge une entrée revalidée (304), en reprenant un éventuel nouvel ETag"""
+        entry = dict(entry, stored_at=time.time())
+        if response is not None:
+            for name in ('ETag', 'Last-Modified'):
+                if name in response.headers:
+                    entry['headers'][name] = response.headers[name]
+        self._write_entry(self._paths(key)[0], entry)
+        return entry
+
+    @staticmethod
+    def _write_entry(meta_path, entry):
+        tmp_path = meta_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, indent=2)
+        tmp_path.replace(meta_path)
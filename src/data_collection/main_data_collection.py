@@ -1,10 +1,15 @@
 """
 Script orchestrateur de collecte de données Lyon
 Lance tous les scripts de collecte dans l'ordre optimal
+
+Usage:
+    python src/data_collection/main_data_collection.py [--offline]
+    (--offline : réponses du cache HTTP uniquement, data_collection.http_cache)
 """
 
 import sys
 import time
+import argparse
 from pathlib import Path
 from datetime import datetime
 
@@ -34,9 +39,12 @@ def print_section(icon, title):
     print("-" * 70)
 
 
-def main():
+def main(offline=False):
     """
     Exécute la collecte complète de toutes les sources de données
+
+    Args:
+        offline: ne lire que le cache HTTP (aucune requête réseau)
     """
     start_time = datetime.now()
     
@@ -54,7 +62,7 @@ def main():
     # ========================================================================
     print_section("🗺️", "1/4 - Réseau routier OpenStreetMap")
     try:
-        osm_result = fetch_osm_network.main()
+        osm_result = fetch_osm_network.main(offline=offline)
         results["sources"]["osm_network"] = {
             "status": "success" if osm_result else "failed",
             "file": str(osm_result) if osm_result else None
@@ -74,7 +82,7 @@ def main():
     # ========================================================================
     print_section("🚴", "2/4 - Infrastructures cyclables Grand Lyon")
     try:
-        bike_infra_result = fetch_bike_infrastructure.main()
+        bike_infra_result = fetch_bike_infrastructure.main(offline=offline)
         results["sources"]["bike_infrastructure"] = {
             "status": "success" if bike_infra_result else "failed",
             "file": str(bike_infra_result) if bike_infra_result else None
@@ -94,7 +102,7 @@ def main():
     # ========================================================================
     print_section("🚴‍♂️", "3/4 - Compteurs vélo Eco-Counter")
     try:
-        bike_counters_result = fetch_bike_counters.main()
+        bike_counters_result = fetch_bike_counters.main(offline=offline)
         results["sources"]["bike_counters"] = {
             "status": "success" if bike_counters_result else "failed",
             "file": str(bike_counters_result) if bike_counters_result else None
@@ -114,7 +122,7 @@ def main():
     # ========================================================================
     print_section("🌤️", "4/4 - Données météorologiques Open-Meteo")
     try:
-        weather_result = fetch_weather.main()
+        weather_result = fetch_weather.main(offline=offline)
         results["sources"]["weather"] = {
             "status": "success" if weather_result else "failed",
             "file": str(weather_result) if weather_result else None
@@ -176,8 +184,13 @@ def main():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collecte complète des données Lyon")
+    parser.add_argument('--offline', action='store_true',
+                        help="Ne lire que le cache HTTP (aucune requête réseau)")
+    args = parser.parse_args()
+
     try:
-        main()
+        main(offline=args.offline)
     except KeyboardInterrupt:
         print("\n\n⚠️  Collecte interrompue par l'utilisateur")
         sys.exit(1)
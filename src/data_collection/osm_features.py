@@ -0,0 +1,106 @@
+"""
+Schéma et écriture du réseau routier OSM (data/raw/osm/osm_network.json)
+Partagé par les sources du réseau (Overpass, extrait .osm.pbf) :
+- HIGHWAY_TYPES / TAG_PROPERTIES : ways retenus et tags conservés
+- way_feature : feature GeoJSON d'un way (LineString + propriétés)
+- NetworkWriter : écriture en flux du fichier (geojson_stream, une feature par ligne),
+  ways dédoublonnés par osm_id ; seuls les osm_id déjà écrits restent en mémoire
+
+Format du fichier : {"geojson": {"type": "FeatureCollection", "features": [...]}, "metadata": {...}}
+(lu par json.load ou en flux par ijson, préfixe 'geojson.features.item')
+"""
+
+from datetime import datetime
+
+from data_collection.geojson_stream import FeatureCollectionWriter
+
+# Types de voies retenus
+HIGHWAY_TYPES = [
+    'motorway', 'trunk', 'primary', 'secondary', 'tertiary', 'residential',
+    'unclassified', 'cycleway', 'path', 'footway', 'pedestrian'
+]
+HIGHWAY_REGEX = f"^({'|'.join(HIGHWAY_TYPES)})$"
+
+# Tags OSM conservés dans les propriétés (valeur par défaut si absent, None = omis)
+TAG_PROPERTIES = {
+    'name': 'Sans nom',
+    'maxspeed': None,
+    'lanes': None,
+    'oneway': 'no',
+    'surface': None,
+    'lit': None,
+    'cycleway': None,
+    'foot': None,
+    'bicycle': None,
+    'width': None,
+    'access': None,
+    'service': None,
+}
+
+# Métadonnées communes du fichier réseau (complétées par la source : api_url, pbf_file, bbox…)
+NETWORK_METADATA = {
+    "description": "Réseau routier complet avec géométries LineString et attributs détaillés",
+    "apport": "Géométrie du réseau, vitesse max, nb voies, sens unique, type de voie",
+    "usage": "GeoPandas: gdf = gpd.GeoDataFrame.from_features(data['geojson']['features'])",
+    "crs": "EPSG:4326 (WGS84)",
+    "licence": "ODbL (Open Database License)",
+}
+
+
+def way_feature(osm_id, coordinates, tags):
+    """
+    Feature GeoJSON d'un way
+
+    Args:
+        osm_id: identifiant OSM du way
+        coordinates: [[lon, lat], ...]
+        tags: dict des tags OSM
+    """
+    properties = {'osm_id': osm_id, 'highway': tags.get('highway', 'unknown')}
+    for tag, default in TAG_PROPERTIES.items():
+        value = tags.get(tag, default)
+        if value is not None:
+            properties[tag] = value
+
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'LineString', 'coordinates': coordinates},
+        'properties': properties
+    }
+
+
+class NetworkWriter(FeatureCollectionWriter):
+    """
+    Écriture en flux de osm_network.json (voir geojson_stream), ways dédoublonnés par osm_id
+
+    Utilisation:
+        with NetworkWriter(path) as writer:
+            writer.add(osm_id, highway, dump_feature(feature))
+            writer.metadata.update(source=...)
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.seen = set()
+        self.highway_types = {}
+        self.duplicates = 0
+
+    def add(self, osm_id, highway, feature_json):
+        """Ajoute une feature (JSON compact) ; False si l'osm_id est déjà écrit"""
+        if osm_id in self.seen:
+            self.duplicates += 1
+            return False
+        self.write(feature_json)
+        self.seen.add(osm_id)
+        self.highway_types[highway] = self.highway_types.get(highway, 0) + 1
+        return True
+
+    def final_metadata(self):
+        return {
+            **self.metadata,
+            **NETWORK_METADATA,
+            "timestamp": datetime.now().isoformat(),
+            "ways_count": self.count,
+            "features_count": self.count,
+            "highway_types": dict(sorted(self.highway_types.items(), key=lambda x: x[1], reverse=True)),
+        }
@@ -0,0 +1,95 @@
+"""
+Réseau routier OSM à partir d'un extrait local .osm.pbf (sans API Overpass)
+Source: extrait régional OpenStreetMap (ex. Geofabrik rhone-alpes-latest.osm.pbf)
+Enregistre: data/raw/osm/osm_network.json, même schéma que fetch_osm_network
+
+Le fichier est lu en flux par pyosmium (dépendance optionnelle : pip install osmium) :
+même filtre highway (HIGHWAY_TYPES) et mêmes tags conservés (TAG_PROPERTIES) que la requête
+Overpass ; les positions des nœuds sont résolues par un index en mémoire (node_index).
+
+Avec une bbox, un way est retenu si au moins un de ses nœuds est dans la zone (la requête
+Overpass retient aussi les ways qui ne font que traverser la zone entre deux nœuds).
+
+Usage:
+    python src/data_collection/fetch_osm_network.py --pbf data/raw/osm/rhone-alpes-latest.osm.pbf
+    python src/data_collection/fetch_osm_network.py --pbf extrait.osm.pbf --zone metropole
+"""
+
+try:
+    import osmium
+except ImportError:  # dépendance optionnelle, requise seulement pour --pbf
+    osmium = None
+
+from data_collection.geojson_stream import dump_feature, request_fingerprint
+from data_collection.osm_features import HIGHWAY_TYPES, TAG_PROPERTIES, NetworkWriter, way_feature
+
+# Index des positions des nœuds (types pyosmium : 'flex_mem', 'sparse_mem_array', 'dense_file_array,<fichier>'…)
+DEFAULT_NODE_INDEX = 'flex_mem'
+
+# Précision des coordonnées OSM (1e-7 degré)
+COORD_DECIMALS = 7
+
+_HIGHWAY_SET = frozenset(HIGHWAY_TYPES)
+_KEPT_TAGS = ('highway', *TAG_PROPERTIES)
+
+
+def _in_bbox(lon, lat, bbox):
+    return bbox['south'] <= lat <= bbox['north'] and bbox['west'] <= lon <= bbox['east']
+
+
+def _way_coordinates(way):
+    """[[lon, lat], ...] d'un way ; nœuds hors de l'extrait (position inconnue) ignorés"""
+    coordinates = []
+    for node in way.nodes:
+        try:
+            coordinates.append([round(node.lon, COORD_DECIMALS), round(node.lat, COORD_DECIMALS)])
+        except osmium.InvalidLocationError:
+            continue
+    return coordinates
+
+
+def read_pbf_network(pbf_path, output_path, bbox=None, node_index=DEFAULT_NODE_INDEX):
+    """
+    Convertit les ways routiers d'un extrait .osm.pbf en osm_network.json
+
+    Args:
+        pbf_path: extrait OSM (.osm.pbf, ou tout format lu par osmium)
+        output_path: fichier réseau à écrire
+        bbox: zone retenue (défaut: tout l'extrait)
+        node_index: index pyosmium des positions des nœuds
+
+    Returns:
+        (métadonnées, ways ignorés faute de géométrie)
+    """
+    if osmium is None:
+        raise ImportError("pyosmium est requis pour lire un extrait .osm.pbf (pip install osmium)")
+
+    skipped = 0
+
+    with NetworkWriter(output_path) as writer:
+        def way(w):
+            nonlocal skipped
+            highway = w.tags.get('highway')
+            if highway not in _HIGHWAY_SET:
+                return
+
+            coordinates = _way_coordinates(w)
+            if len(coordinates) < 2:
+                skipped += 1
+                return
+            if bbox is not None and not any(_in_bbox(lon, lat, bbox) for lon, lat in coordinates):
+                return
+
+            tags = {tag: w.tags[tag] for tag in _KEPT_TAGS if tag in w.tags}
+            writer.add(w.id, highway, dump_feature(way_feature(w.id, coordinates, tags)))
+
+        osmium.make_simple_handler(way=way).apply_file(str(pbf_path), locations=True, idx=node_index)
+
+        writer.metadata.update({
+            "source": "OpenStreetMap (extrait PBF local)",
+            "pbf_file": pbf_path.name,
+            "bbox": bbox,
+            "request_fingerprint": request_fingerprint({"source": "pbf", "pbf_file": pbf_path.name, "bbox": bbox}),
+        })
+
+    return writer.metadata, skipped
@@ -0,0 +1,281 @@
+"""
+Archive météo horaire en partitions Parquet journalières
+data/raw/weather/archive/weather_YYYY-MM-DD.parquet : une partition par jour (heure locale
+Europe/Paris), une colonne par variable Open-Meteo et les indicateurs dérivés (is_raining,
+is_snowing, is_adverse_weather) calculés sur les colonnes entières.
+
+Les tableaux horaires de la réponse Open-Meteo deviennent directement des colonnes
+(hourly_frame) ; les heures sans aucune mesure (jours récents pas encore publiés dans
+l'archive) ne sont pas stockées. Une mesure déjà présente est remplacée, une partition n'est
+réécrite (de façon atomique) que si son contenu change. missing_days donne les jours absents
+ou incomplets d'une période : seuls ces jours sont redemandés à l'API.
+
+Les anciens fichiers weather_data*.json restent lisibles (read_legacy_file) et peuvent être
+convertis :
+    python src/data_collection/weather_store.py --migrate [--delete-legacy]
+"""
+
+import re
+import sys
+import json
+import argparse
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Dossier des partitions (dans data/raw/weather)
+STORE_DIRNAME = "archive"
+TIMEZONE = "Europe/Paris"
+
+# weather_YYYY-MM-DD.parquet
+_PARTITION_RE = re.compile(r"^weather_(\d{4}-\d{2}-\d{2})\.parquet$")
+# Anciens fichiers weather_data.json / weather_data_YYYYMMDD_HHMMSS.json
+_LEGACY_RE = re.compile(r"^weather_data(_\d{8}_\d{6})?\.json$")
+
+# Variable horaire Open-Meteo → colonne de l'archive
+HOURLY_VARIABLES = {
+    'temperature_2m': 'temperature_c',
+    'precipitation': 'precipitation_mm',
+    'rain': 'rain_mm',
+    'snowfall': 'snowfall_mm',
+    'snow_depth': 'snow_depth_cm',
+    'wind_speed_10m': 'wind_speed_kmh',
+    'wind_direction_10m': 'wind_direction_deg',
+    'wind_gusts_10m': 'wind_gusts_kmh',
+    'cloud_cover': 'cloud_cover_pct',
+    'relative_humidity_2m': 'humidity_pct',
+    'surface_pressure': 'pressure_hpa',
+    'weather_code': 'weather_code',
+    'visibility': 'visibility_m',
+    'is_day': 'is_day',
+}
+MEASURE_COLUMNS = list(HOURLY_VARIABLES.values())
+FLAG_COLUMNS = ['is_raining', 'is_snowing', 'is_adverse_weather']
+WEATHER_STORE_FIELDS = ['timestamp'] + MEASURE_COLUMNS + FLAG_COLUMNS
+
+SCHEMA = pa.schema(
+    [('timestamp', pa.timestamp('s'))]
+    + [(column, pa.float32()) for column in MEASURE_COLUMNS]
+    + [(column, pa.bool_()) for column in FLAG_COLUMNS]
+)
+
+# Seuils des indicateurs dérivés
+RAIN_MM = 0.1
+SNOW_MM = 0.1
+ADVERSE_RAIN_MM = 0.5
+ADVERSE_WIND_KMH = 30
+
+
+def partition_path(store_dir, day):
+    """Chemin de la partition d'un jour ('YYYY-MM-DD')"""
+    return store_dir / f"weather_{day}.parquet"
+
+
+def list_partitions(store_dir):
+    """Liste triée des partitions journalières"""
+    if not store_dir.is_dir():
+        return []
+    return sorted(path for path in store_dir.glob("weather_*.parquet") if _PARTITION_RE.match(path.name))
+
+
+def partition_date(path):
+    """Jour d'une partition ('YYYY-MM-DD'), None si nom non reconnu"""
+    match = _PARTITION_RE.match(path.name)
+    return match.group(1) if match else None
+
+
+def is_legacy_file(path):
+    return _LEGACY_RE.match(path.name) is not None
+
+
+def add_flags(df, columns=FLAG_COLUMNS):
+    """Indicateurs dérivés, calculés sur les colonnes (mesure absente = 0)"""
+    rain = df['rain_mm'].fillna(0)
+    flags = {
+        'is_raining': lambda: rain > RAIN_MM,
+        'is_snowing': lambda: df['snowfall_mm'].fillna(0) > SNOW_MM,
+        'is_adverse_weather': lambda: (rain > ADVERSE_RAIN_MM) | (df['wind_speed_kmh'].fillna(0) > ADVERSE_WIND_KMH),
+    }
+    for column in columns:
+        df[column] = flags[column]()
+    return df
+
+
+def _typed(df):
+    """Types de l'archive, heures sans aucune mesure écartées"""
+    df['timestamp'] = pd.to_datetime(df['timestamp']).astype('datetime64[s]')
+    for column in MEASURE_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce').astype('float32')
+    df = df[df[MEASURE_COLUMNS].notna().any(axis=1)].reset_index(drop=True)
+
+    # Indicateurs déjà présents (anciens fichiers) conservés, les autres calculés
+    stored = [column for column in FLAG_COLUMNS if column in df.columns]
+    for column in stored:
+        df[column] = df[column].fillna(False).astype(bool)
+    return add_flags(df, [column for column in FLAG_COLUMNS if column not in stored])[WEATHER_STORE_FIELDS]
+
+
+def hourly_frame(hourly):
+    """
+    DataFrame (WEATHER_STORE_FIELDS) à partir du bloc "hourly" d'une réponse Open-Meteo
+    (tableaux par variable, heures locales)
+    """
+    n = len(hourly.get('time', []))
+    df = pd.DataFrame({'timestamp': hourly.get('time', [])})
+    for variable, column in HOURLY_VARIABLES.items():
+        values = hourly.get(variable)
+        df[column] = values if values is not None and len(values) == n else np.nan
+    return _typed(df)
+
+
+def records_frame(records):
+    """DataFrame (WEATHER_STORE_FIELDS) à partir d'enregistrements (dicts) des anciens fichiers"""
+    df = pd.DataFrame.from_records(records)
+    for column in MEASURE_COLUMNS:
+        if column not in df.columns:
+            df[column] = np.nan
+    return _typed(df)
+
+
+def read_partition(path):
+    """DataFrame (WEATHER_STORE_FIELDS) d'une partition"""
+    return pq.read_table(path, schema=SCHEMA).to_pandas()
+
+
+def read_legacy_file(path):
+    """DataFrame (WEATHER_STORE_FIELDS) d'un ancien fichier weather_data*.json"""
+    with open(path, encoding='utf-8') as f:
+        return records_frame(json.load(f).get('weather_data', []))
+
+
+def read_range(store_dir, start, end):
+    """Mesures de l'archive du jour start au jour end inclus"""
+    paths = [partition_path(store_dir, day.isoformat()) for day in _days(start, end)]
+    frames = [read_partition(path) for path in paths if path.exists()]
+    if not frames:
+        return pd.DataFrame(columns=WEATHER_STORE_FIELDS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _days(start, end):
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def expected_hours(day):
+    """Heures locales distinctes d'un jour (23 au passage à l'heure d'été, 24 sinon)"""
+    hours = pd.date_range(pd.Timestamp(day, tz=TIMEZONE), periods=25, freq='h')
+    hours = hours[hours.normalize() == pd.Timestamp(day, tz=TIMEZONE)]
+    return hours.tz_localize(None).nunique()
+
+
+def missing_days(store_dir, start, end):
+    """Jours de start à end (inclus) absents de l'archive ou incomplets (température manquante)"""
+    missing = []
+    for day in _days(start, end):
+        path = partition_path(store_dir, day.isoformat())
+        if path.exists():
+            stored = pq.read_table(path, columns=['temperature_c']).column('temperature_c')
+            if len(stored) - stored.null_count >= expected_hours(day):
+                continue
+        missing.append(day)
+    return missing
+
+
+def day_ranges(days, chunk_days):
+    """Jours groupés en plages contiguës (début, fin inclus) d'au plus chunk_days jours"""
+    ranges = []
+    for day in sorted(days):
+        if ranges and day == ranges[-1][1] + timedelta(days=1) and (day - ranges[-1][0]).days < chunk_days:
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+def _write_partition(df, path):
+    """Écriture atomique d'une partition"""
+    table = pa.Table.from_pandas(df[WEATHER_STORE_FIELDS], schema=SCHEMA, preserve_index=False)
+    tmp_path = path.with_suffix('.tmp')
+    pq.write_table(table, tmp_path)
+    tmp_path.replace(path)
+
+
+def append_frame(store_dir, df):
+    """
+    Ajoute des mesures (DataFrame WEATHER_STORE_FIELDS) aux partitions de leurs jours
+
+    Returns:
+        (partitions écrites, nombre de partitions inchangées)
+    """
+    store_dir.mkdir(parents=True, exist_ok=True)
+    written, unchanged = [], 0
+
+    for day, new in df.groupby(df['timestamp'].dt.strftime('%Y-%m-%d'), sort=True):
+        path = partition_path(store_dir, day)
+        existing = read_partition(path) if path.exists() else None
+
+        merged = new if existing is None else pd.concat([existing, new], ignore_index=True)
+        merged = (
+            merged.drop_duplicates('timestamp', keep='last')
+            .sort_values('timestamp')
+            .reset_index(drop=True)
+        )
+
+        if existing is not None and merged.equals(existing):
+            unchanged += 1
+            continue
+
+        _write_partition(merged, path)
+        written.append(path)
+
+    return written, unchanged
+
+
+def migrate_legacy(weather_dir, store_dir, delete_legacy=False):
+    """
+    Convertit les anciens fichiers weather_data*.json en partitions (le plus récent l'emporte)
+
+    Returns:
+        nombre de fichiers convertis
+    """
+    # weather_data.json (sans date) avant les fichiers timestampés : date de collecte inconnue
+    legacy_files = sorted(
+        (path for path in weather_dir.glob("weather_data*.json") if is_legacy_file(path)),
+        key=lambda path: (path.name != "weather_data.json", path.name)
+    )
+    if not legacy_files:
+        return 0
+
+    df = pd.concat([read_legacy_file(path) for path in legacy_files], ignore_index=True)
+    written, unchanged = append_frame(store_dir, df)
+    print(f"   ✅ {len(legacy_files)} fichiers météo → {len(written)} partitions écrites, {unchanged} inchangées")
+
+    if delete_legacy:
+        for path in legacy_files:
+            path.unlink()
+        print(f"   🗑️  {len(legacy_files)} fichiers météo supprimés")
+
+    return len(legacy_files)
+
+
+if __name__ == "__main__":
+    BASE_DIR = Path(__file__).parent.parent.parent
+    DATA_RAW_DIR = BASE_DIR / "data" / "raw" / "weather"
+
+    parser = argparse.ArgumentParser(description="Archive météo en partitions journalières")
+    parser.add_argument('--migrate', action='store_true',
+                        help="Convertir les fichiers weather_data*.json en partitions")
+    parser.add_argument('--delete-legacy', action='store_true',
+                        help="Supprimer les fichiers weather_data*.json après conversion")
+    args = parser.parse_args()
+
+    if not args.migrate:
+        parser.print_help()
+        sys.exit(0)
+
+    print("📦 Conversion des fichiers météo en partitions journalières...")
+    migrate_legacy(DATA_RAW_DIR, DATA_RAW_DIR / STORE_DIRNAME, delete_legacy=args.delete_legacy)
@@ -17,6 +17,7 @@ from pathlib import Path
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score, mean_absolute_percentage_error
 import joblib
 import json
+import sys
 
 # Configuration
 BASE_DIR = Path(__file__).parent.parent.parent
@@ -26,6 +27,11 @@ MODELS_DIR = BASE_DIR / "models"
 VISUALIZATIONS_DIR = BASE_DIR / "visualizations"
 VISUALIZATIONS_DIR.mkdir(exist_ok=True, parents=True)
 
+# Ajouter le répertoire src au path
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from preprocessing.dataset_io import DATASET_DIRNAME, dataset_exists, read_dataset
+
 # Style pour les graphiques
 sns.set_style("whitegrid")
 plt.rcParams['figure.figsize'] = (14, 10)
@@ -40,14 +46,6 @@ print("=" * 80)
 
 print("\n📂 Étape 1: Chargement des données...")
 
-# Charger dataset
-df = pd.read_csv(DATA_PROCESSED_DIR / "final_dataset_v3.csv")
-df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-# Filtrer lignes valides (avec bike_count)
-df_valid = df[df['bike_count'].notna()].copy()
-print(f"   ✅ {len(df_valid):,} lignes valides avec données réelles")
-
 # Charger le modèle entraîné
 model_path = MODELS_DIR / "best_model.joblib"
 if not model_path.exists():
@@ -65,6 +63,21 @@ with open(MODELS_DIR / "feature_columns.json", 'r') as f:
 
 print(f"   ✅ {len(feature_cols)} features chargées")
 
+# Charger dataset : Parquet avec projection sur les colonnes utiles, sinon CSV historique
+dataset_path = DATA_PROCESSED_DIR / DATASET_DIRNAME
+if dataset_exists(dataset_path):
+    columns = list(dict.fromkeys(['edge_id', 'timestamp', 'bike_count'] + feature_cols))
+    df = read_dataset(dataset_path, columns=columns)
+    dataset_name = f"{DATASET_DIRNAME}/"
+else:
+    df = pd.read_csv(DATA_PROCESSED_DIR / "final_dataset_v3.csv")
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    dataset_name = "final_dataset_v3.csv"
+
+# Filtrer lignes valides (avec bike_count)
+df_valid = df[df['bike_count'].notna()].copy()
+print(f"   ✅ {len(df_valid):,} lignes valides avec données réelles")
+
 # =====================================================================
 # 2. PRÉPARER DONNÉES POUR PRÉDICTION
 # =====================================================================
@@ -268,7 +281,7 @@ with open(report_path, 'w', encoding='utf-8') as f:
     f.write("=" * 80 + "\n\n")
     
     f.write(f"Date de génération: {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-    f.write(f"Dataset: final_dataset_v3.csv\n")
+    f.write(f"Dataset: {dataset_name}\n")
     f.write(f"Échantillons analysés: {len(df_valid):,}\n")
     f.write(f"Edges uniques: {df_valid['edge_id'].nunique()}\n\n")
     
@@ -7,8 +7,10 @@ Usage:
   python predict_v3.py --datetime "2025-11-15 08:00"
   python predict_v3.py --datetime "2025-11-15 17:30" --sample 1000
   python predict_v3.py --datetime "2025-11-15 08:00" --output predictions_rush_hour.csv
+  python predict_v3.py --datetime "2025-11-15 08:00" --no-geojson   # CSV seul, sans lire les géométries
 """
 
+import sys
 import pandas as pd
 import numpy as np
 import geopandas as gpd
@@ -26,6 +28,24 @@ DATA_PROCESSED_DIR = BASE_DIR / "data" / "processed"
 DATA_PREDICTIONS_DIR = BASE_DIR / "data" / "predictions"
 MODELS_DIR = BASE_DIR / "models"
 
+# Ajouter le répertoire src au path
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from preprocessing.weather_alignment import WeatherAligner, find_weather_files, load_weather_files
+from preprocessing.edge_store import edge_store_exists, read_edge_geometry, read_edge_store
+from preprocessing.dataset_io import DATASET_DIRNAME, dataset_exists, read_dataset
+from preprocessing.spatial_propagation import (
+    SENSOR_WEIGHTS_FILENAME, SPATIAL_FEATURE_COLUMNS, load_sensor_weights, propagate_hour
+)
+
+# Valeurs météo par défaut si aucune mesure n'est disponible
+DEFAULT_WEATHER = {
+    'temperature_c': 15.0,
+    'precipitation_mm': 0.0,
+    'wind_speed_kmh': 10.0,
+    'is_raining': False
+}
+
 print("=" * 80)
 print("🚴 CITYZN - PRÉDICTION v3 (Architecture Modulaire)")
 print("=" * 80)
@@ -41,6 +61,10 @@ parser.add_argument('--sample', type=int, default=None,
                     help='Nombre d\'edges à prédire (pour test rapide)')
 parser.add_argument('--output', type=str, default=None,
                     help='Nom du fichier de sortie (défaut: predictions_YYYYMMDD_HHMMSS.csv)')
+parser.add_argument('--weather-max-staleness', type=float, default=3.0,
+                    help='Écart maximal (heures) avec la mesure météo la plus proche (défaut: 3)')
+parser.add_argument('--no-geojson', action='store_true',
+                    help='Ne pas écrire le GeoJSON (les géométries ne sont alors pas lues)')
 args = parser.parse_args()
 
 # Parser la date
@@ -77,6 +101,16 @@ encoders_path = MODELS_DIR / "label_encoders.joblib"
 label_encoders = joblib.load(encoders_path)
 print(f"   ✅ Label encoders chargés")
 
+# Médianes d'imputation du training (modèles antérieurs : médianes des edges prédits)
+medians_path = MODELS_DIR / "feature_medians.json"
+feature_medians = None
+if medians_path.exists():
+    with open(medians_path, 'r') as f:
+        feature_medians = pd.Series(json.load(f), dtype=float)
+    print(f"   ✅ Médianes d'imputation chargées")
+else:
+    print(f"   ⚠️  {medians_path.name} absent (modèle antérieur) : imputation par les médianes des edges prédits")
+
 # Afficher métriques du modèle
 metrics_path = MODELS_DIR / "metrics.json"
 if metrics_path.exists():
@@ -94,14 +128,18 @@ if metrics_path.exists():
 print("\n🗺️  Étape 2: Chargement edges statiques...")
 
 edges_static_path = DATA_PROCESSED_DIR / "edges_static_v3.gpkg"
-if not edges_static_path.exists():
+if edge_store_exists(DATA_PROCESSED_DIR):
+    # Magasin sans géométrie (memory-map) ; géométries lues seulement pour le GeoJSON
+    edges = read_edge_store(DATA_PROCESSED_DIR)
+    print(f"   ✅ {len(edges):,} edges chargés (magasin des edges)")
+elif edges_static_path.exists():
+    edges = gpd.read_file(edges_static_path)
+    print(f"   ✅ {len(edges):,} edges chargés ({edges_static_path.name})")
+else:
     print(f"   ❌ Edges statiques non trouvés: {edges_static_path}")
     print(f"   💡 Lancez d'abord: python src/preprocessing/create_ml_dataset_v3.py")
     exit(1)
 
-edges = gpd.read_file(edges_static_path)
-print(f"   ✅ {len(edges):,} edges chargés")
-
 # Échantillon si demandé
 if args.sample:
     sample_size = min(args.sample, len(edges))
@@ -114,41 +152,27 @@ if args.sample:
 
 print("\n🌤️  Étape 3: Chargement données météo...")
 
-# Chercher fichier météo (timestamped ou unique)
-weather_files = list((DATA_RAW_DIR / "weather").glob("weather_data*.json"))
+# Archive météo journalière (et anciens fichiers weather_data*.json)
+weather_files = find_weather_files(DATA_RAW_DIR / "weather")
 if not weather_files:
     print(f"   ⚠️  Aucune donnée météo trouvée, utilisation de valeurs par défaut")
-    weather_df = pd.DataFrame([{
-        'timestamp': target_datetime,
-        'temperature_c': 15.0,
-        'precipitation_mm': 0.0,
-        'wind_speed_kmh': 10.0,
-        'is_raining': False
-    }])
+    weather_df = pd.DataFrame([{'timestamp': target_datetime, **DEFAULT_WEATHER}])
 else:
-    # Charger toutes les données météo
-    weather_data = []
-    for file in weather_files:
-        with open(file, 'r') as f:
-            data = json.load(f)
-            # Structure: {metadata: {...}, weather_data: [...]}
-            if isinstance(data, dict) and 'weather_data' in data:
-                weather_data.extend(data['weather_data'])
-            elif isinstance(data, dict) and 'data' in data:
-                weather_data.extend(data['data'])
-            elif isinstance(data, list):
-                weather_data.extend(data)
-            else:
-                weather_data.append(data)
-    
-    weather_df = pd.DataFrame(weather_data)
-    if 'timestamp' in weather_df.columns:
-        weather_df['timestamp'] = pd.to_datetime(weather_df['timestamp'])
+    weather_df = load_weather_files(weather_files)
     print(f"   ✅ {len(weather_df)} mesures météo chargées")
 
-# Trouver la mesure météo la plus proche de target_datetime
-weather_df['time_diff'] = abs((weather_df['timestamp'] - target_datetime).dt.total_seconds())
-closest_weather = weather_df.loc[weather_df['time_diff'].idxmin()]
+# Trouver la mesure météo la plus proche de target_datetime (index trié, recherche dichotomique)
+weather_aligner = WeatherAligner(
+    weather_df,
+    max_staleness=pd.Timedelta(hours=args.weather_max_staleness),
+    direction='nearest'
+)
+closest_weather = weather_aligner.lookup(target_datetime)
+weather_missing = closest_weather is None
+
+if weather_missing:
+    print(f"   ⚠️  Aucune mesure météo à ≤{args.weather_max_staleness:g}h, utilisation de valeurs par défaut")
+    closest_weather = pd.Series({'timestamp': target_datetime, **DEFAULT_WEATHER})
 
 print(f"   📅 Météo pour {closest_weather['timestamp']}:")
 print(f"      • Température: {closest_weather['temperature_c']:.1f}°C")
@@ -194,6 +218,30 @@ edges['is_windy'] = int(closest_weather['wind_speed_kmh'] > 30)
 
 print(f"   ✅ Features météo ajoutées")
 
+# Propagation spatiale : comptages des capteurs voisins à l'heure prédite (dataset Parquet)
+sensor_weights_path = DATA_PROCESSED_DIR / SENSOR_WEIGHTS_FILENAME
+dataset_path = DATA_PROCESSED_DIR / DATASET_DIRNAME
+if any(col in feature_cols for col in SPATIAL_FEATURE_COLUMNS):
+    target_hour = pd.Timestamp(target_datetime).floor('h')
+    sensor_counts = pd.Series(dtype=float)
+    if sensor_weights_path.exists() and dataset_exists(dataset_path):
+        day = target_hour.strftime('%Y-%m-%d')
+        counts_df = read_dataset(dataset_path, columns=['edge_id', 'timestamp', 'bike_count'],
+                                 start_date=day, end_date=day)
+        counts_df = counts_df[(counts_df['timestamp'] == target_hour) & counts_df['bike_count'].notna()]
+        sensor_counts = counts_df.set_index('edge_id')['bike_count']
+
+    if len(sensor_counts):
+        spatial = propagate_hour(load_sensor_weights(sensor_weights_path), sensor_counts, edges['osm_id'])
+        edges[SPATIAL_FEATURE_COLUMNS] = spatial
+        print(f"   ✅ Propagation spatiale: {len(sensor_counts)} capteurs mesurés à {target_hour:%H:%M}, "
+              f"{int((spatial['nearby_sensor_weight'] > 0).sum()):,} edges avec un capteur voisin")
+    else:
+        # Comme en training : aucun capteur mesuré à proximité (count NaN → médiane, poids nul)
+        edges['nearby_sensor_count'] = np.nan
+        edges['nearby_sensor_weight'] = 0.0
+        print(f"   ⚠️  Aucun comptage de capteur à {target_hour}: aucun capteur voisin mesuré")
+
 # =====================================================================
 # 6. ENCODER FEATURES CATÉGORIELLES
 # =====================================================================
@@ -208,13 +256,11 @@ categorical_cols = [
 for col in categorical_cols:
     if col in edges.columns and col in label_encoders:
         # Gérer valeurs inconnues
-        edges[col] = edges[col].fillna('unknown')
-        
-        # Encoder (gérer les valeurs non vues pendant training)
+        values = edges[col].astype(object).fillna('unknown').astype(str)
+
+        # Encoder en une passe (-1 pour les valeurs non vues pendant training)
         le = label_encoders[col]
-        edges[col] = edges[col].apply(
-            lambda x: le.transform([str(x)])[0] if str(x) in le.classes_ else -1
-        )
+        edges[col] = pd.Categorical(values, categories=le.classes_).codes
 
 print(f"   ✅ {len(categorical_cols)} colonnes encodées")
 
@@ -238,9 +284,10 @@ if missing_features:
 # Extraire X dans le bon ordre
 X = edges[feature_cols].copy()
 
-# Remplir NaN
+# Remplir NaN (médianes du training, comme pour l'entraînement)
 numeric_cols = X.select_dtypes(include=[np.number]).columns
-X[numeric_cols] = X[numeric_cols].fillna(X[numeric_cols].median())
+medians = feature_medians if feature_medians is not None else X[numeric_cols].median()
+X[numeric_cols] = X[numeric_cols].fillna(medians.reindex(numeric_cols))
 X = X.fillna(0)
 
 print(f"   ✅ {len(X):,} lignes × {len(feature_cols)} features prêtes")
@@ -295,13 +342,21 @@ edges[output_cols_existing].to_csv(predictions_csv, index=False)
 print(f"   ✅ CSV sauvegardé: {predictions_csv}")
 
 # GeoJSON pour visualisation
-output_geojson = output_filename.replace('.csv', '.geojson')
-predictions_geojson = DATA_PREDICTIONS_DIR / output_geojson
-
-# Préparer GeoDataFrame pour export
-edges_export = edges[output_cols_existing + ['geometry']].copy()
-edges_export.to_file(predictions_geojson, driver='GeoJSON')
-print(f"   ✅ GeoJSON sauvegardé: {predictions_geojson}")
+predictions_geojson = None
+if not args.no_geojson:
+    output_geojson = output_filename.replace('.csv', '.geojson')
+    predictions_geojson = DATA_PREDICTIONS_DIR / output_geojson
+
+    # Géométries depuis le GeoPackage (absentes du magasin des edges)
+    if 'geometry' in edges.columns:
+        geometry = edges.geometry
+    else:
+        geometry = read_edge_geometry(edges_static_path, edges['osm_id'])
+
+    # Préparer GeoDataFrame pour export
+    edges_export = gpd.GeoDataFrame(edges[output_cols_existing], geometry=geometry, crs="EPSG:4326")
+    edges_export.to_file(predictions_geojson, driver='GeoJSON')
+    print(f"   ✅ GeoJSON sauvegardé: {predictions_geojson}")
 
 # Métadonnées
 metadata = {
@@ -313,7 +368,9 @@ metadata = {
         'temperature_c': float(closest_weather['temperature_c']),
         'precipitation_mm': float(closest_weather['precipitation_mm']),
         'wind_speed_kmh': float(closest_weather['wind_speed_kmh']),
-        'is_raining': bool(closest_weather['is_raining'])
+        'is_raining': bool(closest_weather['is_raining']),
+        'weather_timestamp': pd.Timestamp(closest_weather['timestamp']).isoformat(),
+        'weather_missing': weather_missing
     },
     'temporal': {
         'hour': int(target_datetime.hour),
@@ -352,9 +409,9 @@ print(f"   • Trafic total prédit: {edges['bike_count_predicted'].sum():,} vé
 print(f"   • Trafic moyen: {edges['bike_count_predicted'].mean():.1f} vélos/h/edge")
 
 print(f"\n📁 Fichiers générés:")
-print(f"   1. {predictions_csv.relative_to(BASE_DIR)}")
-print(f"   2. {predictions_geojson.relative_to(BASE_DIR)}")
-print(f"   3. {metadata_path.relative_to(BASE_DIR)}")
+generated_files = [predictions_csv, predictions_geojson, metadata_path]
+for i, path in enumerate([path for path in generated_files if path is not None], 1):
+    print(f"   {i}. {path.relative_to(BASE_DIR)}")
 
 print(f"\n🔥 Top 10 edges avec le plus de trafic:")
 top_edges = edges.nlargest(10, 'bike_count_predicted')[['osm_id', 'bike_count_predicted', 'highway_type', 'has_dedicated_bike_lane']]
@@ -362,5 +419,6 @@ for idx, row in top_edges.iterrows():
     bike_lane = "🚴" if row['has_dedicated_bike_lane'] else "  "
     print(f"   {bike_lane} Edge {row['osm_id']}: {row['bike_count_predicted']:4d} vélos/h ({row['highway_type']})")
 
-print(f"\n💡 Visualisation:")
-print(f"   Ouvrir {predictions_geojson.name} dans QGIS ou kepler.gl")
+if predictions_geojson is not None:
+    print(f"\n💡 Visualisation:")
+    print(f"   Ouvrir {predictions_geojson.name} dans QGIS ou kepler.gl")
@@ -21,6 +21,7 @@ from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score, m
 from sklearn.preprocessing import LabelEncoder
 import joblib
 from tqdm import tqdm
+import sys
 
 # Paths
 BASE_DIR = Path(__file__).parent.parent.parent
@@ -28,6 +29,12 @@ DATA_PROCESSED_DIR = BASE_DIR / "data" / "processed"
 DATA_PREDICTIONS_DIR = BASE_DIR / "data" / "predictions"
 MODELS_DIR = BASE_DIR / "models"
 
+# Ajouter le répertoire src au path
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from preprocessing.dataset_io import DATASET_DIRNAME, dataset_exists, read_dataset
+from preprocessing.edge_attributes import EDGE_CATEGORIES, categorical_column
+
 # Créer dossiers
 DATA_PREDICTIONS_DIR.mkdir(exist_ok=True, parents=True)
 MODELS_DIR.mkdir(exist_ok=True, parents=True)
@@ -42,10 +49,17 @@ print("=" * 80)
 
 print("\n📂 Étape 1: Chargement dataset training...")
 
-df = pd.read_csv(DATA_PROCESSED_DIR / "final_dataset_v3.csv")
-df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-print(f"   ✅ Dataset chargé: {df.shape}")
+# Dataset Parquet (types compacts), sinon CSV historique
+dataset_path = DATA_PROCESSED_DIR / DATASET_DIRNAME
+if dataset_exists(dataset_path):
+    df = read_dataset(dataset_path)
+    dataset_name = f"{DATASET_DIRNAME}/"
+else:
+    df = pd.read_csv(DATA_PROCESSED_DIR / "final_dataset_v3.csv")
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    dataset_name = "final_dataset_v3.csv"
+
+print(f"   ✅ Dataset chargé ({dataset_name}): {df.shape}")
 print(f"   • Lignes: {len(df):,}")
 print(f"   • Colonnes: {len(df.columns)}")
 print(f"   • Edges uniques: {df['edge_id'].nunique()}")
@@ -71,19 +85,21 @@ categorical_cols = [
     'surface_quality', 'bicycle_access', 'orientation'
 ]
 
-# Features à exclure
+# Features à exclure (identifiants, target, indicateurs de qualité des données)
 exclude_cols = [
-    'edge_id', 'timestamp', 'bike_count'
+    'edge_id', 'timestamp', 'bike_count', 'weather_missing'
 ]
 
 # Label encoding pour les features catégorielles
+# (sur le vocabulaire figé du preprocessing : codes stables d'un dataset à l'autre)
 label_encoders = {}
 for col in categorical_cols:
     if col in df.columns:
         le = LabelEncoder()
-        # Gérer les valeurs manquantes
-        df[col] = df[col].fillna('unknown')
-        df[col] = le.fit_transform(df[col].astype(str))
+        le.fit(sorted(set(EDGE_CATEGORIES[col]) | {'unknown'}))
+        # Valeurs hors vocabulaire ramenées à la valeur de repli, manquantes à 'unknown'
+        df[col] = categorical_column(df[col], col).astype(object).fillna('unknown')
+        df[col] = le.transform(df[col].astype(str))
         label_encoders[col] = le
 
 # Sauvegarder les encoders
@@ -113,9 +129,10 @@ print(f"   • Lignes valides: {len(df_valid):,}")
 X = df_valid[feature_cols].copy()
 y = df_valid['bike_count'].copy()
 
-# Remplir NaN dans X
+# Remplir NaN dans X (médianes sauvegardées avec le modèle, réutilisées en prédiction)
 numeric_cols = X.select_dtypes(include=[np.number]).columns
-X[numeric_cols] = X[numeric_cols].fillna(X[numeric_cols].median())
+feature_medians = X[numeric_cols].median()
+X[numeric_cols] = X[numeric_cols].fillna(feature_medians)
 
 print(f"   • Données préparées: {len(X):,} lignes × {len(feature_cols)} features")
 
@@ -268,11 +285,17 @@ with open(features_path, 'w') as f:
     json.dump(feature_cols, f, indent=2)
 print(f"   ✅ Features sauvegardées: {features_path}")
 
+# Sauvegarder médianes d'imputation (None si colonne entièrement vide)
+medians_path = MODELS_DIR / "feature_medians.json"
+with open(medians_path, 'w') as f:
+    json.dump({col: None if pd.isna(v) else float(v) for col, v in feature_medians.items()}, f, indent=2)
+print(f"   ✅ Médianes d'imputation sauvegardées: {medians_path}")
+
 # Sauvegarder métriques
 metrics = {
     'model_type': best_model_name,
     'trained_at': datetime.now().isoformat(),
-    'dataset': 'final_dataset_v3.csv',
+    'dataset': dataset_name,
     'n_samples_train': len(X_train),
     'n_samples_test': len(X_test),
     'n_features': len(feature_cols),
@@ -0,0 +1,24 @@
+"""
+Module de preprocessing pour Lyon
+Contient le script de création du dataset ML et les composants partagés
+avec l'entraînement et la prédiction
+"""
+
+# Exposer les composants partagés
+__all__ = [
+    'counter_loader',
+    'dataset_io',
+    'edge_attributes',
+    'edge_store',
+    'incremental',
+    'lag_features',
+    'manifest',
+    'pipeline',
+    'profiling',
+    'road_graph',
+    'spatial_propagation',
+    'stages',
+    'temporal_dataset',
+    'tiling',
+    'weather_alignment'
+]
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Benchmark du calcul des attributs d'edges (étape edge_features)
+Compare l'implémentation ligne par ligne d'origine (.apply) et l'implémentation vectorisée
+(preprocessing.edge_attributes) sur des réseaux synthétiques, et vérifie que les résultats
+sont identiques.
+
+Usage:
+    python src/preprocessing/benchmark_edge_features.py [--sizes 60000,600000]
+"""
+
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from pathlib import Path
+
+# Ajouter le répertoire src au path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from preprocessing.edge_attributes import (
+    DEFAULT_LANES, DEFAULT_MAXSPEED_KMH, edge_orientation, parse_int_tag, road_category, surface_quality
+)
+
+HIGHWAYS = ['residential', 'primary', 'secondary', 'tertiary', 'cycleway', 'path',
+            'footway', 'service', 'trunk', 'motorway', None]
+SURFACES = ['asphalt', 'Asphalt', 'paved', 'concrete', 'paving_stones', 'sett', 'gravel', None]
+MAXSPEEDS = ['30', '50', '70', '30 mph', 'FR:urban', None]
+LANES = ['1', '2', '3', '2;3', None]
+
+
+# =====================================================================
+# IMPLÉMENTATION LIGNE PAR LIGNE (référence)
+# =====================================================================
+
+def calc_orientation(geom):
+    coords = list(geom.coords)
+    if len(coords) < 2:
+        return None
+    dx = coords[-1][0] - coords[0][0]
+    dy = coords[-1][1] - coords[0][1]
+    angle = np.degrees(np.arctan2(dy, dx))
+    if angle < 0:
+        angle += 360
+
+    if angle < 22.5 or angle >= 337.5:
+        return 'E'
+    elif angle < 67.5:
+        return 'NE'
+    elif angle < 112.5:
+        return 'N'
+    elif angle < 157.5:
+        return 'NW'
+    elif angle < 202.5:
+        return 'W'
+    elif angle < 247.5:
+        return 'SW'
+    elif angle < 292.5:
+        return 'S'
+    else:
+        return 'SE'
+
+
+def categorize_road(highway_type):
+    if highway_type in ['motorway', 'trunk']:
+        return 'major'
+    elif highway_type in ['primary', 'secondary']:
+        return 'arterial'
+    elif highway_type in ['tertiary', 'residential']:
+        return 'local'
+    elif highway_type in ['cycleway', 'path']:
+        return 'bike_path'
+    else:
+        return 'other'
+
+
+def categorize_surface(surface):
+    if pd.isna(surface):
+        return 'unknown'
+    surface = str(surface).lower()
+    if surface in ['asphalt', 'paved']:
+        return 'good'
+    elif surface in ['concrete', 'paving_stones']:
+        return 'medium'
+    else:
+        return 'poor'
+
+
+def rowwise_features(edges):
+    highway_type = edges['highway'].fillna('unknown')
+    return pd.DataFrame({
+        'orientation': edges.geometry.apply(calc_orientation),
+        'road_category': highway_type.apply(categorize_road),
+        'maxspeed_kmh': edges['maxspeed'].apply(lambda x: int(x) if pd.notna(x) and str(x).isdigit() else 50),
+        'lanes': edges['lanes'].apply(lambda x: int(x) if pd.notna(x) and str(x).isdigit() else 2),
+        'surface_quality': edges['surface'].apply(categorize_surface),
+    })
+
+
+def vectorized_features(edges):
+    highway_type = edges['highway'].fillna('unknown')
+    return pd.DataFrame({
+        'orientation': edge_orientation(edges.geometry),
+        'road_category': road_category(highway_type),
+        'maxspeed_kmh': parse_int_tag(edges['maxspeed'], DEFAULT_MAXSPEED_KMH),
+        'lanes': parse_int_tag(edges['lanes'], DEFAULT_LANES),
+        'surface_quality': surface_quality(edges['surface']),
+    }, index=edges.index)
+
+
+# =====================================================================
+# RÉSEAU SYNTHÉTIQUE
+# =====================================================================
+
+def synthetic_network(n_edges, n_points=5, seed=0):
+    """Edges aléatoires (Lambert 93, autour de Lyon) avec des tags OSM variés"""
+    rng = np.random.default_rng(seed)
+
+    origins = rng.uniform([835000, 6510000], [855000, 6530000], size=(n_edges, 1, 2))
+    steps = rng.normal(0, 20, size=(n_edges, n_points, 2))
+    steps[:, 0, :] = 0
+    # Quelques edges axe-alignés (angles aux bornes des secteurs)
+    steps[::50, 1:, 1] = 0
+    coords = origins + np.cumsum(steps, axis=1)
+
+    def pick(values):
+        return pd.Series(np.asarray(values, dtype=object)[rng.integers(0, len(values), n_edges)])
+
+    return gpd.GeoDataFrame({
+        'highway': pick(HIGHWAYS),
+        'surface': pick(SURFACES),
+        'maxspeed': pick(MAXSPEEDS),
+        'lanes': pick(LANES),
+    }, geometry=shapely.linestrings(coords), crs="EPSG:2154")
+
+
+def timed(func, edges):
+    start = time.perf_counter()
+    result = func(edges)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des attributs d'edges")
+    parser.add_argument('--sizes', default='60000,600000',
+                        help="Nombres d'edges à tester, séparés par des virgules")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print("="*80)
+    print("⏱️  BENCHMARK ATTRIBUTS EDGES (ligne par ligne vs vectorisé)")
+    print("="*80)
+
+    for n_edges in sizes:
+        edges = synthetic_network(n_edges)
+
+        expected, rowwise_time = timed(rowwise_features, edges)
+        result, vectorized_time = timed(vectorized_features, edges)
+
+        pd.testing.assert_frame_equal(result, expected)
+
+        print(f"\n📏 {n_edges:,} edges")
+        print(f"   • Ligne par ligne: {rowwise_time:.2f}s")
+        print(f"   • Vectorisé:       {vectorized_time:.2f}s")
+        print(f"   ✅ Résultats identiques, accélération ×{rowwise_time / vectorized_time:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Benchmark mémoire de la table des features statiques des edges (étape edge_features)
+Compare l'ancienne sortie (GeoDataFrame WGS84 avec tous les tags OSM, colonnes object /
+int64 / float64) et la table compacte actuelle (sans géométrie, catégories au vocabulaire
+figé, int16 / float32).
+
+Deux mesures :
+- Réseau réel (défaut, data/raw/osm/osm_network.json) : pic RSS pendant l'étape, chaque
+  variante dans son propre processus (mêmes entrées : load_osm, match_sensors, bike_infra).
+  Pic de l'étape via VmHWM remis à zéro avant l'étape (Linux, voir profiling), sinon pic
+  du processus (ru_maxrss)
+- --synthetic : taille en mémoire des deux tables sur des réseaux synthétiques (--sizes) et
+  vérification que les valeurs sont identiques
+
+Usage:
+    python src/preprocessing/benchmark_edge_memory.py [--osm-file data/raw/osm/osm_network.json]
+    python src/preprocessing/benchmark_edge_memory.py --synthetic [--sizes 60000,600000]
+"""
+
+import sys
+import json
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from pathlib import Path
+from shapely.geometry import Point
+
+# Ajouter le répertoire src au path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from preprocessing import stages
+from preprocessing.benchmark_edge_features import synthetic_network
+from preprocessing.profiling import current_rss_mb, peak_rss_mb, reset_peak_rss
+from preprocessing.tiling import DEFAULT_HALO_M
+from preprocessing.edge_attributes import (
+    DEFAULT_LANES, DEFAULT_MAXSPEED_KMH, EDGE_CATEGORIES, categorical_column,
+    edge_orientation, parse_int_tag, road_category, surface_quality
+)
+
+DATA_RAW_DIR = Path(__file__).parent.parent.parent / "data" / "raw"
+
+# Paramètres des étapes amont (valeurs de create_ml_dataset_v3)
+SENSOR_MAX_DISTANCE_M = 50
+BIKE_LANE_BUFFER_M = 20
+BIKE_LANE_MAX_DISTANCE_M = DEFAULT_HALO_M
+
+NAMES = [f"Rue {i}" for i in range(2000)] + [None]
+CYCLEWAYS = ['lane', 'track', 'shared_lane', 'opposite', None, None, None]
+BICYCLES = ['yes', 'designated', 'no', None, None]
+LITS = ['yes', 'no', None]
+
+
+def synthetic_inputs(n_edges, seed=0):
+    """Réseau brut tel que sorti de load_osm + sorties des étapes match_sensors / bike_infra"""
+    rng = np.random.default_rng(seed)
+    edges = synthetic_network(n_edges, seed=seed)
+
+    def pick(values):
+        return np.asarray(values, dtype=object)[rng.integers(0, len(values), n_edges)]
+
+    edges['osm_id'] = np.arange(n_edges, dtype='int64') * 7 + 1000
+    edges['name'] = pick(NAMES)
+    edges['oneway'] = pick(['yes', 'no', None])
+    edges['cycleway'] = pick(CYCLEWAYS)
+    edges['bicycle'] = pick(BICYCLES)
+    edges['lit'] = pick(LITS)
+    edges['geometry_wgs84'] = edges.geometry.to_crs("EPSG:4326")
+
+    sensors = {'edges_with_sensors': set(edges['osm_id'].sample(frac=0.01, random_state=seed))}
+    distance = rng.uniform(0, 500, n_edges)
+    bike_lanes = pd.DataFrame({
+        'bike_lane_distance_m': distance,
+        'has_dedicated_bike_lane': distance <= 20,
+    }, index=edges.index)
+    return edges, sensors, bike_lanes
+
+
+def legacy_edge_features(edges_lam, sensors, bike_lanes):
+    """Ancienne sortie : GeoDataFrame WGS84 complet, types par défaut"""
+    geometry_lam = edges_lam.geometry
+    edges_gdf = gpd.GeoDataFrame(
+        edges_lam.drop(columns=[edges_lam.geometry.name, 'geometry_wgs84']),
+        geometry=edges_lam['geometry_wgs84'].rename('geometry')
+    )
+
+    edges_gdf['bike_lane_distance_m'] = bike_lanes['bike_lane_distance_m']
+    edges_gdf['has_dedicated_bike_lane'] = bike_lanes['has_dedicated_bike_lane']
+    edges_gdf['has_real_sensor'] = edges_gdf['osm_id'].isin(sensors['edges_with_sensors'])
+
+    center_point = gpd.GeoSeries([Point(*stages.LYON_CENTER)], crs="EPSG:4326").to_crs("EPSG:2154").iloc[0]
+    edges_gdf['distance_to_center_km'] = geometry_lam.distance(center_point) / 1000
+    edges_gdf['edge_length_m'] = geometry_lam.length
+    edges_gdf['orientation'] = edge_orientation(geometry_lam)
+
+    edges_gdf['highway_type'] = edges_gdf['highway'].fillna('unknown')
+    edges_gdf['road_category'] = road_category(edges_gdf['highway_type'])
+    edges_gdf['maxspeed_kmh'] = parse_int_tag(edges_gdf['maxspeed'], DEFAULT_MAXSPEED_KMH)
+    edges_gdf['lanes'] = parse_int_tag(edges_gdf['lanes'], DEFAULT_LANES)
+    edges_gdf['is_oneway'] = edges_gdf['oneway'] == 'yes'
+    edges_gdf['cycleway_type'] = edges_gdf['cycleway'].fillna('none')
+    edges_gdf['surface_quality'] = surface_quality(edges_gdf['surface'])
+    edges_gdf['bicycle_access'] = edges_gdf['bicycle'].fillna('yes')
+    edges_gdf['is_lit'] = edges_gdf['lit'] == 'yes'
+    edges_gdf['has_cycleway'] = edges_gdf['cycleway'].notna()
+    return edges_gdf
+
+
+VARIANTS = {
+    'legacy': legacy_edge_features,
+    'compact': stages.edge_features,
+}
+
+
+def table_size_mb(table):
+    """Taille en mémoire d'une table (chaînes comprises, + coordonnées des géométries)"""
+    size = table.memory_usage(deep=True).sum()
+    # memory_usage ne compte que les pointeurs vers les objets shapely
+    if isinstance(table, gpd.GeoDataFrame):
+        size += shapely.get_num_coordinates(table.geometry.values).sum() * 16
+    return size / 1e6
+
+
+def measure_variant(variant, osm_file, sensors_file, bike_infra_file):
+    """
+    Pic RSS d'une variante de l'étape edge_features sur le réseau réel (dans ce processus)
+
+    Returns:
+        dict des mesures (Mo)
+    """
+    edges_lam = stages.load_osm(osm_file)
+    if sensors_file.exists():
+        sensors = stages.match_sensors(edges_lam, sensors_file, SENSOR_MAX_DISTANCE_M)
+    else:
+        sensors = {'edges_with_sensors': []}
+    bike_lanes = stages.bike_infra(edges_lam, bike_infra_file, BIKE_LANE_BUFFER_M, BIKE_LANE_MAX_DISTANCE_M)
+
+    inputs_peak = peak_rss_mb()
+    rss_before = current_rss_mb()
+    peak_scope = 'stage' if reset_peak_rss() else 'process'
+
+    table = VARIANTS[variant](edges_lam, sensors, bike_lanes)
+
+    return {
+        'variant': variant,
+        'edges': len(table),
+        'inputs_peak_rss_mb': inputs_peak,
+        'rss_before_mb': rss_before,
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_scope': peak_scope,
+        'rss_after_mb': current_rss_mb(),
+    }
+
+
+def run_network(osm_file, sensors_file, bike_infra_file):
+    """Mesure de chaque variante dans un processus séparé (pics RSS indépendants)"""
+    print(f"\n📂 Réseau: {osm_file}")
+    results = {}
+    for variant in VARIANTS:
+        command = [sys.executable, __file__, '--measure', variant, '--osm-file', str(osm_file),
+                   '--sensors-file', str(sensors_file), '--bike-infra-file', str(bike_infra_file)]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr)
+            raise RuntimeError(f"échec de la mesure {variant}")
+        # Dernière ligne : mesures JSON (les précédentes sont les sorties des étapes)
+        results[variant] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def fmt(value):
+        return f"{value:.1f} Mo" if value is not None else "n/d"
+
+    print(f"\n📏 {results['compact']['edges']:,} edges")
+    for variant, label in [('legacy', 'Ancienne table'), ('compact', 'Table compacte')]:
+        r = results[variant]
+        retained = (r['rss_after_mb'] - r['rss_before_mb']
+                    if r['rss_after_mb'] is not None and r['rss_before_mb'] is not None else None)
+        print(f"   • {label}: pic {fmt(r['peak_rss_mb'])} ({r['peak_rss_scope']}), "
+              f"avant l'étape {fmt(r['rss_before_mb'])}, conservé après l'étape {fmt(retained)}")
+
+    legacy_peak, compact_peak = results['legacy']['peak_rss_mb'], results['compact']['peak_rss_mb']
+    if legacy_peak and compact_peak:
+        print(f"   ✅ Pic RSS de l'étape: {legacy_peak:.1f} Mo → {compact_peak:.1f} Mo "
+              f"({compact_peak - legacy_peak:+.1f} Mo)")
+
+
+def run_synthetic(sizes):
+    """Taille en mémoire des deux tables sur des réseaux synthétiques, valeurs comparées"""
+    for n_edges in sizes:
+        edges, sensors, bike_lanes = synthetic_inputs(n_edges)
+
+        legacy = legacy_edge_features(edges, sensors, bike_lanes)
+        compact = stages.edge_features(edges, sensors, bike_lanes)
+
+        # Mêmes valeurs, types compacts (valeurs hors vocabulaire ramenées à la valeur de repli)
+        expected = pd.DataFrame(legacy[stages.EDGE_TABLE_COLUMNS])
+        for col in EDGE_CATEGORIES:
+            expected[col] = categorical_column(expected[col], col)
+        # Valeurs manquantes ramenées à NaN des deux côtés (None des catégories, NaN des flottants)
+        pd.testing.assert_frame_equal(
+            expected.astype(object).where(expected.notna(), np.nan),
+            compact.astype(object).where(compact.notna(), np.nan),
+            check_exact=False, rtol=1e-6
+        )
+
+        legacy_mb, compact_mb = table_size_mb(legacy), table_size_mb(compact)
+        print(f"\n📏 {n_edges:,} edges (synthétique)")
+        print(f"   • Ancienne table: {legacy_mb:.1f} Mo ({len(legacy.columns)} colonnes)")
+        print(f"   • Table compacte: {compact_mb:.1f} Mo ({len(compact.columns)} colonnes)")
+        print(f"   ✅ Valeurs identiques, table ×{legacy_mb / compact_mb:.1f} plus petite")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mémoire de la table des edges")
+    parser.add_argument('--osm-file', type=Path, default=DATA_RAW_DIR / "osm" / "osm_network.json",
+                        help="Réseau OSM mesuré (défaut: data/raw/osm/osm_network.json)")
+    parser.add_argument('--sensors-file', type=Path, default=DATA_RAW_DIR / "bike" / "bike_sensors_metadata.json",
+                        help="Capteurs (étape match_sensors)")
+    parser.add_argument('--bike-infra-file', type=Path, default=DATA_RAW_DIR / "bike" / "bike_infrastructure.json",
+                        help="Infrastructures cyclables (étape bike_infra)")
+    parser.add_argument('--synthetic', action='store_true',
+                        help="Tailles des tables sur des réseaux synthétiques au lieu du pic RSS")
+    parser.add_argument('--sizes', default='60000,600000',
+                        help="Nombres d'edges à tester (--synthetic), séparés par des virgules")
+    parser.add_argument('--measure', choices=sorted(VARIANTS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Processus fils : une variante, mesures JSON sur la dernière ligne
+    if args.measure:
+        print(json.dumps(measure_variant(args.measure, args.osm_file, args.sensors_file, args.bike_infra_file)))
+        return
+
+    print("="*80)
+    print("💾 BENCHMARK MÉMOIRE TABLE EDGES (ancienne vs compacte)")
+    print("="*80)
+
+    if args.synthetic:
+        run_synthetic([int(size) for size in args.sizes.split(',')])
+        return
+
+    if not args.osm_file.exists():
+        print(f"❌ Réseau non trouvé: {args.osm_file}")
+        print(f"💡 Lancez d'abord: python src/data_collection/fetch_osm_network.py (ou --synthetic)")
+        sys.exit(1)
+    run_network(args.osm_file, args.sensors_file, args.bike_infra_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Chargement des fichiers de comptage vélo
+Sources:
+- data/raw/bike/counters/bike_counts_YYYY-MM-DD.parquet : partitions journalières
+  (data_collection.counter_store)
+- data/raw/bike/bike_counters_YYYYMMDD_HHMMSS.json : anciens fichiers horaires, toujours lus ;
+  une mesure présente dans les deux est prise dans la partition
+
+Les fichiers sont décodés en parallèle (pool de threads, orjson si disponible) en ne
+gardant que les champs utiles (counter_id, timestamp, count). Les enregistrements déjà
+lus sont conservés dans un cache Parquet consolidé (data/processed/cache/counter_records.parquet) :
+seuls les fichiers nouveaux ou modifiés (taille/mtime) depuis leur mise en cache sont relus.
+"""
+
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import orjson
+except ImportError:  # dépendance optionnelle
+    orjson = None
+
+from data_collection.counter_store import STORE_DIRNAME, list_partitions, partition_date, read_partition
+
+COUNTER_FILE_PATTERN = "bike_counters_*.json"
+
+# bike_counters_YYYYMMDD_HHMMSS.json (exclut bike_counters_summary.json)
+_COUNTER_FILE_RE = re.compile(r"^bike_counters_(\d{8})_(\d{6})\.json$")
+
+# Champs des enregistrements utilisés par le preprocessing
+COUNTER_FIELDS = ['counter_id', 'timestamp', 'count']
+
+# Cache consolidé des enregistrements (dans data/processed/cache)
+COUNTER_CACHE_FILENAME = "counter_records.parquet"
+_CACHE_METADATA_KEY = b"counter_cache"
+_CACHE_VERSION = 1
+
+# Nombre de threads de lecture par défaut
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def list_counter_files(bike_data_dir):
+    """Liste triée des fichiers de comptage : anciens fichiers horaires puis partitions journalières"""
+    legacy_files = sorted(
+        path for path in bike_data_dir.glob(COUNTER_FILE_PATTERN)
+        if _COUNTER_FILE_RE.match(path.name)
+    )
+    return legacy_files + list_partitions(bike_data_dir / STORE_DIRNAME)
+
+
+def counter_file_date(path):
+    """Date des données d'un fichier de comptage ('YYYY-MM-DD'), None si nom non reconnu"""
+    if path.suffix == '.parquet':
+        return partition_date(path)
+    match = _COUNTER_FILE_RE.match(path.name)
+    if not match:
+        return None
+    day = match.group(1)
+    return f"{day[:4]}-{day[4:6]}-{day[6:]}"
+
+
+def _loads(raw):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _parse_counter_file(path):
+    """
+    Décode un fichier de comptage (seulement COUNTER_FIELDS)
+
+    Returns:
+        DataFrame, dict {champ: liste} pour un fichier horaire JSON, ou None si le
+        fichier est illisible
+    """
+    try:
+        if path.suffix == '.parquet':
+            return read_partition(path)
+        with open(path, 'rb') as f:
+            records = _loads(f.read()).get('records', [])
+    except Exception as e:
+        print(f"   ⚠️  Erreur lecture {path.name}: {e}")
+        return None
+
+    return {field: [record.get(field) for record in records] for field in COUNTER_FIELDS}
+
+
+def _file_key(path):
+    """Clé de validité d'un fichier dans le cache : [taille, mtime en ns]"""
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _records_frame(columns, source_file):
+    """DataFrame typé des enregistrements d'un fichier"""
+    df = pd.DataFrame(columns, columns=COUNTER_FIELDS)
+    df['counter_id'] = df['counter_id'].astype(str)
+    df['timestamp'] = pd.to_datetime(df['timestamp']).astype('datetime64[ns]')
+    df['count'] = pd.to_numeric(df['count'], errors='coerce')
+    df['source_file'] = source_file
+    return df
+
+
+def _read_cache(cache_path):
+    """Index {nom de fichier: [taille, mtime_ns]} du cache (vide si absent ou invalide)"""
+    if cache_path is None or not cache_path.exists():
+        return {}
+    try:
+        metadata = pq.read_schema(cache_path).metadata or {}
+        index = json.loads(metadata.get(_CACHE_METADATA_KEY, b'{}'))
+    except Exception as e:
+        print(f"   ⚠️  Cache des comptages illisible ({e}), reconstruction")
+        return {}
+    if index.get('version') != _CACHE_VERSION:
+        return {}
+    return index.get('files', {})
+
+
+def _write_cache(cache_path, df, index):
+    """Écriture atomique du cache (l'index des fichiers est stocké dans les métadonnées Parquet)"""
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_CACHE_METADATA_KEY] = json.dumps({'version': _CACHE_VERSION, 'files': index}).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    tmp_path = cache_path.with_suffix('.tmp')
+    pq.write_table(table, tmp_path)
+    tmp_path.replace(cache_path)
+
+
+def load_counter_files(files, cache_path=None, workers=DEFAULT_WORKERS, present_files=None):
+    """
+    Charge et concatène les enregistrements de plusieurs fichiers horaires
+
+    Args:
+        files: fichiers bike_counters_*.json à charger
+        cache_path: cache Parquet consolidé (None: pas de cache)
+        workers: nombre de threads de lecture
+        present_files: tous les fichiers de comptage existants, si files n'en est qu'une partie
+            (défaut: files) ; les enregistrements des autres fichiers (supprimés, ex. après
+            counter_store --migrate --delete-legacy) sont retirés du cache
+
+    Returns:
+        DataFrame des enregistrements ('counter_id', 'timestamp', 'count')
+    """
+    files = list(files)
+    index = _read_cache(cache_path)
+    keys = {path.name: _file_key(path) for path in files}
+    present_names = set(keys) if present_files is None else {path.name for path in present_files} | set(keys)
+    removed_names = set(index) - present_names
+
+    cached_names = {name for name, key in keys.items() if index.get(name) == key}
+    to_parse = [path for path in files if path.name not in cached_names]
+
+    # Fichiers nouveaux ou modifiés : décodage en parallèle
+    frames = []
+    if to_parse:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            parsed = list(executor.map(_parse_counter_file, to_parse))
+        frames = [
+            _records_frame(columns, path.name)
+            for path, columns in zip(to_parse, parsed) if columns is not None
+        ]
+
+    cached = pd.read_parquet(cache_path) if index else None
+
+    if cache_path is not None:
+        print(f"   • Cache: {len(cached_names)} fichiers en cache, {len(to_parse)} fichiers lus"
+              + (f", {len(removed_names)} fichiers disparus retirés" if removed_names else ""))
+
+        # Mise à jour du cache : les fichiers relus remplacent leurs anciens enregistrements,
+        # ceux des fichiers disparus sont retirés
+        if frames or removed_names:
+            parsed_names = {path.name for path, columns in zip(to_parse, parsed) if columns is not None} if frames else set()
+            new_index = {name: key for name, key in index.items()
+                         if name not in parsed_names and name not in removed_names}
+            new_index.update({name: keys[name] for name in parsed_names})
+
+            kept = [] if cached is None else [cached[cached['source_file'].isin(new_index.keys() - parsed_names)]]
+            store = pd.concat(kept + frames, ignore_index=True)
+            store['source_file'] = store['source_file'].astype('category')
+            _write_cache(cache_path, store, new_index)
+
+    parts = []
+    if cached is not None and cached_names:
+        parts.append(cached[cached['source_file'].isin(cached_names)])
+    parts.extend(frames)
+
+    if not parts:
+        bike_df = pd.DataFrame(columns=COUNTER_FIELDS)
+        bike_df['timestamp'] = pd.to_datetime(bike_df['timestamp'])
+        return bike_df
+
+    bike_df = pd.concat(parts, ignore_index=True)
+
+    # Heures présentes à la fois dans un ancien fichier horaire et dans une partition
+    from_store = bike_df['source_file'].astype(str).str.endswith('.parquet').to_numpy()
+    if from_store.any() and not from_store.all():
+        order = np.argsort(from_store, kind='stable')
+        bike_df = bike_df.iloc[order].drop_duplicates(['counter_id', 'timestamp'], keep='last')
+
+    return bike_df[COUNTER_FIELDS].reset_index(drop=True)
@@ -5,23 +5,37 @@ Adapté à la nouvelle structure d'ingestion avec scripts séparés par source
 
 Sources:
 1. OSM network (data/raw/osm/osm_network.json)
-2. Bike counters (data/raw/bike/bike_counters_YYYYMMDD_HHMMSS.json) - fichiers horaires
+2. Bike counters (data/raw/bike/counters/bike_counts_YYYY-MM-DD.parquet) - partitions journalières
+   (anciens fichiers horaires bike_counters_YYYYMMDD_HHMMSS.json toujours lus)
 3. Bike sensors metadata (data/raw/bike/bike_sensors_metadata.json)
 4. Bike infrastructure (data/raw/bike/bike_infrastructure.json)
-5. Weather (data/raw/weather/weather_data_YYYYMMDD_HHMMSS.json) - fichiers horaires
+5. Weather (data/raw/weather/archive/weather_YYYY-MM-DD.parquet) - archive journalière
+   (anciens fichiers weather_data*.json encore lus)
 
 Dataset de sortie:
 - Training: edges avec capteurs uniquement (pour entraînement)
 - Les zones grises seront prédites par le script de prédiction
+
+Étapes (preprocessing.stages), chacune en cache dans data/processed/cache/stages/ et
+recalculée seulement si ses entrées, ses paramètres ou une étape amont ont changé:
+load_osm → match_sensors, bike_infra → edge_features ; load_osm → road_graph → sensor_weights ;
+weather ; → temporal → spatial → lags
+
+Mode tuilé (--tile-size-km, preprocessing.tiling): le réseau est découpé en tuiles traitées
+dans un pool de processus, pour les zones trop grandes pour être chargées en entier.
+
+Usage:
+    python src/preprocessing/create_ml_dataset_v3.py [--force] [--from-stage STAGE] [--only STAGE,...]
+    python src/preprocessing/create_ml_dataset_v3.py --tile-size-km 5 [--halo-m 1000] [--workers 8]
 """
 
-import json
+import sys
+import time
+import argparse
+from functools import partial
 import pandas as pd
 import geopandas as gpd
 from pathlib import Path
-from datetime import datetime
-import numpy as np
-from shapely.geometry import Point
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -31,452 +45,386 @@ DATA_RAW_DIR = BASE_DIR / "data" / "raw"
 DATA_PROCESSED_DIR = BASE_DIR / "data" / "processed"
 DATA_PROCESSED_DIR.mkdir(exist_ok=True)
 
-print("="*80)
-print("🔧 CRÉATION DATASET ML - VERSION 3 (Architecture Modulaire)")
-print("="*80)
+# Ajouter le répertoire src au path
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+from preprocessing.weather_alignment import WeatherAligner, find_weather_files, load_weather_files
+from preprocessing.dataset_io import DATASET_DIRNAME, write_dataset
+from preprocessing.counter_loader import COUNTER_CACHE_FILENAME, list_counter_files
+from preprocessing.temporal_dataset import EDGE_FEATURE_COLUMNS
+from preprocessing.lag_features import DEFAULT_LAG_FEATURES, LAG_FEATURE_SPECS, parse_lag_features
+from preprocessing.manifest import InputManifest, MANIFEST_FILENAME
+from preprocessing.incremental import (
+    SENSOR_EDGES_FILENAME, incremental_blockers, run_incremental, save_sensor_edges
+)
+from preprocessing.pipeline import Pipeline, Stage, StageCache, StageUnavailable
+from preprocessing.profiling import PROFILE_FILENAME, Profiler
+from preprocessing import stages
+from preprocessing.stages import EDGE_TABLE_COLUMNS
+from preprocessing.edge_store import (
+    EDGE_STORE_DIRNAME, EDGE_STORE_FILENAME, EDGE_SCHEMA_FILENAME,
+    edge_store_exists, write_edge_store, write_partitioned_edge_store
+)
+from preprocessing import tiling
+from preprocessing.road_graph import ROAD_GRAPH_FILENAME, build_road_graph, save_road_graph
+from preprocessing.spatial_propagation import (
+    SENSOR_WEIGHTS_FILENAME, add_spatial_features, save_sensor_weights, sensor_weights
+)
+from preprocessing.tiling import DEFAULT_HALO_M, FEATURES_DIRNAME, TILES_DIRNAME
 
-# =====================================================================
-# ÉTAPE 1: CHARGER RÉSEAU OSM
-# =====================================================================
+DATA_CACHE_DIR = DATA_PROCESSED_DIR / "cache"
 
-print("\n📍 Étape 1: Chargement réseau OSM...")
+# Écart maximal (heures) entre un timestamp et la mesure météo précédente retenue
+WEATHER_MAX_STALENESS_H = 3
 
-osm_file = DATA_RAW_DIR / "osm" / "osm_network.json"
-if not osm_file.exists():
-    print(f"❌ Fichier OSM manquant: {osm_file}")
-    print("💡 Exécuter d'abord: python src/data_collection/fetch_osm_network.py")
-    exit(1)
+# Rayon (m) d'association capteur → edge
+MAX_DISTANCE = 50
 
-with open(osm_file, 'r') as f:
-    osm_data = json.load(f)
+# Rayon (m) en dessous duquel un edge a une piste cyclable dédiée
+BIKE_LANE_BUFFER_M = 20
+# Rayon plafond (m) de recherche de la piste la plus proche (None = halo --halo-m).
+# Toujours borné au halo, pour un même plafond en mode normal et en mode tuilé
+BIKE_LANE_MAX_DISTANCE = None
+
+# Pas (m) de regroupement des sommets OSM en nœuds du graphe routier
+ROAD_GRAPH_SNAP_M = 0.5
+
+# Propagation spatiale : distance réseau (m) maximale edge → capteur et décroissance des poids
+SPATIAL_RADIUS_M = 2000
+SPATIAL_BANDWIDTH_M = 500
+
+STAGE_NAMES = [
+    'load_osm', 'match_sensors', 'bike_infra', 'weather', 'edge_features', 'road_graph',
+    'sensor_weights', 'temporal', 'spatial', 'lags'
+]
+
+
+def parse_stage_names(value):
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in STAGE_NAMES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"étapes inconnues: {', '.join(unknown)} (disponibles: {','.join(STAGE_NAMES)})")
+    return names
+
+
+def parse_profile_stage(value):
+    if value != 'auto' and value not in STAGE_NAMES + ['save', 'incremental']:
+        raise argparse.ArgumentTypeError(f"étape inconnue: {value} (disponibles: {','.join(STAGE_NAMES)},save,incremental)")
+    return value
+
+
+parser = argparse.ArgumentParser(description="Créer le dataset ML v3 à partir des données brutes")
+parser.add_argument('--incremental', action='store_true',
+                    help='Ne traiter que les fichiers de comptage nouveaux/modifiés depuis le dernier run')
+parser.add_argument('--lag-features', type=parse_lag_features, default=DEFAULT_LAG_FEATURES,
+                    help=f"Lag features à calculer, séparées par des virgules "
+                         f"(défaut: {','.join(DEFAULT_LAG_FEATURES)} ; disponibles: {','.join(LAG_FEATURE_SPECS)})")
+parser.add_argument('--from-stage', choices=STAGE_NAMES,
+                    help="Recalculer cette étape et toutes celles qui en dépendent")
+parser.add_argument('--only', type=parse_stage_names,
+                    help=f"N'exécuter que ces étapes, séparées par des virgules "
+                         f"(étapes amont lues en cache) ; étapes: {','.join(STAGE_NAMES)}")
+parser.add_argument('--force', action='store_true',
+                    help='Recalculer toutes les étapes sans consulter le cache')
+parser.add_argument('--tile-size-km', type=float, default=None,
+                    help="Mode tuilé (réseaux plus grands que la mémoire): côté des tuiles en km "
+                         "(ex: 5 ; défaut: réseau chargé en entier)")
+parser.add_argument('--halo-m', type=float, default=DEFAULT_HALO_M,
+                    help=f"Halo (m) de recherche des pistes cyclables autour de chaque tuile ; "
+                         f"distance à la piste bornée à ce rayon dans les deux modes (défaut: {DEFAULT_HALO_M:g})")
+parser.add_argument('--workers', type=int, default=tiling.DEFAULT_WORKERS,
+                    help=f"Mode tuilé: nombre de processus (défaut: {tiling.DEFAULT_WORKERS})")
+parser.add_argument('--profile', nargs='?', const='auto', type=parse_profile_stage,
+                    help="Profiler par cProfile et écrire le .pstats de l'étape la plus lente "
+                         "(ou de l'étape indiquée) dans data/processed")
+args = parser.parse_args()
+
+if args.tile_size_km is not None and args.tile_size_km <= 0:
+    parser.error("--tile-size-km doit être positif")
+if args.halo_m < BIKE_LANE_BUFFER_M:
+    parser.error(f"--halo-m doit être au moins égal au rayon de piste dédiée ({BIKE_LANE_BUFFER_M}m)")
+
+# Plafond commun aux deux modes : le mode tuilé ne voit pas les pistes au-delà du halo
+bike_lane_max_distance = (args.halo_m if BIKE_LANE_MAX_DISTANCE is None
+                          else min(BIKE_LANE_MAX_DISTANCE, args.halo_m))
 
-edges_gdf = gpd.GeoDataFrame.from_features(
-    osm_data['geojson']['features'],
-    crs="EPSG:4326"
-)
+print("="*80)
+print("🔧 CRÉATION DATASET ML - VERSION 3 (Architecture Modulaire)")
+print("="*80)
 
-print(f"   ✅ {len(edges_gdf)} edges OSM chargés")
+# Temps, CPU, pic RSS et lignes par étape (data/processed/preprocess_profile.json)
+profiler = Profiler(cprofile=args.profile)
 
-# =====================================================================
-# ÉTAPE 2: CHARGER MÉTADONNÉES DES CAPTEURS VÉLO
-# =====================================================================
 
-print("\n🚴 Étape 2: Chargement métadonnées capteurs vélo...")
+def write_profile(mode):
+    """Tableau récapitulatif + profil JSON (+ cProfile de l'étape la plus lente si --profile)"""
+    print("\n⏱️  Profil par étape:")
+    profiler.print_summary()
+    profile_path = profiler.write(
+        DATA_PROCESSED_DIR / PROFILE_FILENAME, mode=mode, tile_size_km=args.tile_size_km,
+        workers=args.workers if args.tile_size_km else None, argv=sys.argv[1:]
+    )
+    print(f"   ✅ Profil sauvegardé: {profile_path.name}")
+    if args.profile:
+        pstats_path = profiler.dump_slowest(DATA_PROCESSED_DIR)
+        if pstats_path is not None:
+            print(f"   ✅ cProfile sauvegardé: {pstats_path.name} (python -m pstats {pstats_path})")
 
-sensors_file = DATA_RAW_DIR / "bike" / "bike_sensors_metadata.json"
-if not sensors_file.exists():
-    print(f"❌ Fichier capteurs manquant: {sensors_file}")
-    print("💡 Exécuter d'abord: python src/data_collection/fetch_bike_counters.py")
-    exit(1)
 
-with open(sensors_file, 'r') as f:
-    sensors_data = json.load(f)
+osm_file = DATA_RAW_DIR / "osm" / "osm_network.json"
+sensors_file = DATA_RAW_DIR / "bike" / "bike_sensors_metadata.json"
+bike_infra_file = DATA_RAW_DIR / "bike" / "bike_infrastructure.json"
+static_files = [osm_file, sensors_file, bike_infra_file]
 
-sensors_info = sensors_data['sensors']
-print(f"   ✅ {len(sensors_info)} capteurs chargés")
+parquet_path = DATA_PROCESSED_DIR / DATASET_DIRNAME
+manifest = InputManifest(DATA_PROCESSED_DIR / MANIFEST_FILENAME, DATA_RAW_DIR)
 
 # =====================================================================
-# ÉTAPE 3: ASSOCIATION SPATIALE CAPTEURS → EDGES
+# MODE INCRÉMENTAL: seulement les nouveaux fichiers de comptage
 # =====================================================================
 
-print("\n🗺️  Étape 3: Association spatiale capteurs → edges...")
-
-# Créer GeoDataFrame des capteurs
-sensors_list = []
-for counter_id, info in sensors_info.items():
-    if info['lat'] and info['lon']:
-        sensors_list.append({
-            'counter_id': counter_id,
-            'name': info['name'],
-            'geometry': Point(info['lon'], info['lat'])
-        })
-
-sensors_gdf = gpd.GeoDataFrame(sensors_list, crs="EPSG:4326")
-print(f"   • {len(sensors_gdf)} capteurs avec coordonnées")
-
-# Convertir en Lambert 93 pour calculs de distance
-edges_lam = edges_gdf.to_crs("EPSG:2154")
-sensors_lam = sensors_gdf.to_crs("EPSG:2154")
-
-# Association capteur → edge (rayon 50m)
-sensor_to_edge = {}
-MAX_DISTANCE = 50
-
-for idx, sensor in sensors_lam.iterrows():
-    distances = edges_lam.geometry.distance(sensor.geometry)
-    min_dist_idx = distances.idxmin()
-    min_dist = distances[min_dist_idx]
+if args.incremental:
+    print("\n⚡ Mode incrémental...")
+    weather_files = find_weather_files(DATA_RAW_DIR / "weather")
+    blocker = incremental_blockers(
+        manifest, static_files, parquet_path, DATA_PROCESSED_DIR, args.lag_features,
+        weather_dir=DATA_RAW_DIR / "weather", weather_files=weather_files
+    )
     
-    if min_dist <= MAX_DISTANCE:
-        edge_osm_id = edges_lam.loc[min_dist_idx, 'osm_id']
-        sensor_to_edge[sensor['counter_id']] = {
-            'edge_id': edge_osm_id,
-            'distance_m': round(min_dist, 1),
-            'sensor_name': sensor['name']
-        }
-
-print(f"   ✅ {len(sensor_to_edge)} capteurs associés à des edges (≤{MAX_DISTANCE}m)")
-
-edges_with_sensors = list(set(info['edge_id'] for info in sensor_to_edge.values()))
-print(f"   ✅ {len(edges_with_sensors)} edges uniques avec capteurs")
+    if blocker:
+        print(f"   ⚠️  Impossible ({blocker}) → reconstruction complète")
+    else:
+        incremental_start = time.perf_counter()
+        
+        if not weather_files:
+            print(f"❌ Aucun fichier météo trouvé dans {DATA_RAW_DIR / 'weather'}")
+            print("💡 Exécuter d'abord: python src/data_collection/fetch_weather.py")
+            exit(1)
+        
+        weather_aligner = WeatherAligner(
+            load_weather_files(weather_files),
+            max_staleness=pd.Timedelta(hours=WEATHER_MAX_STALENESS_H),
+            direction='backward'
+        )
+        
+        with profiler.stage('incremental') as record:
+            stats = run_incremental(
+                manifest, DATA_RAW_DIR / "bike", DATA_PROCESSED_DIR, parquet_path, weather_aligner,
+                lag_features=args.lag_features, weather_dir=DATA_RAW_DIR / "weather",
+                weather_files=weather_files
+            )
+            record['rows'] = stats['rows']
+        
+        print(f"   ⏱️  Durée: {time.perf_counter() - incremental_start:.2f}s")
+        print("   💡 final_dataset_v3.csv n'est pas régénéré en mode incrémental")
+        write_profile('incremental')
+        print("\n" + "="*80)
+        print("✅ PREPROCESSING INCRÉMENTAL TERMINÉ!")
+        print("="*80)
+        sys.exit(0)
 
 # =====================================================================
-# ÉTAPE 4: CHARGER DONNÉES DE COMPTAGE VÉLO (fichiers horaires)
+# ENTRÉES
 # =====================================================================
 
-print("\n📊 Étape 4: Chargement données de comptage vélo...")
+if not osm_file.exists():
+    print(f"❌ Fichier OSM manquant: {osm_file}")
+    print("💡 Exécuter d'abord: python src/data_collection/fetch_osm_network.py")
+    exit(1)
+
+if not sensors_file.exists():
+    print(f"❌ Fichier capteurs manquant: {sensors_file}")
+    print("💡 Exécuter d'abord: python src/data_collection/fetch_bike_counters.py")
+    exit(1)
 
 bike_data_dir = DATA_RAW_DIR / "bike"
-bike_counter_files = sorted(bike_data_dir.glob("bike_counters_*.json"))
+bike_counter_files = list_counter_files(bike_data_dir)
 
 if not bike_counter_files:
     print(f"❌ Aucun fichier de comptage trouvé dans {bike_data_dir}")
     print("💡 Exécuter d'abord: python src/data_collection/fetch_bike_counters.py")
     exit(1)
 
-print(f"   • {len(bike_counter_files)} fichiers de comptage trouvés")
-
-# Charger tous les fichiers horaires
-all_bike_records = []
-for bike_file in bike_counter_files:
-    try:
-        with open(bike_file, 'r') as f:
-            data = json.load(f)
-            records = data.get('records', [])
-            all_bike_records.extend(records)
-    except Exception as e:
-        print(f"   ⚠️  Erreur lecture {bike_file.name}: {e}")
-
-bike_df = pd.DataFrame(all_bike_records)
-bike_df['timestamp'] = pd.to_datetime(bike_df['timestamp'])
-
-# Associer edges
-bike_df['edge_id'] = bike_df['counter_id'].map(
-    lambda x: sensor_to_edge.get(x, {}).get('edge_id')
-)
-bike_df = bike_df[bike_df['edge_id'].notna()].copy()
-
-print(f"   ✅ {len(bike_df):,} mesures chargées")
-print(f"   📅 Période: {bike_df['timestamp'].min()} → {bike_df['timestamp'].max()}")
-
-# =====================================================================
-# ÉTAPE 5: ENRICHIR AVEC INFRASTRUCTURE CYCLABLE
-# =====================================================================
-
-print("\n🚲 Étape 5: Enrichissement infrastructure cyclable...")
-
-bike_infra_file = DATA_RAW_DIR / "bike" / "bike_infrastructure.json"
+weather_data_dir = DATA_RAW_DIR / "weather"
 
-if bike_infra_file.exists():
-    with open(bike_infra_file, 'r') as f:
-        bike_infra_data = json.load(f)
-    
-    bike_lines_gdf = gpd.GeoDataFrame.from_features(
-        bike_infra_data['geojson']['features'],
-        crs="EPSG:4171"  # RGF93
-    ).to_crs("EPSG:2154")
-    
-    print(f"   • Calcul distances pistes cyclables (spatial join optimisé)...")
-    
-    # Méthode optimisée : spatial join avec buffer
-    # Créer un buffer de 20m autour des pistes cyclables
-    bike_lines_buffered = bike_lines_gdf.copy()
-    bike_lines_buffered['geometry'] = bike_lines_buffered.geometry.buffer(20)
-    
-    # Spatial join : edges qui intersectent le buffer ont une piste à <20m
-    edges_with_lanes = gpd.sjoin(
-        edges_lam,
-        bike_lines_buffered[['geometry']],
-        how='left',
-        predicate='intersects'
-    )
-    
-    # Gérer les duplicatas : un edge peut intersecter plusieurs bike lanes
-    # On ne garde que l'info binaire (a ou n'a pas de bike lane proche)
-    edges_with_bike_lane = edges_with_lanes[edges_with_lanes['index_right'].notna()].index.unique()
-    edges_gdf['has_dedicated_bike_lane'] = False
-    edges_gdf.loc[edges_with_bike_lane, 'has_dedicated_bike_lane'] = True
-    
-    # Pour la distance exacte, on le fait seulement pour les edges AVEC capteurs (optimisation)
-    edges_with_sensors_set = set(edges_with_sensors)
-    edges_gdf['bike_lane_distance_m'] = 999999.0
-    
-    print(f"   • Calcul distances exactes pour edges avec capteurs...")
-    for idx, row in edges_lam[edges_lam['osm_id'].isin(edges_with_sensors_set)].iterrows():
-        distances = bike_lines_gdf.geometry.distance(row.geometry)
-        if len(distances) > 0:
-            edges_gdf.at[idx, 'bike_lane_distance_m'] = distances.min()
-    
-    bike_lane_count = edges_gdf['has_dedicated_bike_lane'].sum()
-    print(f"   ✅ {bike_lane_count} edges avec piste cyclable dédiée (<20m)")
-else:
-    print("   ⚠️  Infrastructure cyclable non trouvée, skip")
-    edges_gdf['has_dedicated_bike_lane'] = False
-    edges_gdf['bike_lane_distance_m'] = 999999.0
+# Archive journalière, puis anciens fichiers JSON
+weather_files = find_weather_files(weather_data_dir)
+if not weather_files:
+    print(f"❌ Aucun fichier météo trouvé dans {weather_data_dir}")
+    print("💡 Exécuter d'abord: python src/data_collection/fetch_weather.py")
+    exit(1)
 
 # =====================================================================
-# ÉTAPE 6: CHARGER DONNÉES MÉTÉO (fichiers horaires)
+# ÉTAPES 1-9: PIPELINE (chaque étape en cache dans data/processed/cache/stages)
 # =====================================================================
 
-print("\n🌤️  Étape 6: Chargement données météo...")
-
-weather_data_dir = DATA_RAW_DIR / "weather"
-
-# Chercher d'abord fichiers timestampés, sinon fichier unique
-weather_files = sorted(weather_data_dir.glob("weather_data_*.json"))
-
-if weather_files:
-    # Prendre le fichier le plus récent (timestampé)
-    weather_file = weather_files[-1]
-    print(f"   • Utilisation: {weather_file.name}")
+if args.tile_size_km:
+    # Mode tuilé : mêmes étapes, calculées tuile par tuile (preprocessing.tiling)
+    tiles_dir = DATA_CACHE_DIR / TILES_DIRNAME
+    network_stages = [
+        Stage('load_osm', partial(tiling.partition_network, osm_file, tiles_dir),
+              "📍 Découpage du réseau OSM en tuiles", inputs=[osm_file],
+              params={'tile_size_m': args.tile_size_km * 1000}),
+        Stage('match_sensors', partial(tiling.match_sensors_tiled, sensors_file=sensors_file, workers=args.workers),
+              "🗺️  Association spatiale capteurs → edges (par tuile)",
+              deps=['load_osm'], inputs=[sensors_file], params={'max_distance': MAX_DISTANCE}),
+        Stage('bike_infra', partial(tiling.partition_bike_lanes, bike_infra_file, tiles_dir),
+              "🚲 Préparation infrastructure cyclable", inputs=[bike_infra_file]),
+        Stage('weather', partial(stages.load_weather, weather_files),
+              "🌤️  Chargement données météo", inputs=weather_files),
+        Stage('edge_features', partial(
+                  tiling.edge_features_tiled, features_dir=tiles_dir / FEATURES_DIRNAME, workers=args.workers
+              ),
+              "🔧 Calcul features edges (par tuile)", deps=['load_osm', 'match_sensors', 'bike_infra'],
+              params={'buffer_m': BIKE_LANE_BUFFER_M, 'max_distance': bike_lane_max_distance,
+                      'halo_m': args.halo_m}),
+        Stage('road_graph', tiling.road_graph_tiled,
+              "🕸️  Construction du graphe routier", deps=['load_osm'], params={'snap_m': ROAD_GRAPH_SNAP_M}),
+    ]
+    temporal_func = tiling.temporal
 else:
-    # Essayer fichier unique (ancien format)
-    weather_file = weather_data_dir / "weather_data.json"
-    if not weather_file.exists():
-        print(f"❌ Aucun fichier météo trouvé dans {weather_data_dir}")
-        print("💡 Exécuter d'abord: python src/data_collection/fetch_weather.py")
-        exit(1)
-    print(f"   • Utilisation: {weather_file.name}")
+    network_stages = [
+        Stage('load_osm', partial(stages.load_osm, osm_file),
+              "📍 Chargement réseau OSM", inputs=[osm_file], version=2),
+        Stage('match_sensors', partial(stages.match_sensors, sensors_file=sensors_file),
+              "🗺️  Association spatiale capteurs → edges",
+              deps=['load_osm'], inputs=[sensors_file], params={'max_distance': MAX_DISTANCE}),
+        Stage('bike_infra', partial(stages.bike_infra, bike_infra_file=bike_infra_file),
+              "🚲 Enrichissement infrastructure cyclable",
+              deps=['load_osm'], inputs=[bike_infra_file],
+              params={'buffer_m': BIKE_LANE_BUFFER_M, 'max_distance': bike_lane_max_distance}),
+        Stage('weather', partial(stages.load_weather, weather_files),
+              "🌤️  Chargement données météo", inputs=weather_files),
+        Stage('edge_features', stages.edge_features,
+              "🔧 Calcul features edges", deps=['load_osm', 'match_sensors', 'bike_infra'], version=2),
+        Stage('road_graph', build_road_graph,
+              "🕸️  Construction du graphe routier", deps=['load_osm'], params={'snap_m': ROAD_GRAPH_SNAP_M}),
+    ]
+    temporal_func = stages.temporal
+
+pipeline = Pipeline(network_stages + [
+    Stage('sensor_weights', sensor_weights,
+          "🧮 Poids de propagation spatiale edge → capteur", deps=['road_graph', 'match_sensors'],
+          params={'radius_m': SPATIAL_RADIUS_M, 'bandwidth_m': SPATIAL_BANDWIDTH_M}),
+    Stage('temporal', partial(
+              temporal_func,
+              counter_files=bike_counter_files,
+              counter_cache_path=DATA_CACHE_DIR / COUNTER_CACHE_FILENAME
+          ),
+          "📊 Création dataset temporel (training)",
+          deps=['match_sensors', 'edge_features', 'weather'], inputs=bike_counter_files,
+          params={'weather_max_staleness_h': WEATHER_MAX_STALENESS_H}),
+    Stage('spatial', add_spatial_features,
+          "📡 Propagation spatiale des comptages", deps=['temporal', 'sensor_weights']),
+    Stage('lags', stages.lags,
+          "🔁 Calcul lag features", deps=['spatial'], params={'features': list(args.lag_features)}),
+], StageCache(DATA_CACHE_DIR), profiler=profiler)
+
+pipeline_start = time.perf_counter()
+
+try:
+    pipeline.run(only=args.only, from_stage=args.from_stage, force=args.force)
+except StageUnavailable as e:
+    print(f"\n❌ Impossible: {e}")
+    exit(1)
 
-with open(weather_file, 'r') as f:
-    weather_data = json.load(f)
+print(f"\n⏱️  Pipeline: {time.perf_counter() - pipeline_start:.2f}s "
+      f"({len(pipeline.ran)} étape(s) recalculée(s): {', '.join(pipeline.ran) or 'aucune'})")
 
-weather_df = pd.DataFrame(weather_data['weather_data'])
-weather_df['timestamp'] = pd.to_datetime(weather_df['timestamp'])
+if args.only and 'lags' not in args.only:
+    print("\n💡 --only sans l'étape lags: dataset final non régénéré")
+    write_profile('only')
+    sys.exit(0)
 
-print(f"   ✅ {len(weather_df)} mesures météo horaires")
+sensor_to_edge = pipeline.result('match_sensors')['sensor_to_edge']
+edges_with_sensors = pipeline.result('match_sensors')['edges_with_sensors']
+final_df = pipeline.result('lags')
 
 # =====================================================================
-# ÉTAPE 7: CALCULER FEATURES EDGES (TOUS)
+# ÉTAPE 10: SAUVEGARDER
 # =====================================================================
 
-print("\n🔧 Étape 7: Calcul features edges...")
-
-# Marquer edges avec capteurs
-edges_gdf['has_real_sensor'] = edges_gdf['osm_id'].isin(edges_with_sensors)
-
-# Convertir en Lambert 93
-edges_lam = edges_gdf.to_crs("EPSG:2154")
-
-# Distance au centre (Place Bellecour)
-center_point = gpd.GeoDataFrame(
-    geometry=[Point(4.8320, 45.7578)],
-    crs="EPSG:4326"
-).to_crs("EPSG:2154").iloc[0].geometry
-
-edges_gdf['distance_to_center_km'] = (
-    edges_lam.geometry.distance(center_point) / 1000
-)
-
-# Longueur edge
-edges_gdf['edge_length_m'] = edges_lam.geometry.length
-
-# Orientation
-def calc_orientation(geom):
-    coords = list(geom.coords)
-    if len(coords) < 2:
-        return None
-    dx = coords[-1][0] - coords[0][0]
-    dy = coords[-1][1] - coords[0][1]
-    angle = np.degrees(np.arctan2(dy, dx))
-    if angle < 0:
-        angle += 360
-    
-    # Catégoriser
-    if angle < 22.5 or angle >= 337.5:
-        return 'E'
-    elif angle < 67.5:
-        return 'NE'
-    elif angle < 112.5:
-        return 'N'
-    elif angle < 157.5:
-        return 'NW'
-    elif angle < 202.5:
-        return 'W'
-    elif angle < 247.5:
-        return 'SW'
-    elif angle < 292.5:
-        return 'S'
-    else:
-        return 'SE'
-
-edges_gdf['orientation'] = edges_lam.geometry.apply(calc_orientation)
-
-# Attributs OSM
-edges_gdf['highway_type'] = edges_gdf['highway'].fillna('unknown')
-
-def categorize_road(highway_type):
-    if highway_type in ['motorway', 'trunk']:
-        return 'major'
-    elif highway_type in ['primary', 'secondary']:
-        return 'arterial'
-    elif highway_type in ['tertiary', 'residential']:
-        return 'local'
-    elif highway_type in ['cycleway', 'path']:
-        return 'bike_path'
-    else:
-        return 'other'
-
-edges_gdf['road_category'] = edges_gdf['highway_type'].apply(categorize_road)
+with profiler.stage('save') as save_record:
+    print("\n💾 Étape 10: Sauvegarde...")
 
-edges_gdf['maxspeed_kmh'] = edges_gdf['maxspeed'].apply(
-    lambda x: int(x) if pd.notna(x) and str(x).isdigit() else 50
-)
+    # Les sorties ne sont réécrites que si les étapes qui les produisent ont été recalculées
+    output_path = DATA_PROCESSED_DIR / "final_dataset_v3.csv"
+    edges_static_path = DATA_PROCESSED_DIR / "edges_static_v3.gpkg"
 
-edges_gdf['lanes'] = edges_gdf['lanes'].apply(
-    lambda x: int(x) if pd.notna(x) and str(x).isdigit() else 2
-)
+    if 'lags' in pipeline.ran or not parquet_path.is_dir() or not output_path.exists():
+        # Parquet partitionné par date, types compacts (lu par l'entraînement et l'analyse)
+        partitions = write_dataset(final_df, parquet_path)
+        print(f"   ✅ Dataset Parquet sauvegardé: {parquet_path.name}/ ({len(partitions)} partitions journalières)")
 
-edges_gdf['is_oneway'] = edges_gdf['oneway'] == 'yes'
-edges_gdf['cycleway_type'] = edges_gdf['cycleway'].fillna('none')
-
-def categorize_surface(surface):
-    if pd.isna(surface):
-        return 'unknown'
-    surface = str(surface).lower()
-    if surface in ['asphalt', 'paved']:
-        return 'good'
-    elif surface in ['concrete', 'paving_stones']:
-        return 'medium'
+        # Export CSV (consultation / outils externes)
+        final_df.to_csv(output_path, index=False)
+        print(f"   ✅ Dataset sauvegardé: {output_path.name}")
     else:
-        return 'poor'
-
-edges_gdf['surface_quality'] = edges_gdf['surface'].apply(categorize_surface)
-edges_gdf['bicycle_access'] = edges_gdf['bicycle'].fillna('yes')
-edges_gdf['is_lit'] = edges_gdf['lit'] == 'yes'
-edges_gdf['has_cycleway'] = edges_gdf['cycleway'].notna()
-
-print(f"   ✅ Features calculées pour {len(edges_gdf)} edges")
+        print(f"   ♻️  {parquet_path.name}/ et {output_path.name} à jour")
 
-# Sauvegarder edges statiques
-edges_static = edges_gdf[[
-    'osm_id', 'name', 'highway_type', 'road_category', 'lanes', 'maxspeed_kmh',
-    'is_oneway', 'has_cycleway', 'cycleway_type', 'has_dedicated_bike_lane',
-    'bike_lane_distance_m', 'surface_quality', 'bicycle_access', 'is_lit',
-    'edge_length_m', 'distance_to_center_km', 'orientation', 'geometry', 'has_real_sensor'
-]].copy()
-
-edges_static_path = DATA_PROCESSED_DIR / "edges_static_v3.gpkg"
-edges_static.to_file(edges_static_path, driver="GPKG")
-print(f"   ✅ Edges statiques sauvegardés: {edges_static_path.name}")
-
-# =====================================================================
-# ÉTAPE 8: CRÉER DATASET TEMPOREL (edges avec capteurs uniquement)
-# =====================================================================
+    edges_static_outdated = ('edge_features' in pipeline.ran or not edges_static_path.exists()
+                             or not edge_store_exists(DATA_PROCESSED_DIR))
 
-print("\n📊 Étape 8: Création dataset temporel (training)...")
+    if edges_static_outdated and args.tile_size_km:
+        tiled_edges = pipeline.result('edge_features')
 
-# Obtenir timestamps uniques
-timestamps = sorted(bike_df['timestamp'].unique())
-print(f"   • {len(timestamps)} timestamps uniques")
-print(f"   • {len(edges_with_sensors)} edges avec capteurs")
-print(f"   • Dataset: {len(edges_with_sensors)} × {len(timestamps)} = {len(edges_with_sensors) * len(timestamps):,} lignes")
+        # Magasin partitionné (une table par tuile) et GeoPackage écrit tuile par tuile
+        store_dir = write_partitioned_edge_store(tiled_edges['partitions'], DATA_PROCESSED_DIR)
+        print(f"   ✅ Magasin des edges sauvegardé: {store_dir.name}/ "
+              f"({len(tiled_edges['partitions'])} tuiles) + {EDGE_SCHEMA_FILENAME}")
 
-# Lookup dictionnaires pour optimisation
-edges_dict = {}
-for idx, row in edges_gdf.iterrows():
-    edges_dict[row['osm_id']] = row.to_dict()
+        tiling.write_geopackage(pipeline.result('load_osm'), tiled_edges, edges_static_path)
+        print(f"   ✅ Edges statiques sauvegardés: {edges_static_path.name}")
+    elif edges_static_outdated:
+        edges = pipeline.result('edge_features')[EDGE_TABLE_COLUMNS]
 
-bike_lookup = {}
-for _, row in bike_df.iterrows():
-    key = (row['edge_id'], row['timestamp'])
-    if key not in bike_lookup:
-        bike_lookup[key] = 0
-    bike_lookup[key] += row['count']
+        # Magasin sans géométrie (chargement rapide à la prédiction)
+        write_edge_store(edges, DATA_PROCESSED_DIR)
+        print(f"   ✅ Magasin des edges sauvegardé: {EDGE_STORE_FILENAME} + {EDGE_SCHEMA_FILENAME}")
 
-# Générer dataset
-dataset_rows = []
+        # Table compacte des features + géométrie WGS84 de la table du réseau (même index)
+        edges_static = gpd.GeoDataFrame(
+            edges, geometry=pipeline.result('load_osm')['geometry_wgs84'].rename('geometry')
+        )
 
-print(f"   • Génération en cours...")
-
-for idx, ts in enumerate(timestamps):
-    if idx % 24 == 0:
-        print(f"      Jour {idx//24 + 1}/{len(timestamps)//24}...")
-    
-    # Météo pour ce timestamp
-    weather_row = weather_df[weather_df['timestamp'] == ts]
-    if len(weather_row) == 0:
-        weather_row = weather_df.iloc[weather_df['timestamp'].searchsorted(ts) - 1]
+        edges_static.to_file(edges_static_path, driver="GPKG")
+        print(f"   ✅ Edges statiques sauvegardés: {edges_static_path.name}")
     else:
-        weather_row = weather_row.iloc[0]
-    
-    # Pour chaque edge avec capteur
-    for edge_id in edges_with_sensors:
-        bike_count = bike_lookup.get((edge_id, ts), None)
-        edge_row = edges_dict[edge_id]
-        
-        row = {
-            # Identifiants
-            'edge_id': edge_id,
-            'timestamp': ts,
-            
-            # Temporel
-            'hour': ts.hour,
-            'day_of_week': ts.weekday(),
-            'is_weekend': ts.weekday() >= 5,
-            'is_rush_hour_morning': 7 <= ts.hour <= 9,
-            'is_rush_hour_evening': 17 <= ts.hour <= 19,
-            
-            # Météo
-            'temperature_c': weather_row['temperature_c'],
-            'precipitation_mm': weather_row['precipitation_mm'],
-            'wind_speed_kmh': weather_row['wind_speed_kmh'],
-            'is_raining': weather_row['is_raining'],
-            'is_cold': weather_row['temperature_c'] < 10 if pd.notna(weather_row['temperature_c']) else False,
-            'is_hot': weather_row['temperature_c'] > 25 if pd.notna(weather_row['temperature_c']) else False,
-            'is_windy': weather_row['wind_speed_kmh'] > 20 if pd.notna(weather_row['wind_speed_kmh']) else False,
-            
-            # Infrastructure edge
-            'highway_type': edge_row['highway_type'],
-            'road_category': edge_row['road_category'],
-            'lanes': edge_row['lanes'],
-            'maxspeed_kmh': edge_row['maxspeed_kmh'],
-            'has_cycleway': edge_row['has_cycleway'],
-            'has_dedicated_bike_lane': edge_row['has_dedicated_bike_lane'],
-            'bike_lane_distance_m': edge_row['bike_lane_distance_m'],
-            'surface_quality': edge_row['surface_quality'],
-            'is_lit': edge_row['is_lit'],
-            'edge_length_m': edge_row['edge_length_m'],
-            'distance_to_center_km': edge_row['distance_to_center_km'],
-            'orientation': edge_row['orientation'],
-            
-            # Target
-            'bike_count': bike_count
-        }
-        
-        dataset_rows.append(row)
-
-final_df = pd.DataFrame(dataset_rows)
-
-print(f"   ✅ Dataset créé: {len(final_df):,} lignes")
-
-# =====================================================================
-# ÉTAPE 9: LAG FEATURES
-# =====================================================================
-
-print("\n🔁 Étape 9: Calcul lag features...")
-
-final_df = final_df.sort_values(['edge_id', 'timestamp'])
-
-final_df['bike_count_lag_1h'] = final_df.groupby('edge_id')['bike_count'].shift(1)
-final_df['bike_count_lag_24h'] = final_df.groupby('edge_id')['bike_count'].shift(24)
-final_df['bike_count_rolling_7d'] = (
-    final_df.groupby('edge_id')['bike_count']
-    .transform(lambda x: x.rolling(window=168, min_periods=1).mean())
-)
-
-print(f"   ✅ Lag features calculés")
-
-# =====================================================================
-# ÉTAPE 10: SAUVEGARDER
-# =====================================================================
-
-print("\n💾 Étape 10: Sauvegarde...")
-
-output_path = DATA_PROCESSED_DIR / "final_dataset_v3.csv"
-final_df.to_csv(output_path, index=False)
-
-print(f"   ✅ Dataset sauvegardé: {output_path.name}")
+        print(f"   ♻️  Magasin des edges et {edges_static_path.name} à jour")
+
+    # Graphe routier (CSR nœud × nœud des longueurs, incidence edge × nœud)
+    road_graph_path = DATA_PROCESSED_DIR / ROAD_GRAPH_FILENAME
+    if 'road_graph' in pipeline.ran or not road_graph_path.exists():
+        save_road_graph(pipeline.result('road_graph'), road_graph_path)
+        print(f"   ✅ Graphe routier sauvegardé: {road_graph_path.name}")
+
+    # Poids de propagation spatiale (prédiction et runs incrémentaux)
+    sensor_weights_path = DATA_PROCESSED_DIR / SENSOR_WEIGHTS_FILENAME
+    if 'sensor_weights' in pipeline.ran or not sensor_weights_path.exists():
+        save_sensor_weights(pipeline.result('sensor_weights'), sensor_weights_path)
+        print(f"   ✅ Poids de propagation sauvegardés: {sensor_weights_path.name}")
+
+    # Features statiques des edges avec capteurs (runs incrémentaux)
+    if 'edge_features' in pipeline.ran or not (DATA_PROCESSED_DIR / SENSOR_EDGES_FILENAME).exists():
+        edges = pipeline.result('edge_features')
+        if args.tile_size_km:
+            edges = edges['sensor_edges']
+        save_sensor_edges(
+            edges.loc[edges['osm_id'].isin(edges_with_sensors), ['osm_id'] + EDGE_FEATURE_COLUMNS],
+            DATA_PROCESSED_DIR
+        )
+
+    # Manifest des entrées traitées + état nécessaire aux runs incrémentaux
+    manifest.reset()
+    manifest.record(manifest.signatures(static_files + bike_counter_files + weather_files))
+    manifest.state = {
+        'sensor_to_edge': {str(cid): int(info['edge_id']) for cid, info in sensor_to_edge.items()},
+        'edges_with_sensors': [int(edge_id) for edge_id in edges_with_sensors],
+        'lag_features': list(args.lag_features)
+    }
+    manifest.save()
+    print(f"   ✅ Manifest sauvegardé: {MANIFEST_FILENAME} ({len(manifest.files)} fichiers)")
+    save_record['rows'] = len(final_df)
 
 # Statistiques finales
 print("\n" + "="*80)
@@ -508,5 +456,11 @@ print("\n" + "="*80)
 print("✅ PREPROCESSING TERMINÉ!")
 print("="*80)
 print(f"\nFichiers générés:")
-print(f"   1. {output_path.name}")
-print(f"   2. {edges_static_path.name}")
+print(f"   1. {parquet_path.name}/")
+print(f"   2. {output_path.name}")
+print(f"   3. {edges_static_path.name}")
+print(f"   4. {EDGE_STORE_DIRNAME if args.tile_size_km else EDGE_STORE_FILENAME} + {EDGE_SCHEMA_FILENAME}")
+print(f"   5. {road_graph_path.name}")
+print(f"   6. {sensor_weights_path.name}")
+
+write_profile('full')
@@ -0,0 +1,138 @@
+"""
+Stockage Parquet du dataset ML
+Écrit final_dataset_v3 en Parquet partitionné par date (data/processed/final_dataset_v3/date=YYYY-MM-DD/)
+avec des types compacts (catégories, float32, int8/int16), et le relit avec projection de colonnes.
+
+Lecture typique:
+    df = read_dataset(DATA_PROCESSED_DIR / DATASET_DIRNAME, columns=['edge_id', 'timestamp', 'bike_count'])
+"""
+
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from preprocessing.lag_features import LAG_FEATURE_SPECS
+from preprocessing.spatial_propagation import SPATIAL_FEATURE_COLUMNS
+from preprocessing.edge_attributes import EDGE_CATEGORIES, categorical_column
+
+# Dossier du dataset partitionné (dans data/processed)
+DATASET_DIRNAME = "final_dataset_v3"
+
+# Colonne de partitionnement (ajoutée à l'écriture, retirée à la lecture)
+PARTITION_COL = "date"
+
+# Types compacts par colonne
+CATEGORICAL_COLUMNS = list(EDGE_CATEGORIES)
+FLOAT32_COLUMNS = [
+    'temperature_c', 'precipitation_mm', 'wind_speed_kmh',
+    'bike_lane_distance_m', 'edge_length_m', 'distance_to_center_km',
+    'bike_count'
+] + SPATIAL_FEATURE_COLUMNS + list(LAG_FEATURE_SPECS)
+INT8_COLUMNS = ['hour', 'day_of_week']
+INT16_COLUMNS = ['lanes', 'maxspeed_kmh']
+
+
+def compact_dtypes(df):
+    """
+    Convertit les colonnes du dataset en types compacts
+
+    Les colonnes entières ne sont réduites que si leurs valeurs tiennent dans le type
+    cible ; les booléens sans valeur manquante sont stockés en bool.
+    """
+    df = df.copy()
+
+    # Vocabulaire figé : mêmes catégories dans toutes les partitions et à l'entraînement
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = categorical_column(df[col], col)
+
+    for col in FLOAT32_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float32')
+
+    for cols, dtype in ((INT8_COLUMNS, np.int8), (INT16_COLUMNS, np.int16)):
+        info = np.iinfo(dtype)
+        for col in cols:
+            if col not in df.columns or df[col].isna().any():
+                continue
+            if df[col].min() >= info.min and df[col].max() <= info.max:
+                df[col] = df[col].astype(dtype)
+
+    for col in df.columns:
+        if col.startswith(('is_', 'has_')) or col == 'weather_missing':
+            if df[col].dtype == object and df[col].notna().all():
+                df[col] = df[col].astype(bool)
+
+    return df
+
+
+def write_dataset(df, path, overwrite=True):
+    """
+    Écrit le dataset en Parquet partitionné par date
+
+    Args:
+        df: DataFrame avec une colonne 'timestamp'
+        path: dossier du dataset
+        overwrite: supprimer le dataset existant (sinon seules les dates écrites sont remplacées)
+
+    Returns:
+        Liste des partitions (dates) écrites
+    """
+    if overwrite and path.exists():
+        shutil.rmtree(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    df = compact_dtypes(df)
+    df[PARTITION_COL] = pd.to_datetime(df['timestamp']).dt.strftime('%Y-%m-%d')
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_to_dataset(
+        table,
+        root_path=str(path),
+        partition_cols=[PARTITION_COL],
+        existing_data_behavior='delete_matching',
+        basename_template='part-{i}.parquet'
+    )
+
+    return sorted(df[PARTITION_COL].unique())
+
+
+def dataset_exists(path):
+    """Indique si un dataset Parquet est présent dans le dossier"""
+    return path.is_dir() and any(path.glob(f"{PARTITION_COL}=*/*.parquet"))
+
+
+def read_dataset(path, columns=None, start_date=None, end_date=None):
+    """
+    Lit le dataset Parquet avec projection de colonnes et filtre de dates
+
+    Args:
+        path: dossier du dataset
+        columns: colonnes à lire (défaut: toutes sauf la colonne de partition)
+        start_date, end_date: bornes incluses 'YYYY-MM-DD' (filtre sur les partitions)
+
+    Returns:
+        DataFrame trié par (edge_id, timestamp) si ces colonnes sont lues
+    """
+    dataset = ds.dataset(str(path), format='parquet', partitioning='hive')
+
+    if columns is None:
+        columns = [name for name in dataset.schema.names if name != PARTITION_COL]
+
+    partition_filter = None
+    if start_date is not None:
+        partition_filter = ds.field(PARTITION_COL) >= str(start_date)
+    if end_date is not None:
+        end_filter = ds.field(PARTITION_COL) <= str(end_date)
+        partition_filter = end_filter if partition_filter is None else partition_filter & end_filter
+
+    df = dataset.to_table(columns=columns, filter=partition_filter).to_pandas()
+
+    sort_cols = [c for c in ('edge_id', 'timestamp') if c in df.columns]
+    if sort_cols:
+        df = df.sort_values(sort_cols, kind='stable').reset_index(drop=True)
+
+    return df
@@ -0,0 +1,138 @@
+"""
+Attributs dérivés des edges OSM (calcul vectorisé)
+Orientation depuis les extrémités des géométries (tableaux de coordonnées shapely 2),
+catégories de route et de surface par table de correspondance, parsing numérique
+des tags maxspeed / lanes.
+
+Les colonnes catégorielles ont un vocabulaire figé (EDGE_CATEGORIES), partagé par le
+preprocessing (dtype category), l'entraînement et la prédiction (encodeurs).
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+
+# Orientation : secteurs de 45° centrés sur les directions cardinales (angle depuis l'est)
+ORIENTATION_BOUNDS = [22.5, 67.5, 112.5, 157.5, 202.5, 247.5, 292.5, 337.5]
+ORIENTATION_LABELS = ['E', 'NE', 'N', 'NW', 'W', 'SW', 'S', 'SE', 'E']
+
+ROAD_CATEGORIES = {
+    'motorway': 'major',
+    'trunk': 'major',
+    'primary': 'arterial',
+    'secondary': 'arterial',
+    'tertiary': 'local',
+    'residential': 'local',
+    'cycleway': 'bike_path',
+    'path': 'bike_path',
+}
+DEFAULT_ROAD_CATEGORY = 'other'
+
+GOOD_SURFACES = ['asphalt', 'paved']
+MEDIUM_SURFACES = ['concrete', 'paving_stones']
+
+DEFAULT_MAXSPEED_KMH = 50
+DEFAULT_LANES = 2
+
+# Vocabulaires figés des colonnes catégorielles ; une valeur hors vocabulaire est
+# remplacée par la dernière valeur (valeur de repli), les valeurs manquantes restent NaN
+EDGE_CATEGORIES = {
+    'highway_type': [
+        'motorway', 'trunk', 'primary', 'secondary', 'tertiary', 'residential',
+        'unclassified', 'cycleway', 'path', 'footway', 'pedestrian', 'unknown'
+    ],
+    'road_category': ['major', 'arterial', 'local', 'bike_path', 'other'],
+    'surface_quality': ['good', 'medium', 'poor', 'unknown'],
+    'orientation': ['E', 'NE', 'N', 'NW', 'W', 'SW', 'S', 'SE', 'unknown'],
+    'cycleway_type': [
+        'none', 'no', 'lane', 'track', 'shared_lane', 'share_busway', 'opposite',
+        'opposite_lane', 'opposite_track', 'separate', 'other'
+    ],
+    'bicycle_access': [
+        'yes', 'no', 'designated', 'permissive', 'destination', 'dismount',
+        'use_sidepath', 'private', 'other'
+    ],
+}
+
+
+def edge_orientation(geometries):
+    """
+    Orientation (E, NE, N, ...) du premier au dernier point de chaque géométrie
+
+    Args:
+        geometries: GeoSeries de LineString (CRS projeté)
+
+    Returns:
+        np.ndarray d'objets (None pour une géométrie vide)
+    """
+    geoms = np.asarray(geometries.values if hasattr(geometries, 'values') else geometries)
+
+    # Toutes les coordonnées en un seul tableau, extrémités repérées par le nombre de points
+    coords = shapely.get_coordinates(geoms)
+    counts = shapely.get_num_coordinates(geoms)
+    ends = np.cumsum(counts) - 1
+    starts = ends - counts + 1
+    valid = counts >= 2
+
+    dx = np.full(len(geoms), np.nan)
+    dy = np.full(len(geoms), np.nan)
+    dx[valid] = coords[ends[valid], 0] - coords[starts[valid], 0]
+    dy[valid] = coords[ends[valid], 1] - coords[starts[valid], 1]
+
+    angle = np.degrees(np.arctan2(dy, dx))
+    angle = np.where(angle < 0, angle + 360, angle)
+
+    sector = np.searchsorted(ORIENTATION_BOUNDS, angle, side='right')
+    labels = np.asarray(ORIENTATION_LABELS, dtype=object)[np.minimum(sector, len(ORIENTATION_BOUNDS))]
+    labels[~valid] = None
+    return labels
+
+
+def _by_unique(values, func, na_value):
+    """
+    Applique `func` (vectorisée) aux valeurs distinctes seulement puis redistribue
+    (les tags OSM ont peu de valeurs distinctes)
+    """
+    codes, uniques = pd.factorize(values)
+    mapped = np.append(np.asarray(func(pd.Series(uniques)), dtype=object), na_value)
+    return pd.Series(mapped[codes], index=values.index).infer_objects()
+
+
+def road_category(highway_types):
+    """Catégorie de route (major, arterial, local, bike_path, other) depuis le tag highway"""
+    return _by_unique(
+        highway_types,
+        lambda uniques: uniques.map(ROAD_CATEGORIES).fillna(DEFAULT_ROAD_CATEGORY),
+        DEFAULT_ROAD_CATEGORY
+    )
+
+
+def _surface_quality(surfaces):
+    lowered = surfaces.astype(str).str.lower()
+    return np.select(
+        [lowered.isin(GOOD_SURFACES), lowered.isin(MEDIUM_SURFACES)],
+        ['good', 'medium'],
+        default='poor'
+    )
+
+
+def surface_quality(surfaces):
+    """Qualité de surface (good, medium, poor, unknown) depuis le tag surface"""
+    return _by_unique(surfaces, _surface_quality, 'unknown')
+
+
+def parse_int_tag(values, default):
+    """Tag OSM entier ('30', '2', ...) ; valeur par défaut si absent ou non numérique ('30 mph', '2;3')"""
+    def parse(uniques):
+        text = uniques.astype(str)
+        return pd.to_numeric(text.where(text.str.isdigit()), errors='coerce').fillna(default)
+
+    return _by_unique(values, parse, default).astype('int64')
+
+
+def categorical_column(values, name):
+    """Colonne en dtype category sur le vocabulaire figé EDGE_CATEGORIES[name]"""
+    vocabulary = EDGE_CATEGORIES[name]
+    values = values.astype(object)
+    out_of_vocabulary = values.notna() & ~values.isin(vocabulary)
+    return values.mask(out_of_vocabulary, vocabulary[-1]).astype(pd.CategoricalDtype(vocabulary))
@@ -0,0 +1,229 @@
+"""
+Magasin des features statiques des edges, sans géométrie
+Écrit la table compacte des edges (stages.EDGE_TABLE_COLUMNS) en Feather (Arrow IPC) non
+compressé, lisible en memory-map, et un schéma JSON (colonnes, types, vocabulaires, clé osm_id)
+à côté. La prédiction le charge sans passer par GDAL ; la géométrie n'est lue depuis
+edges_static_v3.gpkg que pour les sorties géographiques.
+
+En mode tuilé (preprocessing.tiling), le magasin est partitionné : un fichier Feather par
+tuile dans edges_static_v3_tiles/, listés dans le même schéma JSON.
+
+Lecture typique:
+    edges = read_edge_store(DATA_PROCESSED_DIR)
+    geometry = read_edge_geometry(DATA_PROCESSED_DIR / "edges_static_v3.gpkg", edges['osm_id'])
+"""
+
+import json
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import geopandas as gpd
+
+from preprocessing.edge_attributes import EDGE_CATEGORIES
+
+# Fichiers du magasin (dans data/processed)
+EDGE_STORE_FILENAME = "edges_static_v3.feather"
+EDGE_STORE_DIRNAME = "edges_static_v3_tiles"
+EDGE_SCHEMA_FILENAME = "edges_static_v3.schema.json"
+
+# Clé des edges (jointure avec la géométrie et les prédictions)
+EDGE_KEY = "osm_id"
+
+_SCHEMA_VERSION = 1
+
+
+def _columns_schema(edges):
+    """Type de chaque colonne (+ vocabulaire des colonnes catégorielles figées)"""
+    return {
+        col: {
+            'dtype': str(edges[col].dtype),
+            **({'categories': EDGE_CATEGORIES[col]} if col in EDGE_CATEGORIES else {})
+        }
+        for col in edges.columns
+    }
+
+
+def _write_schema(schema, output_dir):
+    schema_path = output_dir / EDGE_SCHEMA_FILENAME
+    tmp_path = schema_path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(schema, f, indent=2)
+    tmp_path.replace(schema_path)
+
+
+def write_edge_store_partition(edges, path):
+    """
+    Écrit une table d'edges (sans géométrie) en Feather non compressé, de façon atomique
+
+    Returns:
+        nombre d'edges écrits
+    """
+    if edges[EDGE_KEY].duplicated().any():
+        raise ValueError(f"Clé {EDGE_KEY} non unique dans la table des edges")
+
+    table = pa.Table.from_pandas(edges.reset_index(drop=True), preserve_index=False)
+
+    # Non compressé : lisible en memory-map sans décompression
+    tmp_path = path.with_suffix('.tmp')
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    tmp_path.replace(path)
+    return len(edges)
+
+
+def write_edge_store(edges, output_dir):
+    """
+    Écrit la table des edges (sans géométrie) et son schéma, de façon atomique
+
+    Args:
+        edges: DataFrame des features statiques (colonne osm_id unique)
+        output_dir: dossier de sortie (data/processed)
+
+    Returns:
+        chemin du fichier Feather
+    """
+    store_path = output_dir / EDGE_STORE_FILENAME
+    n_edges = write_edge_store_partition(edges, store_path)
+
+    _write_schema({
+        'version': _SCHEMA_VERSION,
+        'key': EDGE_KEY,
+        'n_edges': n_edges,
+        'columns': _columns_schema(edges)
+    }, output_dir)
+
+    # Un seul agencement à la fois
+    shutil.rmtree(output_dir / EDGE_STORE_DIRNAME, ignore_errors=True)
+
+    return store_path
+
+
+def write_partitioned_edge_store(partitions, output_dir):
+    """
+    Assemble le magasin partitionné à partir des fichiers Feather des tuiles
+
+    Args:
+        partitions: {tile_id: chemin du Feather de la tuile (write_edge_store_partition)}
+        output_dir: dossier de sortie (data/processed)
+
+    Returns:
+        dossier du magasin partitionné
+    """
+    store_dir = output_dir / EDGE_STORE_DIRNAME
+    tmp_dir = output_dir / f"{EDGE_STORE_DIRNAME}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    files = {}
+    columns = None
+    n_edges = 0
+    for tile_id, path in sorted(partitions.items()):
+        filename = f"tile={tile_id}.feather"
+        shutil.copyfile(path, tmp_dir / filename)
+
+        table = feather.read_table(path, memory_map=True)
+        tile_edges = table.num_rows
+        if columns is None:
+            columns = _columns_schema(table.schema.empty_table().to_pandas())
+
+        files[tile_id] = {'file': filename, 'n_edges': tile_edges}
+        n_edges += tile_edges
+
+    shutil.rmtree(store_dir, ignore_errors=True)
+    tmp_dir.replace(store_dir)
+
+    _write_schema({
+        'version': _SCHEMA_VERSION,
+        'key': EDGE_KEY,
+        'n_edges': n_edges,
+        'columns': columns or {},
+        'partitions': files
+    }, output_dir)
+
+    # Un seul agencement à la fois
+    (output_dir / EDGE_STORE_FILENAME).unlink(missing_ok=True)
+
+    return store_dir
+
+
+def edge_store_exists(output_dir):
+    return (output_dir / EDGE_SCHEMA_FILENAME).exists() and (
+        (output_dir / EDGE_STORE_FILENAME).exists() or (output_dir / EDGE_STORE_DIRNAME).is_dir()
+    )
+
+
+def read_edge_store(output_dir, columns=None, tiles=None):
+    """
+    Charge la table des edges (memory-map) et vérifie qu'elle correspond à son schéma
+
+    Args:
+        output_dir: dossier du magasin (data/processed)
+        columns: colonnes à charger (None = toutes ; la clé est toujours incluse)
+        tiles: tuiles à charger pour un magasin partitionné (None = toutes)
+
+    Returns:
+        DataFrame des edges (catégories restaurées)
+    """
+    with open(output_dir / EDGE_SCHEMA_FILENAME, 'r') as f:
+        schema = json.load(f)
+
+    if columns is not None:
+        columns = [schema['key']] + [col for col in columns if col != schema['key']]
+        unknown = [col for col in columns if col not in schema['columns']]
+        if unknown:
+            raise KeyError(f"Colonnes absentes du magasin des edges: {unknown}")
+
+    if 'partitions' in schema:
+        partitions = schema['partitions']
+        if tiles is not None:
+            unknown = [tile_id for tile_id in tiles if tile_id not in partitions]
+            if unknown:
+                raise KeyError(f"Tuiles absentes du magasin des edges: {unknown}")
+            partitions = {tile_id: partitions[tile_id] for tile_id in tiles}
+
+        paths = [output_dir / EDGE_STORE_DIRNAME / partition['file'] for partition in partitions.values()]
+        expected = sum(partition['n_edges'] for partition in partitions.values())
+    else:
+        paths = [output_dir / EDGE_STORE_FILENAME]
+        expected = schema['n_edges']
+
+    # Concaténation côté pandas : les dictionnaires Arrow (catégories) diffèrent d'une tuile à l'autre
+    frames = [feather.read_table(path, columns=columns, memory_map=True).to_pandas() for path in paths]
+    if not frames:
+        return pd.DataFrame(columns=columns or list(schema['columns']))
+    edges = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+    if len(edges) != expected:
+        raise ValueError(
+            f"Magasin des edges: {len(edges)} edges, {expected} attendus "
+            f"(magasin et schéma désynchronisés, relancer le preprocessing)"
+        )
+
+    # Vocabulaire figé enregistré dans le schéma (les autres catégories, ex. name, viennent d'Arrow)
+    for col in edges.columns:
+        categories = schema['columns'][col].get('categories')
+        if categories is not None:
+            edges[col] = edges[col].astype(pd.CategoricalDtype(categories))
+        elif schema['columns'][col]['dtype'] == 'category':
+            edges[col] = edges[col].astype('category')
+
+    return edges
+
+
+def read_edge_geometry(gpkg_path, osm_ids):
+    """
+    Géométries (EPSG:4326) des edges demandés, dans l'ordre de osm_ids
+
+    Args:
+        gpkg_path: GeoPackage des edges statiques (edges_static_v3.gpkg)
+        osm_ids: identifiants OSM des edges
+
+    Returns:
+        GeoSeries alignée sur l'index de osm_ids
+    """
+    geometry = gpd.read_file(gpkg_path, columns=[EDGE_KEY])
+    geometry = geometry.drop_duplicates(EDGE_KEY).set_index(EDGE_KEY).geometry
+
+    aligned = geometry.reindex(pd.Index(osm_ids))
+    aligned.index = osm_ids.index
+    return aligned
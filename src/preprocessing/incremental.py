@@ -0,0 +1,175 @@
+"""
+Preprocessing incrémental
+Ne traite que les fichiers de comptage nouveaux ou modifiés depuis le dernier run
+(d'après le manifest) : les lignes des jours concernés sont reconstruites, les lag
+features recalculées sur la fenêtre affectée, et seules les partitions journalières
+correspondantes du dataset Parquet sont réécrites.
+
+Météo : une partition de l'archive (weather_YYYY-MM-DD.parquet) nouvelle, modifiée ou
+supprimée ajoute son jour et le lendemain (alignement sur la mesure précédente) aux jours
+reconstruits ; un ancien fichier weather_data*.json modifié ou supprimé (heures non
+datées par le nom du fichier) impose une reconstruction complète.
+
+Prérequis (produits par une reconstruction complète):
+- data/processed/preprocess_manifest.json (signatures + association capteur → edge)
+- data/processed/sensor_edges_v3.parquet (features statiques des edges avec capteurs)
+- data/processed/final_dataset_v3/ (dataset Parquet)
+- data/processed/sensor_weights_v3.npz (poids de propagation spatiale)
+"""
+
+from pathlib import PurePosixPath
+
+import pandas as pd
+
+from data_collection.weather_store import is_legacy_file, partition_date
+from preprocessing.counter_loader import (
+    COUNTER_CACHE_FILENAME, list_counter_files, counter_file_date, load_counter_files
+)
+from preprocessing.dataset_io import read_dataset, write_dataset
+from preprocessing.temporal_dataset import aggregate_counts, build_temporal_rows
+from preprocessing.spatial_propagation import SENSOR_WEIGHTS_FILENAME, add_spatial_features, load_sensor_weights
+from preprocessing.lag_features import (
+    DEFAULT_LAG_FEATURES, LAG_FEATURE_SPECS, add_lag_features, lag_reach_days
+)
+
+# Features statiques des edges avec capteurs (pour les runs incrémentaux)
+SENSOR_EDGES_FILENAME = "sensor_edges_v3.parquet"
+
+
+def weather_changes(manifest, weather_dir, weather_files):
+    """
+    Fichiers météo nouveaux, modifiés ou supprimés depuis le dernier run
+
+    Returns:
+        (jours des partitions concernées, anciens fichiers weather_data*.json concernés,
+         signatures des fichiers météo, clés du manifest des fichiers supprimés)
+    """
+    changed, signatures = manifest.changed_files(weather_files)
+    removed = manifest.recorded_under(weather_dir) - set(signatures)
+
+    names = [path.name for path in changed] + [PurePosixPath(key).name for key in removed]
+    days = {partition_date(PurePosixPath(name)) for name in names} - {None}
+    legacy = [name for name in names if is_legacy_file(PurePosixPath(name))]
+    return days, legacy, signatures, removed
+
+
+def incremental_blockers(manifest, static_files, dataset_path, processed_dir,
+                         lag_features=DEFAULT_LAG_FEATURES, weather_dir=None, weather_files=()):
+    """
+    Raison empêchant un run incrémental (None si possible)
+    """
+    if not manifest:
+        return "aucun manifest"
+    if 'sensor_to_edge' not in manifest.state:
+        return "association capteurs → edges absente du manifest"
+    if not dataset_path.is_dir():
+        return "dataset Parquet absent"
+    if not (processed_dir / SENSOR_EDGES_FILENAME).exists():
+        return f"{SENSOR_EDGES_FILENAME} absent"
+    if not (processed_dir / SENSOR_WEIGHTS_FILENAME).exists():
+        return f"{SENSOR_WEIGHTS_FILENAME} absent"
+    if not manifest.unchanged(static_files):
+        return "réseau OSM, capteurs ou infrastructure cyclable modifiés"
+    if manifest.state.get('lag_features', DEFAULT_LAG_FEATURES) != list(lag_features):
+        return "lag features différentes du dernier run"
+    if weather_dir is not None:
+        _, legacy, _, _ = weather_changes(manifest, weather_dir, weather_files)
+        if legacy:
+            return f"anciens fichiers météo modifiés ({', '.join(sorted(legacy))})"
+    return None
+
+
+def save_sensor_edges(edges_features, processed_dir):
+    """Sauvegarde les features statiques des edges avec capteurs (sans géométrie)"""
+    path = processed_dir / SENSOR_EDGES_FILENAME
+    pd.DataFrame(edges_features).to_parquet(path, index=False)
+    return path
+
+
+def run_incremental(manifest, bike_data_dir, processed_dir, dataset_path, weather_aligner,
+                    lag_features=DEFAULT_LAG_FEATURES, weather_dir=None, weather_files=()):
+    """
+    Intègre les fichiers de comptage nouveaux/modifiés (et les partitions météo
+    nouvelles/modifiées de weather_dir) au dataset Parquet
+
+    Returns:
+        dict de statistiques du run
+    """
+    counter_files = list_counter_files(bike_data_dir)
+    changed_files, signatures = manifest.changed_files(counter_files)
+
+    print(f"   • {len(counter_files)} fichiers de comptage, {len(changed_files)} nouveaux ou modifiés")
+
+    # Jours météo modifiés (et lendemains), limités aux jours ayant des comptages
+    weather_days, removed_weather = set(), set()
+    if weather_dir is not None:
+        weather_days, _, weather_signatures, removed_weather = weather_changes(manifest, weather_dir, weather_files)
+        signatures.update(weather_signatures)
+        weather_days |= {
+            (pd.Timestamp(day) + pd.Timedelta(days=1)).strftime('%Y-%m-%d') for day in weather_days
+        }
+        weather_days &= {counter_file_date(path) for path in counter_files}
+        print(f"   • {len(weather_days)} jours avec météo nouvelle ou modifiée")
+
+    if not changed_files and not weather_days:
+        manifest.record(signatures)
+        manifest.forget(removed_weather)
+        manifest.save()
+        print("   ✅ Aucun nouveau fichier de comptage ni météo modifiée, dataset à jour")
+        return {'changed_files': 0, 'rows': 0, 'partitions': []}
+
+    # Jours touchés : on relit tous les fichiers de ces jours (partitions journalières complètes)
+    affected_dates = sorted({counter_file_date(path) for path in changed_files} | weather_days)
+    day_files = [path for path in counter_files if counter_file_date(path) in affected_dates]
+
+    print(f"   • Jours concernés: {', '.join(affected_dates)} ({len(day_files)} fichiers lus)")
+
+    bike_df = load_counter_files(day_files, cache_path=processed_dir / "cache" / COUNTER_CACHE_FILENAME,
+                                 present_files=counter_files)
+    sensor_to_edge = manifest.state['sensor_to_edge']
+    bike_df['edge_id'] = bike_df['counter_id'].astype(str).map(sensor_to_edge)
+    bike_df = bike_df[bike_df['edge_id'].notna()].copy()
+
+    edges_with_sensors = manifest.state['edges_with_sensors']
+    edges_features = pd.read_parquet(processed_dir / SENSOR_EDGES_FILENAME)
+
+    timestamps = sorted(bike_df['timestamp'].unique())
+    new_rows = build_temporal_rows(
+        timestamps, edges_with_sensors, aggregate_counts(bike_df), edges_features, weather_aligner
+    )
+
+    # Propagation spatiale : ne dépend que des comptages de la même heure
+    new_rows = add_spatial_features(new_rows, load_sensor_weights(processed_dir / SENSOR_WEIGHTS_FILENAME))
+
+    # Fenêtre des lag features : les jours suivant un jour modifié (portée des lags)
+    # sont recalculés, et l'historique précédent (portée + 1 jour) est relu comme contexte
+    reach_days = lag_reach_days(lag_features)
+    first_day = pd.Timestamp(affected_dates[0])
+    last_day = pd.Timestamp(affected_dates[-1])
+    context_start = (first_day - pd.Timedelta(days=reach_days + 1)).strftime('%Y-%m-%d')
+    window_end = (last_day + pd.Timedelta(days=reach_days)).strftime('%Y-%m-%d')
+
+    existing = read_dataset(dataset_path, start_date=context_start, end_date=window_end)
+    existing = existing.drop(columns=[c for c in LAG_FEATURE_SPECS if c in existing.columns])
+    existing = existing[~existing['timestamp'].dt.strftime('%Y-%m-%d').isin(affected_dates)]
+
+    # Les colonnes catégorielles du Parquet sont remises en objets avant concaténation
+    for col in existing.select_dtypes(include='category').columns:
+        existing[col] = existing[col].astype(object)
+
+    combined = pd.concat([existing, new_rows], ignore_index=True)
+    combined = add_lag_features(combined, features=lag_features)
+
+    # Lignes à réécrire : du premier jour modifié à la fin de la portée des lags
+    row_dates = combined['timestamp'].dt.strftime('%Y-%m-%d')
+    to_write = combined[(row_dates >= affected_dates[0]) & (row_dates <= window_end)]
+
+    partitions = write_dataset(to_write, dataset_path, overwrite=False)
+
+    manifest.record(signatures)
+    manifest.forget(removed_weather)
+    manifest.save()
+
+    print(f"   ✅ {len(new_rows):,} lignes reconstruites, {len(partitions)} partitions réécrites")
+
+    return {'changed_files': len(changed_files), 'rows': len(new_rows), 'partitions': partitions}
@@ -0,0 +1,137 @@
+"""
+Moteur de lag features
+Les comptages sont replacés sur un calendrier horaire complet (matrice edges × heures),
+de sorte qu'un décalage de k lignes correspond toujours à k heures même quand des heures
+manquent. Toutes les features sont calculées en un seul passage, de façon vectorisée
+sur l'ensemble des edges (décalages numpy, sommes cumulées, ewm pandas par colonne).
+
+Features disponibles (LAG_FEATURE_SPECS):
+- lag: valeur k heures avant (1h, 24h, 168h = même heure la semaine précédente)
+- rolling_mean: moyenne sur une fenêtre glissante de w heures
+- ewm: moyenne mobile exponentielle de portée (span) en heures
+"""
+
+import math
+import numpy as np
+import pandas as pd
+
+# Spécifications des features : type, paramètre (heures), décalage appliqué au résultat
+# (shift=0 : la fenêtre inclut l'heure courante, comme historiquement bike_count_rolling_7d)
+LAG_FEATURE_SPECS = {
+    'bike_count_lag_1h': {'kind': 'lag', 'hours': 1},
+    'bike_count_lag_24h': {'kind': 'lag', 'hours': 24},
+    'bike_count_lag_168h': {'kind': 'lag', 'hours': 168},
+    'bike_count_rolling_24h': {'kind': 'rolling_mean', 'hours': 24, 'shift': 1},
+    'bike_count_rolling_7d': {'kind': 'rolling_mean', 'hours': 168, 'shift': 0},
+    'bike_count_ewm_24h': {'kind': 'ewm', 'hours': 24, 'shift': 1},
+    'bike_count_ewm_168h': {'kind': 'ewm', 'hours': 168, 'shift': 1},
+}
+
+# Features calculées par défaut (colonnes du dataset v3)
+DEFAULT_LAG_FEATURES = ['bike_count_lag_1h', 'bike_count_lag_24h', 'bike_count_rolling_7d']
+
+# Historique pris en compte pour une ewm : au-delà de 4 × span le poids résiduel est < 0.1%
+_EWM_REACH_FACTOR = 4
+
+
+def parse_lag_features(value):
+    """Liste de features depuis une chaîne 'a,b,c' (valide les noms)"""
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in LAG_FEATURE_SPECS]
+    if unknown:
+        raise ValueError(
+            f"Lag features inconnues: {', '.join(unknown)} "
+            f"(disponibles: {', '.join(LAG_FEATURE_SPECS)})"
+        )
+    return names
+
+
+def lag_reach_hours(features=DEFAULT_LAG_FEATURES):
+    """Nombre d'heures d'historique dont dépendent les features"""
+    reach = 0
+    for name in features:
+        spec = LAG_FEATURE_SPECS[name]
+        hours = spec['hours'] * (_EWM_REACH_FACTOR if spec['kind'] == 'ewm' else 1)
+        reach = max(reach, hours + spec.get('shift', 0))
+    return reach
+
+
+def lag_reach_days(features=DEFAULT_LAG_FEATURES):
+    """Nombre de jours d'historique dont dépendent les features (arrondi supérieur)"""
+    return math.ceil(lag_reach_hours(features) / 24)
+
+
+def _shift(values, hours):
+    """Décale la matrice (edges × heures) de `hours` heures vers le futur"""
+    if hours == 0:
+        return values
+    shifted = np.full_like(values, np.nan)
+    if hours < values.shape[1]:
+        shifted[:, hours:] = values[:, :-hours]
+    return shifted
+
+
+def _rolling_mean(values, window, min_periods=1):
+    """Moyenne glissante sur `window` heures en ignorant les heures sans mesure"""
+    present = ~np.isnan(values)
+    sums = np.cumsum(np.where(present, values, 0.0), axis=1)
+    counts = np.cumsum(present, axis=1)
+
+    if window < values.shape[1]:
+        sums[:, window:] -= sums[:, :-window].copy()
+        counts[:, window:] -= counts[:, :-window].copy()
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts >= min_periods, sums / counts, np.nan)
+
+
+def _ewm(values, span):
+    """Moyenne mobile exponentielle (positions horaires absolues, trous inclus)"""
+    wide = pd.DataFrame(values.T)
+    return wide.ewm(span=span, min_periods=1, ignore_na=False).mean().to_numpy().T
+
+
+def _compute(values, spec):
+    kind = spec['kind']
+    if kind == 'lag':
+        return _shift(values, spec['hours'])
+    if kind == 'rolling_mean':
+        return _shift(_rolling_mean(values, spec['hours']), spec.get('shift', 0))
+    if kind == 'ewm':
+        return _shift(_ewm(values, spec['hours']), spec.get('shift', 0))
+    raise ValueError(f"Type de lag feature inconnu: {kind}")
+
+
+def add_lag_features(df, features=DEFAULT_LAG_FEATURES, value_col='bike_count'):
+    """
+    Ajoute les lag features par edge sur un calendrier horaire complet
+
+    Args:
+        df: DataFrame avec 'edge_id', 'timestamp' (horaire) et la colonne de valeurs
+        features: noms des features (clés de LAG_FEATURE_SPECS)
+        value_col: colonne source
+
+    Returns:
+        DataFrame trié par (edge_id, timestamp) avec une colonne par feature
+    """
+    df = df.sort_values(['edge_id', 'timestamp']).copy()
+    if df.empty:
+        for name in features:
+            df[name] = np.nan
+        return df
+
+    hours = df['timestamp'].dt.floor('h')
+    edges = pd.Index(df['edge_id'].unique())
+    calendar = pd.date_range(hours.min(), hours.max(), freq='h')
+
+    edge_idx = edges.get_indexer(df['edge_id'])
+    hour_idx = calendar.get_indexer(hours)
+
+    # Matrice edges × heures (NaN pour les heures sans ligne ou sans mesure)
+    values = np.full((len(edges), len(calendar)), np.nan)
+    values[edge_idx, hour_idx] = pd.to_numeric(df[value_col], errors='coerce').to_numpy(dtype=float)
+
+    for name in features:
+        df[name] = _compute(values, LAG_FEATURE_SPECS[name])[edge_idx, hour_idx]
+
+    return df
@@ -0,0 +1,139 @@
+"""
+Manifest des fichiers d'entrée déjà traités par le preprocessing
+Enregistre pour chaque fichier brut (chemin relatif à data/raw) sa taille, sa date de
+modification et son hash SHA-256, pour ne retraiter que les fichiers nouveaux ou modifiés.
+
+Les fichiers horaires sont réécrits à chaque collecte (mtime modifié, contenu souvent
+identique) : le hash n'est recalculé que si la taille ou le mtime a changé, et un fichier
+dont le contenu est inchangé n'est pas considéré comme modifié.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+
+MANIFEST_FILENAME = "preprocess_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hash SHA-256 du contenu d'un fichier"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_signature(path, previous=None):
+    """
+    Signature {size, mtime, sha256} d'un fichier
+
+    Si la signature précédente a la même taille et le même mtime, son hash est réutilisé.
+    """
+    stat = path.stat()
+    signature = {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime:
+        signature['sha256'] = previous['sha256']
+    else:
+        signature['sha256'] = file_sha256(path)
+
+    return signature
+
+
+class InputManifest:
+    """
+    Manifest JSON des entrées traitées
+
+    Args:
+        path: chemin du fichier manifest
+        raw_dir: dossier des données brutes (les clés sont relatives à ce dossier)
+    """
+
+    def __init__(self, path, raw_dir):
+        self.path = path
+        self.raw_dir = raw_dir
+        self.files = {}
+        self.state = {}
+
+        if path.exists():
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.files = data.get('files', {})
+                self.state = data.get('state', {})
+
+    def __bool__(self):
+        return bool(self.files)
+
+    def key(self, path):
+        return path.relative_to(self.raw_dir).as_posix()
+
+    def changed_files(self, paths):
+        """
+        Fichiers nouveaux ou dont le contenu a changé depuis le dernier enregistrement
+
+        Returns:
+            (liste des fichiers modifiés, dict {clé: signature} de tous les fichiers)
+        """
+        changed = []
+        signatures = {}
+        for path in paths:
+            key = self.key(path)
+            previous = self.files.get(key)
+            signature = file_signature(path, previous)
+            signatures[key] = signature
+            if previous is None or previous.get('sha256') != signature['sha256']:
+                changed.append(path)
+        return changed, signatures
+
+    def unchanged(self, paths):
+        """Vrai si chaque fichier a la même présence et le même contenu qu'au dernier enregistrement"""
+        for path in paths:
+            previous = self.files.get(self.key(path))
+            if not path.exists():
+                if previous is not None:
+                    return False
+                continue
+            if previous is None or file_signature(path, previous)['sha256'] != previous['sha256']:
+                return False
+        return True
+
+    def signatures(self, paths):
+        """Signatures des fichiers existants (dict {clé: signature})"""
+        return {
+            self.key(path): file_signature(path, self.files.get(self.key(path)))
+            for path in paths if path.exists()
+        }
+
+    def recorded_under(self, directory):
+        """Clés enregistrées des fichiers d'un dossier de data/raw (sous-dossiers compris)"""
+        prefix = self.key(directory) + '/'
+        return {key for key in self.files if key.startswith(prefix)}
+
+    def forget(self, keys):
+        """Retire des fichiers du manifest (fichiers supprimés depuis le dernier run)"""
+        for key in keys:
+            self.files.pop(key, None)
+
+    def reset(self):
+        """Oublie les fichiers et l'état enregistrés (reconstruction complète)"""
+        self.files = {}
+        self.state = {}
+
+    def record(self, signatures):
+        """Enregistre des signatures (dict {clé: signature})"""
+        self.files.update(signatures)
+
+    def save(self):
+        data = {
+            'version': MANIFEST_VERSION,
+            'updated_at': datetime.now().isoformat(),
+            'files': self.files,
+            'state': self.state
+        }
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        tmp_path.replace(self.path)
@@ -0,0 +1,248 @@
+"""
+Pipeline de preprocessing par étapes avec cache d'artefacts
+Chaque étape déclare les étapes dont elle dépend, ses fichiers d'entrée et ses paramètres.
+Sa sortie est mise en cache dans data/processed/cache/stages/ (<étape>.parquet en GeoParquet
+pour un GeoDataFrame, <étape>.pkl sinon) sous une clé
+SHA-256 de (nom, version, paramètres, contenu des fichiers d'entrée, clés des étapes amont) :
+une étape n'est recalculée que si sa clé a changé (ou si elle est forcée).
+
+Les sorties des étapes en cache ne sont chargées que si une étape recalculée
+(ou l'appelant, via result()) en a besoin.
+"""
+
+import hashlib
+import json
+import time
+import pandas as pd
+import geopandas as gpd
+
+from preprocessing.manifest import file_signature
+from preprocessing.profiling import Profiler, output_rows
+
+STAGE_CACHE_DIRNAME = "stages"
+_INDEX_FILENAME = "index.json"
+
+
+class StageUnavailable(Exception):
+    """Sortie d'une étape absente du cache alors qu'elle ne doit pas être recalculée"""
+
+
+class Stage:
+    """
+    Étape du pipeline
+
+    Args:
+        name: nom de l'étape (utilisé par --only / --from-stage)
+        func: fonction appelée avec les sorties des étapes amont (dans l'ordre de deps)
+              puis les paramètres en arguments nommés
+        title: libellé affiché
+        deps: noms des étapes amont
+        inputs: fichiers lus par l'étape (leur contenu entre dans la clé de cache)
+        params: paramètres (sérialisables en JSON, entrent dans la clé de cache)
+        version: à incrémenter quand le code de l'étape change
+    """
+
+    def __init__(self, name, func, title, deps=(), inputs=(), params=None, version=1):
+        self.name = name
+        self.func = func
+        self.title = title
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.params = dict(params or {})
+        self.version = version
+
+
+class StageCache:
+    """
+    Cache des sorties d'étapes et des signatures des fichiers d'entrée
+
+    Les GeoDataFrame sont stockés en GeoParquet (lecture binaire rapide, CRS de chaque
+    colonne géométrique conservé), les autres sorties en pickle.
+
+    Args:
+        cache_dir: dossier du cache (data/processed/cache)
+    """
+
+    def __init__(self, cache_dir):
+        self.dir = cache_dir / STAGE_CACHE_DIRNAME
+        self.index_path = self.dir / _INDEX_FILENAME
+        self.files = {}
+        self.keys = {}
+
+        if self.index_path.exists():
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            self.files = index.get('files', {})
+            self.keys = index.get('stages', {})
+
+    def file_hash(self, path):
+        """Hash du contenu d'un fichier (None si absent), réutilisé si taille et mtime inchangés"""
+        key = str(path)
+        if not path.exists():
+            self.files.pop(key, None)
+            return None
+        signature = file_signature(path, self.files.get(key))
+        self.files[key] = signature
+        return signature['sha256']
+
+    def _path(self, name):
+        """Fichier de sortie existant d'une étape (None si absent)"""
+        for suffix in ('.parquet', '.pkl'):
+            path = self.dir / f"{name}{suffix}"
+            if path.exists():
+                return path
+        return None
+
+    def has(self, name, key):
+        return self.keys.get(name) == key and self._path(name) is not None
+
+    def load(self, name):
+        path = self._path(name)
+        if path.suffix == '.parquet':
+            return gpd.read_parquet(path)
+        return pd.read_pickle(path)
+
+    def store(self, name, key, value):
+        """Écriture atomique de la sortie d'une étape"""
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+        previous = self._path(name)
+        if isinstance(value, gpd.GeoDataFrame):
+            path = self.dir / f"{name}.parquet"
+            tmp_path = path.with_suffix('.tmp')
+            value.to_parquet(tmp_path)
+        else:
+            path = self.dir / f"{name}.pkl"
+            tmp_path = path.with_suffix('.tmp')
+            pd.to_pickle(value, tmp_path)
+        tmp_path.replace(path)
+
+        if previous is not None and previous != path:
+            previous.unlink()
+
+        self.keys[name] = key
+        self.save()
+
+    def save(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'files': self.files, 'stages': self.keys}, f, indent=2)
+        tmp_path.replace(self.index_path)
+
+
+class Pipeline:
+    """
+    Enchaînement d'étapes (déclarées dans l'ordre d'exécution) avec cache
+
+    Args:
+        stages: liste de Stage, chaque étape après ses dépendances
+        cache: StageCache
+        profiler: Profiler mesurant chaque étape (temps, CPU, pic RSS, lignes)
+    """
+
+    def __init__(self, stages, cache, profiler=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = [stage.name for stage in stages]
+        self.cache = cache
+        self.profiler = profiler or Profiler()
+        self.ran = []
+        self.timings = {}
+        self._keys = {}
+        self._results = {}
+
+        for stage in stages:
+            unknown = [dep for dep in stage.deps if dep not in self.stages]
+            if unknown:
+                raise ValueError(f"Étape {stage.name}: dépendances inconnues {unknown}")
+
+    def key(self, name):
+        """Clé de cache d'une étape (dépend récursivement des étapes amont)"""
+        if name not in self._keys:
+            stage = self.stages[name]
+            payload = {
+                'name': stage.name,
+                'version': stage.version,
+                'params': stage.params,
+                'inputs': {str(path): self.cache.file_hash(path) for path in stage.inputs},
+                'deps': {dep: self.key(dep) for dep in stage.deps}
+            }
+            encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+            self._keys[name] = hashlib.sha256(encoded).hexdigest()
+        return self._keys[name]
+
+    def downstream(self, name):
+        """Étapes dépendant (directement ou non) d'une étape, elle comprise"""
+        found = {name}
+        for stage_name in self.order:
+            if any(dep in found for dep in self.stages[stage_name].deps):
+                found.add(stage_name)
+        return found
+
+    def result(self, name):
+        """Sortie d'une étape (calculée pendant ce run ou chargée depuis le cache)"""
+        if name not in self._results:
+            if not self.cache.has(name, self.key(name)):
+                raise StageUnavailable(
+                    f"sortie de l'étape '{name}' absente du cache ou périmée "
+                    f"(relancer sans --only, ou avec --only {name})"
+                )
+            self._results[name] = self.cache.load(name)
+        return self._results[name]
+
+    def run(self, only=None, from_stage=None, force=False):
+        """
+        Exécute le pipeline
+
+        Args:
+            only: noms des seules étapes à exécuter, toujours recalculées
+                  (les sorties des étapes amont doivent être en cache)
+            from_stage: recalcule cette étape et toutes celles qui en dépendent
+            force: recalcule toutes les étapes sans consulter le cache
+
+        Returns:
+            liste des étapes recalculées
+        """
+        for name in list(only or []) + ([from_stage] if from_stage else []):
+            if name not in self.stages:
+                raise ValueError(f"Étape inconnue: {name} (disponibles: {', '.join(self.order)})")
+
+        if only:
+            needed = set(only)
+            forced = set(only)
+        else:
+            needed = set(self.order)
+            forced = set(self.order) if force else set()
+            if from_stage:
+                forced |= self.downstream(from_stage)
+
+        for position, name in enumerate(self.order, start=1):
+            if name not in needed:
+                continue
+            stage = self.stages[name]
+            key = self.key(name)
+
+            if name not in forced and self.cache.has(name, key):
+                print(f"\n♻️  [{position}/{len(self.order)} {name}] {stage.title}: résultat en cache")
+                self.profiler.cached(name)
+                continue
+
+            print(f"\n▶️  [{position}/{len(self.order)} {name}] {stage.title}...")
+            stage_start = time.perf_counter()
+
+            # Sorties amont chargées hors mesure (lecture du cache)
+            inputs = [self.result(dep) for dep in stage.deps]
+            with self.profiler.stage(name) as record:
+                value = stage.func(*inputs, **stage.params)
+                record['rows'] = output_rows(value)
+
+            self.timings[name] = time.perf_counter() - stage_start
+            self._results[name] = value
+
+            store_start = time.perf_counter()
+            self.cache.store(name, key, value)
+            record['cache_write_s'] = round(time.perf_counter() - store_start, 3)
+            self.ran.append(name)
+
+        self.cache.save()
+        return self.ran
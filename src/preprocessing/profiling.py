@@ -0,0 +1,216 @@
+"""
+Profil d'exécution du preprocessing (temps et mémoire par étape)
+Chaque étape est mesurée dans un context manager : temps mur, temps CPU (processus et
+processus fils, ex. pool du mode tuilé), pic de mémoire résidente et nombre de lignes
+produites. Le profil est écrit dans data/processed/preprocess_profile.json et résumé
+dans un tableau en fin de run.
+
+Pic RSS : sous Linux, le pic du processus (VmHWM) est remis à zéro au début de chaque
+étape (/proc/self/clear_refs), le pic mesuré est donc celui de l'étape. Ailleurs, seul
+le pic depuis le lancement est disponible (ru_maxrss).
+
+Avec cprofile, les étapes sont aussi profilées par cProfile et les statistiques de
+l'étape la plus lente sont écrites en .pstats (lecture : python -m pstats <fichier>).
+
+Utilisation typique:
+    profiler = Profiler()
+    with profiler.stage('save') as record:
+        record['rows'] = len(df)
+    profiler.write(DATA_PROCESSED_DIR / PROFILE_FILENAME)
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import pstats
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows : pas de getrusage
+    resource = None
+
+# Fichier du profil (dans data/processed)
+PROFILE_FILENAME = "preprocess_profile.json"
+
+_CLEAR_REFS_PATH = "/proc/self/clear_refs"
+_STATUS_PATH = "/proc/self/status"
+
+
+def _status_mb(field):
+    """Valeur (Mo) d'un champ de /proc/self/status (VmRSS, VmHWM), None si indisponible"""
+    try:
+        with open(_STATUS_PATH) as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Remet le pic RSS du processus à la valeur courante (Linux), False si impossible"""
+    try:
+        with open(_CLEAR_REFS_PATH, 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Pic RSS du processus (Mo) : VmHWM (depuis reset_peak_rss) si disponible, sinon ru_maxrss"""
+    peak = _status_mb('VmHWM')
+    return peak if peak is not None else _maxrss_mb()
+
+
+def current_rss_mb():
+    """RSS courant du processus (Mo), None si indisponible"""
+    return _status_mb('VmRSS')
+
+
+def _maxrss_mb(children=False):
+    """Pic RSS depuis le lancement (Mo) : ru_maxrss en Ko sous Linux, en octets sous macOS"""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def _children_cpu_s():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def output_rows(value):
+    """Nombre de lignes d'une sortie d'étape (DataFrame, tableau, dict d'edges), None sinon"""
+    if hasattr(value, 'shape') and len(value.shape):
+        return int(value.shape[0])
+    if isinstance(value, dict) and 'n_edges' in value:
+        return int(value['n_edges'])
+    if isinstance(value, dict) and 'edge_osm_id' in value:
+        return len(value['edge_osm_id'])
+    return None
+
+
+class Profiler:
+    """
+    Mesures par étape
+
+    Args:
+        cprofile: None (pas de cProfile), 'auto' (toutes les étapes, seule la plus lente est
+                  écrite) ou nom d'une étape
+    """
+
+    def __init__(self, cprofile=None):
+        self.cprofile = cprofile
+        self.records = []
+        self.start = time.perf_counter()
+        self._profiles = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Mesure le bloc ; le dict produit peut être complété (ex. record['rows'])"""
+        record = {'stage': name, 'cached': False, 'rows': None}
+        peak_scope = 'stage' if reset_peak_rss() else 'process'
+        children_peak = _maxrss_mb(children=True)
+
+        profile = None
+        if self.cprofile in ('auto', name):
+            profile = cProfile.Profile()
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        children_cpu_start = _children_cpu_s()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._profiles[name] = profile
+
+            record['wall_s'] = round(time.perf_counter() - wall_start, 3)
+            record['cpu_s'] = round(time.process_time() - cpu_start, 3)
+            children_cpu = _children_cpu_s() - children_cpu_start
+            if children_cpu > 0:
+                record['children_cpu_s'] = round(children_cpu, 3)
+
+            peak = _status_mb('VmHWM') if peak_scope == 'stage' else _maxrss_mb()
+            record['peak_rss_mb'] = round(peak, 1) if peak is not None else None
+            record['peak_rss_scope'] = peak_scope
+            rss = current_rss_mb()
+            record['rss_end_mb'] = round(rss, 1) if rss is not None else None
+
+            # Pic des processus fils terminés pendant l'étape (pool du mode tuilé)
+            if children_peak is not None and _maxrss_mb(children=True) > children_peak:
+                record['children_peak_rss_mb'] = round(_maxrss_mb(children=True), 1)
+
+            self.records.append(record)
+
+    def cached(self, name):
+        """Étape non recalculée (résultat en cache)"""
+        self.records.append({'stage': name, 'cached': True, 'rows': None, 'wall_s': 0.0})
+
+    def slowest(self):
+        """Étape recalculée la plus lente (None si aucune)"""
+        computed = [record for record in self.records if not record['cached']]
+        return max(computed, key=lambda record: record['wall_s'])['stage'] if computed else None
+
+    def dump_slowest(self, output_dir, top=15):
+        """
+        Écrit les statistiques cProfile de l'étape profilée la plus lente
+
+        Returns:
+            chemin du .pstats (None si aucune étape profilée)
+        """
+        profiled = [record for record in self.records if record['stage'] in self._profiles]
+        if not profiled:
+            return None
+        name = max(profiled, key=lambda record: record['wall_s'])['stage']
+
+        path = output_dir / f"preprocess_profile_{name}.pstats"
+        self._profiles[name].dump_stats(path)
+
+        print(f"\n🔬 cProfile de l'étape {name} ({top} fonctions les plus coûteuses, temps cumulé):")
+        pstats.Stats(str(path)).sort_stats('cumulative').print_stats(top)
+        return path
+
+    def write(self, path, **metadata):
+        """Écrit le profil JSON (métadonnées du run + mesures par étape), de façon atomique"""
+        profile = {
+            'generated_at': datetime.now().isoformat(),
+            'pid': os.getpid(),
+            **metadata,
+            'total_wall_s': round(time.perf_counter() - self.start, 3),
+            'peak_rss_mb': _maxrss_mb(),
+            'slowest_stage': self.slowest(),
+            'stages': self.records,
+        }
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(profile, f, indent=2)
+        tmp_path.replace(path)
+        return path
+
+    def print_summary(self):
+        """Tableau récapitulatif des étapes"""
+        print(f"\n{'Étape':<16} {'Mur (s)':>9} {'CPU (s)':>9} {'Pic RSS (Mo)':>13} {'Lignes':>12}")
+        print("-" * 63)
+        for record in self.records:
+            if record['cached']:
+                print(f"{record['stage']:<16} {'cache':>9}")
+                continue
+            cpu = record['cpu_s'] + record.get('children_cpu_s', 0)
+            peak = '-' if record['peak_rss_mb'] is None else f"{record['peak_rss_mb']:,.0f}"
+            rows = '-' if record['rows'] is None else f"{record['rows']:,}"
+            print(f"{record['stage']:<16} {record['wall_s']:>9.2f} {cpu:>9.2f} {peak:>13} {rows:>12}")
+        print("-" * 63)
+        print(f"{'Total':<16} {time.perf_counter() - self.start:>9.2f}")
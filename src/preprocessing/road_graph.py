@@ -0,0 +1,215 @@
+"""
+Graphe du réseau routier (topologie des edges OSM)
+Les sommets des LineString (Lambert 93) sont regroupés sur une grille de pas snap_m : un
+nœud du graphe est une extrémité de way ou un sommet partagé par plusieurs ways
+(intersection). Chaque way est découpé en segments entre ses nœuds successifs, de longueur
+mesurée le long de la géométrie.
+
+Structures (numpy / scipy.sparse, sans networkx) :
+- adjacency: matrice CSR nœud × nœud (non orientée) des longueurs en m (plus court segment
+  entre deux nœuds) ; utilisable directement par scipy.sparse.csgraph
+- incidence: matrice CSR edge × nœud (nœuds traversés par chaque way)
+- segment_nodes / segment_length / segment_edge: segments (nœuds, longueur, position de l'edge)
+- edge_osm_id: osm_id de chaque edge (position dans le réseau)
+
+Le sens unique n'est pas pris en compte (réseau cyclable : contresens fréquents).
+
+Lecture typique:
+    graph = load_road_graph(DATA_PROCESSED_DIR / ROAD_GRAPH_FILENAME)
+    neighbours = edge_adjacency(graph)[position].indices
+"""
+
+import numpy as np
+import shapely
+from scipy import sparse
+from scipy.sparse import csgraph
+
+# Fichier du graphe (dans data/processed)
+ROAD_GRAPH_FILENAME = "road_graph_v3.npz"
+
+# Pas (m) de regroupement des sommets en nœuds
+DEFAULT_SNAP_M = 0.5
+
+_GRAPH_ARRAYS = ['edge_osm_id', 'node_xy', 'segment_nodes', 'segment_length', 'segment_edge']
+_GRAPH_MATRICES = ['adjacency', 'incidence']
+
+
+def road_graph_from_coordinates(coords, parts, edge_osm_ids, snap_m=DEFAULT_SNAP_M):
+    """
+    Construit le graphe à partir des sommets de toutes les géométries
+
+    Args:
+        coords: coordonnées Lambert 93 des sommets (n_sommets × 2), way par way, dans l'ordre
+        parts: position de l'edge de chaque sommet (croissante)
+        edge_osm_ids: osm_id de chaque edge (par position)
+        snap_m: pas (m) de regroupement des sommets
+
+    Returns:
+        dict du graphe (voir le docstring du module)
+    """
+    edge_osm_ids = np.asarray(edge_osm_ids, dtype=np.int64)
+    n_edges = len(edge_osm_ids)
+    parts = np.asarray(parts, dtype=np.int64)
+    if len(coords) == 0:
+        raise ValueError("Réseau vide : aucun sommet pour construire le graphe")
+
+    # Cellule de la grille de chaque sommet (clé entière unique par cellule)
+    grid = np.round(coords / snap_m).astype(np.int64)
+    grid -= grid.min(axis=0)
+    cell_keys = grid[:, 0] * (int(grid[:, 1].max()) + 1) + grid[:, 1]
+    _, first_vertex, cell = np.unique(cell_keys, return_index=True, return_inverse=True)
+    n_cells = len(first_vertex)
+
+    # Nœuds : cellules partagées par plusieurs ways ou contenant une extrémité
+    starts = np.r_[True, parts[1:] != parts[:-1]]
+    ends = np.r_[parts[1:] != parts[:-1], True]
+    cell_ways = np.unique(cell * n_edges + parts) // n_edges
+    is_node = np.bincount(cell_ways, minlength=n_cells) >= 2
+    is_node[cell[starts | ends]] = True
+
+    node_of_cell = np.full(n_cells, -1, dtype=np.int64)
+    node_of_cell[is_node] = np.arange(is_node.sum())
+    node_xy = coords[first_vertex[is_node]]
+
+    # Longueur cumulée le long de chaque way (pas de saut d'un way au suivant)
+    steps = np.hypot(*np.diff(coords, axis=0).T)
+    steps[starts[1:]] = 0
+    cumulative = np.r_[0.0, np.cumsum(steps)]
+
+    # Sommets-nœuds dans l'ordre des ways : deux nœuds successifs d'un même way = un segment
+    node_vertices = np.flatnonzero(is_node[cell])
+    vertex_nodes = node_of_cell[cell[node_vertices]]
+    a, b = node_vertices[:-1], node_vertices[1:]
+    same_way = parts[a] == parts[b]
+    u, v = vertex_nodes[:-1][same_way], vertex_nodes[1:][same_way]
+    length = (cumulative[b] - cumulative[a])[same_way]
+    segment_edge = parts[a][same_way]
+
+    # Boucles (way fermé sur un seul nœud) : sans intérêt pour les plus courts chemins
+    keep = u != v
+    segment_nodes = np.column_stack([u[keep], v[keep]]).astype(np.int32)
+    segment_length = length[keep]
+    segment_edge = segment_edge[keep]
+
+    n_nodes = len(node_xy)
+    adjacency = _adjacency(segment_nodes, segment_length, n_nodes)
+
+    incidence_pairs = np.unique(parts[node_vertices] * n_nodes + vertex_nodes)
+    incidence = sparse.csr_matrix(
+        (np.ones(len(incidence_pairs), dtype=np.int8),
+         (incidence_pairs // n_nodes, incidence_pairs % n_nodes)),
+        shape=(n_edges, n_nodes)
+    )
+
+    return {
+        'snap_m': snap_m,
+        'edge_osm_id': edge_osm_ids,
+        'node_xy': node_xy,
+        'segment_nodes': segment_nodes,
+        'segment_length': segment_length,
+        'segment_edge': segment_edge,
+        'adjacency': adjacency,
+        'incidence': incidence,
+    }
+
+
+def _adjacency(segment_nodes, segment_length, n_nodes):
+    """CSR symétrique des longueurs (segments parallèles : le plus court)"""
+    rows = np.r_[segment_nodes[:, 0], segment_nodes[:, 1]].astype(np.int64)
+    cols = np.r_[segment_nodes[:, 1], segment_nodes[:, 0]].astype(np.int64)
+    lengths = np.r_[segment_length, segment_length]
+
+    order = np.lexsort((lengths, cols, rows))
+    rows, cols, lengths = rows[order], cols[order], lengths[order]
+    first = np.r_[True, (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])][:len(rows)]
+
+    return sparse.csr_matrix((lengths[first], (rows[first], cols[first])), shape=(n_nodes, n_nodes))
+
+
+def build_road_graph(edges_lam, snap_m=DEFAULT_SNAP_M):
+    """
+    Graphe du réseau (étape road_graph)
+
+    Args:
+        edges_lam: GeoDataFrame des edges (load_osm : géométrie Lambert 93, colonne osm_id)
+        snap_m: pas (m) de regroupement des sommets
+
+    Returns:
+        dict du graphe, edges dans l'ordre des lignes de edges_lam
+    """
+    coords, parts = shapely.get_coordinates(np.asarray(edges_lam.geometry.values), return_index=True)
+    graph = road_graph_from_coordinates(coords, parts, edges_lam['osm_id'].to_numpy(), snap_m)
+    print_summary(graph)
+    return graph
+
+
+def print_summary(graph):
+    n_components, _ = csgraph.connected_components(graph['adjacency'], directed=False)
+    print(f"   ✅ Graphe: {len(graph['node_xy']):,} nœuds, {len(graph['segment_length']):,} segments "
+          f"({len(graph['edge_osm_id']):,} edges, {n_components:,} composantes connexes)")
+
+
+def edge_adjacency(graph):
+    """Matrice CSR edge × edge (booléenne) : edges qui partagent un nœud"""
+    incidence = graph['incidence'].astype(np.int32)
+    shared = (incidence @ incidence.T).tocoo()
+    off_diagonal = shared.row != shared.col
+    return sparse.csr_matrix(
+        (np.ones(off_diagonal.sum(), dtype=bool), (shared.row[off_diagonal], shared.col[off_diagonal])),
+        shape=shared.shape
+    )
+
+
+def edges_within(graph, position, max_distance_m):
+    """
+    Edges atteignables par le réseau à moins de max_distance_m des nœuds d'un edge
+
+    Returns:
+        (positions des edges, distance réseau en m de leur nœud le plus proche)
+    """
+    sources = graph['incidence'][position].indices
+    if len(sources) == 0:
+        return np.array([position]), np.zeros(1)
+
+    node_distance = csgraph.dijkstra(
+        graph['adjacency'], directed=False, indices=sources, limit=max_distance_m, min_only=True
+    )
+
+    # Distance d'un edge = celle de son nœud le plus proche
+    incidence = graph['incidence']
+    edge_distance = np.full(incidence.shape[0], np.inf)
+    rows = np.repeat(np.arange(incidence.shape[0]), np.diff(incidence.indptr))
+    np.minimum.at(edge_distance, rows, node_distance[incidence.indices])
+
+    positions = np.flatnonzero(np.isfinite(edge_distance))
+    return positions, edge_distance[positions]
+
+
+def save_road_graph(graph, path):
+    """Écrit le graphe en .npz (tableaux + composantes CSR), de façon atomique"""
+    arrays = {name: graph[name] for name in _GRAPH_ARRAYS}
+    for name in _GRAPH_MATRICES:
+        matrix = graph[name]
+        arrays.update({
+            f"{name}_data": matrix.data, f"{name}_indices": matrix.indices,
+            f"{name}_indptr": matrix.indptr, f"{name}_shape": np.asarray(matrix.shape)
+        })
+    arrays['snap_m'] = np.asarray(graph['snap_m'])
+
+    tmp_path = path.with_suffix('.tmp.npz')
+    np.savez(tmp_path, **arrays)
+    tmp_path.replace(path)
+    return path
+
+
+def load_road_graph(path):
+    """Lit un graphe écrit par save_road_graph"""
+    with np.load(path) as arrays:
+        graph = {name: arrays[name] for name in _GRAPH_ARRAYS}
+        for name in _GRAPH_MATRICES:
+            graph[name] = sparse.csr_matrix(
+                (arrays[f"{name}_data"], arrays[f"{name}_indices"], arrays[f"{name}_indptr"]),
+                shape=tuple(arrays[f"{name}_shape"])
+            )
+        graph['snap_m'] = float(arrays['snap_m'])
+    return graph
@@ -0,0 +1,199 @@
+"""
+Propagation spatiale des comptages des capteurs vers les edges sans capteur
+Pour chaque edge et chaque heure : moyenne des comptages des edges avec capteurs voisins,
+pondérée par exp(-d / bandwidth_m) où d est la distance par le réseau routier
+(road_graph, Dijkstra borné à radius_m). L'edge lui-même est exclu : sur un edge avec
+capteur, la feature ne dépend que des autres capteurs (pas de fuite de la target).
+
+Les poids sont précalculés une fois dans une matrice creuse edge × capteur W ; pour une
+matrice de comptages capteur × heures C (NaN = pas de mesure), les features de tous les
+edges et de toutes les heures sont obtenues par un seul produit creux W @ [C | masque] :
+- nearby_sensor_count: Σ w·c / Σ w sur les capteurs mesurés à cette heure (NaN si aucun)
+- nearby_sensor_weight: Σ w sur les capteurs mesurés (0 = aucun capteur proche)
+
+Les features ne dépendent que des comptages de la même heure : un run incrémental ne
+recalcule que les heures reconstruites.
+
+Lecture typique:
+    weights = load_sensor_weights(DATA_PROCESSED_DIR / SENSOR_WEIGHTS_FILENAME)
+    mean, weight = propagate(weights['weights'], counts)
+"""
+
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from preprocessing.road_graph import edges_within
+
+# Fichier de la matrice de poids (dans data/processed)
+SENSOR_WEIGHTS_FILENAME = "sensor_weights_v3.npz"
+
+# Distance réseau (m) maximale entre un edge et un capteur pris en compte
+DEFAULT_RADIUS_M = 2000
+# Distance (m) de décroissance des poids exp(-d / bandwidth_m)
+DEFAULT_BANDWIDTH_M = 500
+
+SPATIAL_FEATURE_COLUMNS = ['nearby_sensor_count', 'nearby_sensor_weight']
+
+
+def sensor_weight_matrix(graph, sensor_edge_ids, radius_m=DEFAULT_RADIUS_M, bandwidth_m=DEFAULT_BANDWIDTH_M):
+    """
+    Matrice creuse des poids edge × capteur
+
+    Args:
+        graph: graphe routier (road_graph)
+        sensor_edge_ids: osm_id des edges avec capteurs (colonnes de la matrice)
+        radius_m: distance réseau maximale
+        bandwidth_m: distance de décroissance des poids
+
+    Returns:
+        dict {'weights': CSR float32 (edges du graphe × capteurs),
+              'edge_osm_id': osm_id des lignes, 'sensor_edge_id': osm_id des colonnes}
+    """
+    sensor_edge_ids = np.asarray(sorted(sensor_edge_ids), dtype=np.int64)
+    sensor_positions = pd.Index(graph['edge_osm_id']).get_indexer(sensor_edge_ids)
+
+    rows, cols, values = [], [], []
+    for col, position in enumerate(sensor_positions):
+        if position < 0:
+            continue
+        positions, distance = edges_within(graph, position, radius_m)
+        # L'edge du capteur ne se voit pas lui-même
+        others = positions != position
+        rows.append(positions[others])
+        cols.append(np.full(others.sum(), col))
+        values.append(np.exp(-distance[others] / bandwidth_m))
+
+    n_edges = len(graph['edge_osm_id'])
+    weights = sparse.csr_matrix(
+        (np.concatenate(values or [np.zeros(0)]).astype(np.float32),
+         (np.concatenate(rows or [np.zeros(0, dtype=np.int64)]),
+          np.concatenate(cols or [np.zeros(0, dtype=np.int64)]))),
+        shape=(n_edges, len(sensor_edge_ids))
+    )
+
+    return {'weights': weights, 'edge_osm_id': graph['edge_osm_id'], 'sensor_edge_id': sensor_edge_ids}
+
+
+def sensor_weights(graph, sensors, radius_m, bandwidth_m):
+    """Étape sensor_weights : matrice des poids vers les edges avec capteurs"""
+    weights = sensor_weight_matrix(graph, sensors['edges_with_sensors'], radius_m, bandwidth_m)
+
+    covered = np.diff(weights['weights'].indptr) > 0
+    print(f"   ✅ {weights['weights'].nnz:,} poids edge → capteur (≤{radius_m:g}m par le réseau)")
+    print(f"   • {covered.sum():,} edges sur {len(covered):,} ont au moins un capteur proche")
+
+    return weights
+
+
+def propagate(weights, counts):
+    """
+    Features de propagation pour toutes les lignes de weights et toutes les heures
+
+    Args:
+        weights: CSR (edges × capteurs)
+        counts: comptages (capteurs × heures), NaN = pas de mesure
+
+    Returns:
+        (nearby_sensor_count, nearby_sensor_weight), tableaux float32 (edges × heures)
+    """
+    measured = np.isfinite(counts)
+    n_hours = counts.shape[1]
+
+    # Un seul produit creux pour les sommes pondérées et les poids des capteurs mesurés
+    stacked = np.hstack([np.where(measured, counts, 0), measured]).astype(np.float32)
+    product = weights @ stacked
+    weighted_sum, weight = product[:, :n_hours], product[:, n_hours:]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(weight > 0, weighted_sum / weight, np.nan)
+    return mean.astype(np.float32), weight.astype(np.float32)
+
+
+def add_spatial_features(final_df, weights):
+    """
+    Ajoute SPATIAL_FEATURE_COLUMNS aux lignes (edge × heure) du dataset
+
+    Les comptages des capteurs sont lus dans le dataset lui-même (bike_count des edges
+    avec capteurs) : seules les lignes de W des edges présents sont multipliées.
+    """
+    start = time.perf_counter()
+    final_df = final_df.drop(columns=[c for c in SPATIAL_FEATURE_COLUMNS if c in final_df.columns])
+
+    timestamps = pd.Index(final_df['timestamp'].unique()).sort_values()
+    sensor_edges = pd.Index(weights['sensor_edge_id'])
+    row_edges = pd.Index(final_df['edge_id'].unique())
+
+    # Matrice capteur × heures des comptages
+    counts = np.full((len(sensor_edges), len(timestamps)), np.nan)
+    measured = final_df[final_df['edge_id'].isin(sensor_edges) & final_df['bike_count'].notna()]
+    counts[sensor_edges.get_indexer(measured['edge_id']), timestamps.get_indexer(measured['timestamp'])] = \
+        measured['bike_count'].to_numpy(dtype=float)
+
+    # Lignes de W des edges du dataset (edge absent du graphe : aucun voisin)
+    edge_rows = pd.Index(weights['edge_osm_id']).get_indexer(row_edges)
+    subset = weights['weights'][np.maximum(edge_rows, 0)]
+    subset = sparse.diags((edge_rows >= 0).astype(np.float32)) @ subset
+
+    mean, weight = propagate(subset, counts)
+
+    row_index = row_edges.get_indexer(final_df['edge_id'])
+    hour_index = timestamps.get_indexer(final_df['timestamp'])
+    final_df['nearby_sensor_count'] = mean[row_index, hour_index]
+    final_df['nearby_sensor_weight'] = weight[row_index, hour_index]
+
+    n_covered = int((final_df['nearby_sensor_weight'] > 0).sum())
+    print(f"   ⏱️  Propagation spatiale: {time.perf_counter() - start:.2f}s "
+          f"({len(row_edges)} edges × {len(timestamps)} heures)")
+    print(f"   ✅ {n_covered:,} lignes sur {len(final_df):,} avec au moins un capteur voisin mesuré")
+
+    return final_df
+
+
+def propagate_hour(weights, sensor_counts, osm_ids):
+    """
+    Features de propagation d'une seule heure (prédiction)
+
+    Args:
+        weights: dict de sensor_weight_matrix / load_sensor_weights
+        sensor_counts: Series des comptages de l'heure, indexée par osm_id des edges avec capteurs
+        osm_ids: Series des osm_id des edges à prédire
+
+    Returns:
+        DataFrame SPATIAL_FEATURE_COLUMNS aligné sur l'index de osm_ids
+    """
+    counts = sensor_counts.reindex(weights['sensor_edge_id']).to_numpy(dtype=float)[:, None]
+    mean, weight = propagate(weights['weights'], counts)
+
+    rows = pd.Index(weights['edge_osm_id']).get_indexer(osm_ids)
+    known = rows >= 0
+    return pd.DataFrame({
+        'nearby_sensor_count': np.where(known, mean[rows, 0], np.nan),
+        'nearby_sensor_weight': np.where(known, weight[rows, 0], 0),
+    }, index=osm_ids.index).astype('float32')
+
+
+def save_sensor_weights(weights, path):
+    """Écrit la matrice de poids en .npz, de façon atomique"""
+    matrix = weights['weights']
+    tmp_path = path.with_suffix('.tmp.npz')
+    np.savez(
+        tmp_path,
+        data=matrix.data, indices=matrix.indices, indptr=matrix.indptr, shape=np.asarray(matrix.shape),
+        edge_osm_id=weights['edge_osm_id'], sensor_edge_id=weights['sensor_edge_id']
+    )
+    tmp_path.replace(path)
+    return path
+
+
+def load_sensor_weights(path):
+    """Lit une matrice de poids écrite par save_sensor_weights"""
+    with np.load(path) as arrays:
+        return {
+            'weights': sparse.csr_matrix(
+                (arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape'])
+            ),
+            'edge_osm_id': arrays['edge_osm_id'],
+            'sensor_edge_id': arrays['sensor_edge_id'],
+        }
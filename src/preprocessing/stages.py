@@ -0,0 +1,377 @@
+"""
+Étapes du preprocessing v3
+Une fonction par étape du pipeline (voir create_ml_dataset_v3.py pour leur enchaînement
+et preprocessing.pipeline pour le cache) :
+
+- load_osm: réseau OSM → GeoDataFrame Lambert 93 + géométrie WGS84 (une seule reprojection,
+  mis en cache en GeoParquet)
+- match_sensors: association capteur → edge le plus proche
+- bike_infra: distance de chaque edge à la piste cyclable la plus proche
+- load_weather: table météo horaire
+- edge_features: features statiques de tous les edges (table compacte sans géométrie)
+- temporal: dataset (edges avec capteurs × heures)
+- lags: lag features
+"""
+
+import json
+import time
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import Point
+
+from preprocessing.weather_alignment import WeatherAligner, load_weather_files
+from preprocessing.counter_loader import load_counter_files
+from preprocessing.temporal_dataset import aggregate_counts, build_temporal_rows
+from preprocessing.lag_features import add_lag_features
+from preprocessing.dataset_io import compact_dtypes
+from preprocessing.edge_attributes import (
+    DEFAULT_LANES, DEFAULT_MAXSPEED_KMH, edge_orientation, parse_int_tag, road_category, surface_quality
+)
+
+# Centre de Lyon (Place Bellecour)
+LYON_CENTER = (4.8320, 45.7578)
+
+# Colonnes de la table des features statiques des edges (edges_static_v3, sans la géométrie)
+EDGE_TABLE_COLUMNS = [
+    'osm_id', 'name', 'highway_type', 'road_category', 'lanes', 'maxspeed_kmh',
+    'is_oneway', 'has_cycleway', 'cycleway_type', 'has_dedicated_bike_lane',
+    'bike_lane_distance_m', 'surface_quality', 'bicycle_access', 'is_lit',
+    'edge_length_m', 'distance_to_center_km', 'orientation', 'has_real_sensor'
+]
+
+
+def load_osm(osm_file):
+    """
+    Charge le réseau OSM
+
+    Returns:
+        GeoDataFrame des edges, géométrie active en Lambert 93 (EPSG:2154, calculs de
+        distance) et géométrie d'origine dans 'geometry_wgs84' (EPSG:4326, exports)
+    """
+    with open(osm_file, 'r') as f:
+        osm_data = json.load(f)
+
+    edges_gdf = gpd.GeoDataFrame.from_features(
+        osm_data['geojson']['features'],
+        crs="EPSG:4326"
+    )
+
+    print(f"   ✅ {len(edges_gdf)} edges OSM chargés")
+
+    # Lambert 93 pour les calculs de distance (partagé par les étapes suivantes)
+    edges_gdf['geometry_wgs84'] = edges_gdf.geometry
+    return edges_gdf.set_geometry(edges_gdf.geometry.to_crs("EPSG:2154"))
+
+
+def load_sensors(sensors_file):
+    """Capteurs avec coordonnées (GeoDataFrame Lambert 93 : counter_id, name)"""
+    with open(sensors_file, 'r') as f:
+        sensors_data = json.load(f)
+
+    sensors_info = sensors_data['sensors']
+    print(f"   ✅ {len(sensors_info)} capteurs chargés")
+
+    # Créer GeoDataFrame des capteurs
+    sensors_list = []
+    for counter_id, info in sensors_info.items():
+        if info['lat'] and info['lon']:
+            sensors_list.append({
+                'counter_id': counter_id,
+                'name': info['name'],
+                'geometry': Point(info['lon'], info['lat'])
+            })
+
+    sensors_gdf = gpd.GeoDataFrame(sensors_list, crs="EPSG:4326")
+    print(f"   • {len(sensors_gdf)} capteurs avec coordonnées")
+
+    return sensors_gdf.to_crs("EPSG:2154")
+
+
+def nearest_sensor_edges(sensors_lam, edges_lam, max_distance):
+    """
+    Edge(s) le(s) plus proche(s) de chaque capteur (≤ max_distance mètres)
+
+    Recherche du plus proche voisin via l'index spatial (STRtree) de geopandas au lieu
+    d'un calcul de distance à tous les edges pour chaque capteur. En cas d'égalité de
+    distance, tous les edges à égale distance sont renvoyés.
+
+    Returns:
+        DataFrame (index des capteurs) counter_id, name, osm_id, distance_m,
+        edge_position (index de l'edge dans le réseau)
+    """
+    nearest = gpd.sjoin_nearest(
+        sensors_lam[['counter_id', 'name', 'geometry']],
+        edges_lam[['osm_id', 'geometry']],
+        how='inner',
+        max_distance=max_distance,
+        distance_col='distance_m'
+    )
+    return pd.DataFrame(nearest.drop(columns='geometry')).rename(columns={'index_right': 'edge_position'})
+
+
+def sensor_matches(nearest):
+    """
+    Association capteur → edge depuis les candidats de nearest_sensor_edges
+
+    Un seul edge par capteur : le plus proche, et en cas d'égalité le premier dans
+    l'ordre du réseau (comme idxmin).
+
+    Returns:
+        dict {'sensor_to_edge': {counter_id: {edge_id, distance_m, sensor_name}},
+              'edges_with_sensors': [osm_id]}
+    """
+    nearest = (
+        nearest.sort_values(['distance_m', 'edge_position'], kind='stable')
+        .loc[lambda df: ~df.index.duplicated(keep='first')]
+        .sort_index()
+    )
+
+    sensor_to_edge = {}
+    for counter_id, sensor_name, edge_osm_id, dist in zip(
+        nearest['counter_id'], nearest['name'], nearest['osm_id'], nearest['distance_m']
+    ):
+        sensor_to_edge[counter_id] = {
+            'edge_id': edge_osm_id,
+            'distance_m': round(dist, 1),
+            'sensor_name': sensor_name
+        }
+
+    edges_with_sensors = list(set(info['edge_id'] for info in sensor_to_edge.values()))
+    return {'sensor_to_edge': sensor_to_edge, 'edges_with_sensors': edges_with_sensors}
+
+
+def match_sensors(edges_lam, sensors_file, max_distance):
+    """
+    Associe chaque capteur à l'edge le plus proche (≤ max_distance mètres)
+
+    Returns:
+        dict {'sensor_to_edge': {counter_id: {edge_id, distance_m, sensor_name}},
+              'edges_with_sensors': [osm_id]}
+    """
+    sensors_lam = load_sensors(sensors_file)
+
+    matching_start = time.perf_counter()
+    sensors = sensor_matches(nearest_sensor_edges(sensors_lam, edges_lam, max_distance))
+    matching_elapsed = time.perf_counter() - matching_start
+
+    print(f"   ✅ {len(sensors['sensor_to_edge'])} capteurs associés à des edges (≤{max_distance}m)")
+    print(f"   ⏱️  Association spatiale: {matching_elapsed:.2f}s")
+    print(f"   ✅ {len(sensors['edges_with_sensors'])} edges uniques avec capteurs")
+
+    return sensors
+
+
+def load_bike_lanes(bike_infra_file):
+    """Pistes cyclables (GeoDataFrame Lambert 93)"""
+    with open(bike_infra_file, 'r') as f:
+        bike_infra_data = json.load(f)
+
+    return gpd.GeoDataFrame.from_features(
+        bike_infra_data['geojson']['features'],
+        crs="EPSG:4171"  # RGF93
+    ).to_crs("EPSG:2154")
+
+
+def no_bike_lanes(edges_index):
+    """Valeurs par défaut sans données d'infrastructure cyclable"""
+    return pd.DataFrame(
+        {'bike_lane_distance_m': 999999.0, 'has_dedicated_bike_lane': False},
+        index=edges_index
+    )
+
+
+def bike_lane_distances(edges_lam, bike_lines_lam, buffer_m, max_distance=None):
+    """
+    Distance exacte de chaque edge à la piste la plus proche (un seul passage
+    sjoin_nearest, STRtree). Au-delà du rayon plafond (si défini), la distance
+    est bornée à ce rayon plutôt qu'à une valeur sentinelle.
+
+    Returns:
+        DataFrame (index des edges) 'bike_lane_distance_m', 'has_dedicated_bike_lane'
+    """
+    edges_index = edges_lam.index
+
+    search_radius = None
+    if max_distance is not None:
+        search_radius = max(max_distance, buffer_m)
+
+    nearest_lanes = gpd.sjoin_nearest(
+        edges_lam[['geometry']],
+        bike_lines_lam[['geometry']],
+        how='left',
+        max_distance=search_radius,
+        distance_col='bike_lane_distance_m'
+    )
+
+    # Un edge à égale distance de plusieurs pistes apparaît plusieurs fois
+    lane_distances = nearest_lanes.groupby(level=0)['bike_lane_distance_m'].min()
+    if search_radius is not None:
+        lane_distances = lane_distances.fillna(search_radius)
+
+    lanes = pd.DataFrame(index=edges_index)
+    lanes['bike_lane_distance_m'] = lane_distances.reindex(edges_index).astype(float)
+    lanes['has_dedicated_bike_lane'] = lanes['bike_lane_distance_m'] <= buffer_m
+    return lanes
+
+
+def bike_infra(edges_lam, bike_infra_file, buffer_m, max_distance=None):
+    """
+    Distance de chaque edge à la piste cyclable la plus proche
+
+    Args:
+        buffer_m: rayon (m) en dessous duquel un edge a une piste cyclable dédiée
+        max_distance: rayon plafond (m) de recherche (None = pas de plafond)
+
+    Returns:
+        DataFrame (index des edges) 'bike_lane_distance_m', 'has_dedicated_bike_lane'
+    """
+    if not bike_infra_file.exists():
+        print("   ⚠️  Infrastructure cyclable non trouvée, skip")
+        return no_bike_lanes(edges_lam.index)
+
+    bike_lines_gdf = load_bike_lanes(bike_infra_file)
+
+    print(f"   • Calcul distances pistes cyclables (plus proche voisin indexé, tous les edges)...")
+
+    bike_lane_start = time.perf_counter()
+    lanes = bike_lane_distances(edges_lam, bike_lines_gdf, buffer_m, max_distance)
+
+    print(f"   ⏱️  Distances calculées pour {len(lanes):,} edges en {time.perf_counter() - bike_lane_start:.2f}s")
+    print(f"   ✅ {lanes['has_dedicated_bike_lane'].sum()} edges avec piste cyclable dédiée (≤{buffer_m}m)")
+
+    return lanes
+
+
+def load_weather(weather_files):
+    """Table météo horaire (archive journalière et/ou anciens fichiers JSON)"""
+    n_partitions = sum(path.suffix == '.parquet' for path in weather_files)
+    print(f"   • Utilisation: {n_partitions} partitions de l'archive, {len(weather_files) - n_partitions} anciens fichiers")
+    weather_df = load_weather_files(weather_files)
+    print(f"   ✅ {len(weather_df)} mesures météo horaires "
+          f"({weather_df['timestamp'].min():%Y-%m-%d} → {weather_df['timestamp'].max():%Y-%m-%d})")
+    return weather_df
+
+
+def edge_features(edges_lam, sensors, bike_lanes):
+    """Features statiques de tous les edges (voir edge_feature_table)"""
+    edges = edge_feature_table(edges_lam, sensors, bike_lanes)
+
+    print(f"   ✅ Features calculées pour {len(edges)} edges")
+
+    return edges
+
+
+def edge_feature_table(edges_lam, sensors, bike_lanes):
+    """
+    Features statiques des edges (table compacte, sans géométrie)
+
+    La géométrie reste dans la table du réseau (load_osm). Les colonnes catégorielles
+    utilisent le vocabulaire figé partagé avec l'entraînement, les numériques des types
+    étroits (int16, float32).
+
+    Returns:
+        DataFrame (même index que le réseau) des colonnes EDGE_TABLE_COLUMNS
+    """
+    geometry_lam = edges_lam.geometry
+    highway_type = edges_lam['highway'].fillna('unknown')
+
+    # Distance au centre (Place Bellecour)
+    center_point = gpd.GeoSeries([Point(*LYON_CENTER)], crs="EPSG:4326").to_crs("EPSG:2154").iloc[0]
+
+    edges = pd.DataFrame({
+        'osm_id': edges_lam['osm_id'],
+        'name': edges_lam['name'].astype('category'),
+
+        # Attributs OSM
+        'highway_type': highway_type,
+        'road_category': road_category(highway_type),
+        'lanes': parse_int_tag(edges_lam['lanes'], DEFAULT_LANES),
+        'maxspeed_kmh': parse_int_tag(edges_lam['maxspeed'], DEFAULT_MAXSPEED_KMH),
+        'is_oneway': edges_lam['oneway'] == 'yes',
+
+        # Cyclable
+        'has_cycleway': edges_lam['cycleway'].notna(),
+        'cycleway_type': edges_lam['cycleway'].fillna('none'),
+        'has_dedicated_bike_lane': bike_lanes['has_dedicated_bike_lane'],
+        'bike_lane_distance_m': bike_lanes['bike_lane_distance_m'],
+        'surface_quality': surface_quality(edges_lam['surface']),
+        'bicycle_access': edges_lam['bicycle'].fillna('yes'),
+        'is_lit': edges_lam['lit'] == 'yes',
+
+        # Géométriques (Lambert 93 ; orientation depuis les extrémités, calcul vectorisé)
+        'edge_length_m': geometry_lam.length,
+        'distance_to_center_km': geometry_lam.distance(center_point) / 1000,
+        'orientation': edge_orientation(geometry_lam),
+
+        # Marquer edges avec capteurs
+        'has_real_sensor': edges_lam['osm_id'].isin(sensors['edges_with_sensors']),
+    }, index=edges_lam.index)
+
+    return compact_dtypes(edges)
+
+
+def temporal(sensors, edges, weather_df, counter_files, counter_cache_path, weather_max_staleness_h):
+    """
+    Dataset temporel (edges avec capteurs × heures), sans lag features
+
+    Returns:
+        DataFrame d'entraînement (colonnes DATASET_COLUMNS)
+    """
+    print(f"   • {len(counter_files)} fichiers de comptage trouvés")
+
+    # Charger tous les fichiers horaires (seuls les fichiers absents du cache sont décodés)
+    loading_start = time.perf_counter()
+    bike_df = load_counter_files(counter_files, cache_path=counter_cache_path)
+    print(f"   ⏱️  Chargement: {time.perf_counter() - loading_start:.2f}s")
+
+    # Associer edges
+    sensor_to_edge = sensors['sensor_to_edge']
+    bike_df['edge_id'] = bike_df['counter_id'].map(
+        lambda x: sensor_to_edge.get(x, {}).get('edge_id')
+    )
+    bike_df = bike_df[bike_df['edge_id'].notna()].copy()
+
+    print(f"   ✅ {len(bike_df):,} mesures chargées")
+    print(f"   📅 Période: {bike_df['timestamp'].min()} → {bike_df['timestamp'].max()}")
+
+    # Index temporel trié une seule fois (mesure exacte ou précédente)
+    weather_aligner = WeatherAligner(
+        weather_df,
+        max_staleness=pd.Timedelta(hours=weather_max_staleness_h),
+        direction='backward'
+    )
+
+    # Obtenir timestamps uniques
+    edges_with_sensors = sensors['edges_with_sensors']
+    timestamps = sorted(bike_df['timestamp'].unique())
+    print(f"   • {len(timestamps)} timestamps uniques")
+    print(f"   • {len(edges_with_sensors)} edges avec capteurs")
+    print(f"   • Dataset: {len(edges_with_sensors)} × {len(timestamps)} = {len(edges_with_sensors) * len(timestamps):,} lignes")
+
+    generation_start = time.perf_counter()
+
+    final_df = build_temporal_rows(
+        timestamps, edges_with_sensors, aggregate_counts(bike_df), edges, weather_aligner
+    )
+
+    n_missing_weather = int(final_df.drop_duplicates('timestamp')['weather_missing'].sum())
+    if n_missing_weather:
+        print(f"   ⚠️  {n_missing_weather} timestamps sans météo à ≤{weather_max_staleness_h}h (weather_missing)")
+
+    print(f"   ⏱️  Génération: {time.perf_counter() - generation_start:.2f}s")
+    print(f"   ✅ Dataset créé: {len(final_df):,} lignes")
+
+    return final_df
+
+
+def lags(final_df, features):
+    """Lag features (calendrier horaire complet par edge)"""
+    lag_start = time.perf_counter()
+
+    final_df = add_lag_features(final_df, features=features)
+
+    print(f"   • {', '.join(features)}")
+    print(f"   ⏱️  Lag features: {time.perf_counter() - lag_start:.2f}s")
+    print(f"   ✅ Lag features calculés")
+
+    return final_df
@@ -0,0 +1,90 @@
+"""
+Construction du dataset temporel (edges avec capteurs × heures)
+Produit cartésien vectorisé + features temporelles, météo, infrastructure et target
+(les lag features sont calculées ensuite par preprocessing.lag_features).
+"""
+
+import pandas as pd
+
+from preprocessing.weather_alignment import WEATHER_COLUMNS
+
+# Features statiques des edges reprises dans le dataset temporel
+EDGE_FEATURE_COLUMNS = [
+    'highway_type', 'road_category', 'lanes', 'maxspeed_kmh', 'has_cycleway',
+    'has_dedicated_bike_lane', 'bike_lane_distance_m', 'surface_quality', 'is_lit',
+    'edge_length_m', 'distance_to_center_km', 'orientation'
+]
+
+TEMPORAL_COLUMNS = [
+    'hour', 'day_of_week', 'is_weekend', 'is_rush_hour_morning', 'is_rush_hour_evening'
+]
+
+WEATHER_FEATURE_COLUMNS = WEATHER_COLUMNS + ['is_cold', 'is_hot', 'is_windy', 'weather_missing']
+
+# Ordre des colonnes : identifiants, temporel, météo, infrastructure, target
+DATASET_COLUMNS = (
+    ['edge_id', 'timestamp']
+    + TEMPORAL_COLUMNS
+    + WEATHER_FEATURE_COLUMNS
+    + EDGE_FEATURE_COLUMNS
+    + ['bike_count']
+)
+
+
+def aggregate_counts(bike_df):
+    """Somme des comptages par (edge, heure) ; bike_df doit avoir une colonne 'edge_id'"""
+    return (
+        bike_df.groupby(['edge_id', 'timestamp'])['count']
+        .sum()
+        .rename('bike_count')
+        .reset_index()
+    )
+
+
+def build_temporal_rows(timestamps, edge_ids, bike_counts, edges_features, weather_aligner):
+    """
+    Construit les lignes (edge × timestamp) du dataset
+
+    Args:
+        timestamps: timestamps à générer
+        edge_ids: edges avec capteurs
+        bike_counts: DataFrame (edge_id, timestamp, bike_count) issu de aggregate_counts
+        edges_features: DataFrame 'osm_id' + EDGE_FEATURE_COLUMNS
+        weather_aligner: WeatherAligner sur la table météo
+
+    Returns:
+        DataFrame avec DATASET_COLUMNS (bike_count NaN si pas de mesure)
+    """
+    timestamps_df = pd.DataFrame({'timestamp': list(timestamps)})
+
+    # Produit cartésien (timestamp × edge avec capteur)
+    grid = timestamps_df.merge(pd.DataFrame({'edge_id': list(edge_ids)}), how='cross')
+
+    # Features temporelles
+    grid['hour'] = grid['timestamp'].dt.hour.astype('int64')
+    grid['day_of_week'] = grid['timestamp'].dt.dayofweek.astype('int64')
+    grid['is_weekend'] = grid['day_of_week'] >= 5
+    grid['is_rush_hour_morning'] = grid['hour'].between(7, 9)
+    grid['is_rush_hour_evening'] = grid['hour'].between(17, 19)
+
+    # Météo : mesure exacte, sinon la précédente dans la tolérance (jointure temporelle unique)
+    weather_aligned = weather_aligner.align(timestamps_df['timestamp'], columns=WEATHER_COLUMNS)
+    weather_aligned = weather_aligned.drop(columns='weather_timestamp')
+    weather_aligned['is_cold'] = weather_aligned['temperature_c'] < 10
+    weather_aligned['is_hot'] = weather_aligned['temperature_c'] > 25
+    weather_aligned['is_windy'] = weather_aligned['wind_speed_kmh'] > 20
+    weather_aligned['timestamp'] = timestamps_df['timestamp']
+    grid = grid.merge(weather_aligned, on='timestamp', how='left')
+
+    # Features statiques des edges
+    edges_features = (
+        pd.DataFrame(edges_features[['osm_id'] + EDGE_FEATURE_COLUMNS])
+        .drop_duplicates('osm_id', keep='last')
+        .rename(columns={'osm_id': 'edge_id'})
+    )
+    grid = grid.merge(edges_features, on='edge_id', how='left')
+
+    # Target
+    final_df = grid.merge(bike_counts, on=['edge_id', 'timestamp'], how='left')
+
+    return final_df[DATASET_COLUMNS]
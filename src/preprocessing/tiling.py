@@ -0,0 +1,354 @@
+"""
+Preprocessing par tuiles (réseaux plus grands que la mémoire)
+Le réseau OSM est découpé en tuiles carrées en Lambert 93 : chaque edge appartient à la
+tuile qui contient le centre de son emprise. Le réseau n'est jamais chargé en entier : le
+fichier OSM est lu en flux (ijson si disponible) par blocs d'edges, écrits en GeoParquet dans
+le dossier de leur tuile, puis l'association des capteurs et les features des edges sont
+calculées tuile par tuile dans un pool de processus.
+
+Halo : chaque tuile ne lit que les pistes cyclables dont l'emprise coupe celle de ses edges
+élargie de halo_m. La distance à la piste la plus proche est donc exacte jusqu'à halo_m et
+bornée à halo_m au-delà (comme avec un rayon plafond). De même, les capteurs d'une tuile
+sont cherchés dans l'emprise de ses edges élargie du rayon d'association.
+
+Mêmes noms d'étapes que le mode normal (create_ml_dataset_v3.py --tile-size-km) :
+- load_osm: partition_network (découpage du réseau en tuiles)
+- match_sensors: match_sensors_tiled
+- bike_infra: partition_bike_lanes (pistes cyclables en GeoParquet filtrable par emprise)
+- edge_features: edge_features_tiled (une partition du magasin des edges par tuile)
+- road_graph: road_graph_tiled (graphe du réseau entier, construit à partir des seuls sommets)
+- temporal: temporal (dataset sur les seuls edges avec capteurs)
+"""
+
+import os
+import json
+import math
+import shutil
+import multiprocessing
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from itertools import islice
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import ijson
+except ImportError:  # fichier OSM chargé en entier avec json
+    ijson = None
+
+from preprocessing import stages
+from preprocessing.road_graph import DEFAULT_SNAP_M, print_summary, road_graph_from_coordinates
+from preprocessing.stages import EDGE_TABLE_COLUMNS
+from preprocessing.edge_store import write_edge_store_partition
+
+# Côté des tuiles (m, Lambert 93)
+DEFAULT_TILE_SIZE_M = 5000
+# Halo (m) de recherche des pistes cyclables autour des edges d'une tuile
+DEFAULT_HALO_M = 1000
+# Nombre de processus par défaut
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+# Nombre d'edges OSM convertis à la fois lors du découpage
+CHUNK_SIZE = 50000
+
+# Propriétés des edges OSM (fetch_osm_network.py) : mêmes colonnes dans toutes les tuiles
+OSM_COLUMNS = [
+    'osm_id', 'highway', 'name', 'maxspeed', 'lanes', 'oneway', 'surface', 'lit',
+    'cycleway', 'foot', 'bicycle', 'width', 'access', 'service'
+]
+
+# Dossiers des tuiles (dans data/processed/cache/tiles)
+TILES_DIRNAME = "tiles"
+EDGES_DIRNAME = "edges"
+FEATURES_DIRNAME = "features"
+LANES_FILENAME = "bike_lanes.parquet"
+
+
+def tile_ids(geometries, tile_size_m):
+    """Tuile (« ix_iy ») de chaque géométrie : celle qui contient le centre de son emprise"""
+    bounds = shapely.bounds(np.asarray(geometries.values))
+    ix = np.floor((bounds[:, 0] + bounds[:, 2]) / 2 / tile_size_m).astype(np.int64)
+    iy = np.floor((bounds[:, 1] + bounds[:, 3]) / 2 / tile_size_m).astype(np.int64)
+    return pd.Series([f"{x}_{y}" for x, y in zip(ix, iy)], index=geometries.index)
+
+
+def _iter_features(osm_file):
+    """Features GeoJSON du fichier OSM, en flux si ijson est installé"""
+    with open(osm_file, 'rb') as f:
+        if ijson is not None:
+            yield from ijson.items(f, 'geojson.features.item', use_float=True)
+        else:
+            yield from json.load(f)['geojson']['features']
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _expand(bounds, margin):
+    minx, miny, maxx, maxy = bounds
+    return (minx - margin, miny - margin, maxx + margin, maxy + margin)
+
+
+def tile_path(partition, tile_id):
+    """GeoParquet des edges d'une tuile"""
+    return Path(partition['dir']) / f"tile={tile_id}.parquet"
+
+
+def read_tile(path, columns=None):
+    """Edges d'une tuile (Lambert 93 + 'geometry_wgs84'), index = position dans le réseau"""
+    return gpd.read_parquet(path, columns=columns)
+
+
+def _process_map(func, tasks, workers):
+    """
+    Applique func aux tâches dans un pool de processus (dans l'ordre des tâches)
+
+    Les processus sont créés par fork : avec spawn, chaque processus réexécuterait le
+    script appelant. Sans fork (Windows), les tuiles sont traitées séquentiellement.
+    """
+    if workers <= 1 or len(tasks) <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return [func(task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                             mp_context=multiprocessing.get_context('fork')) as pool:
+        return list(pool.map(func, tasks))
+
+
+# =====================================================================
+# ÉTAPES
+# =====================================================================
+
+def partition_network(osm_file, tiles_dir, tile_size_m, chunk_size=CHUNK_SIZE):
+    """
+    Découpe le réseau OSM en tuiles (un GeoParquet par tuile)
+
+    Chaque bloc lu est réparti dans les dossiers des tuiles, puis les parties de chaque
+    tuile sont regroupées en un seul fichier (une lecture par tuile aux étapes suivantes).
+
+    Returns:
+        dict {'tile_size_m', 'dir', 'n_edges',
+              'tiles': {tile_id: {'n_edges', 'bounds' (emprise Lambert 93 de ses edges)}}}
+    """
+    edges_dir = tiles_dir / EDGES_DIRNAME
+    shutil.rmtree(edges_dir, ignore_errors=True)
+
+    tiles = {}
+    position = 0
+    for chunk_number, features in enumerate(_chunks(_iter_features(osm_file), chunk_size)):
+        chunk = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+        chunk = chunk.reindex(columns=OSM_COLUMNS + ['geometry'])
+        chunk.index = pd.RangeIndex(position, position + len(chunk))
+        position += len(chunk)
+
+        # Lambert 93 pour les calculs de distance, géométrie d'origine pour les exports
+        chunk['geometry_wgs84'] = chunk.geometry
+        chunk = chunk.set_geometry(chunk.geometry.to_crs("EPSG:2154"))
+
+        for tile_id, tile_edges in chunk.groupby(tile_ids(chunk.geometry, tile_size_m), sort=False):
+            tile_dir = edges_dir / f"tile={tile_id}"
+            tile_dir.mkdir(parents=True, exist_ok=True)
+            tile_edges.to_parquet(tile_dir / f"part-{chunk_number:05d}.parquet")
+
+            tile = tiles.setdefault(tile_id, {'n_edges': 0, 'bounds': [math.inf, math.inf, -math.inf, -math.inf]})
+            minx, miny, maxx, maxy = tile_edges.total_bounds
+            tile['n_edges'] += len(tile_edges)
+            tile['bounds'] = [
+                min(tile['bounds'][0], minx), min(tile['bounds'][1], miny),
+                max(tile['bounds'][2], maxx), max(tile['bounds'][3], maxy)
+            ]
+
+    for tile_id in tiles:
+        tile_dir = edges_dir / f"tile={tile_id}"
+        parts = sorted(tile_dir.glob("part-*.parquet"))
+        pd.concat([gpd.read_parquet(part) for part in parts]).to_parquet(edges_dir / f"tile={tile_id}.parquet")
+        shutil.rmtree(tile_dir)
+
+    print(f"   ✅ {position} edges OSM répartis en {len(tiles)} tuiles de {tile_size_m / 1000:g} km")
+
+    return {
+        'tile_size_m': tile_size_m,
+        'dir': str(edges_dir),
+        'n_edges': position,
+        'tiles': dict(sorted(tiles.items()))
+    }
+
+
+def _tile_sensor_candidates(task):
+    path, sensors_lam, max_distance = task
+    return stages.nearest_sensor_edges(sensors_lam, read_tile(path, columns=['osm_id', 'geometry']), max_distance)
+
+
+def match_sensors_tiled(partition, sensors_file, max_distance, workers=DEFAULT_WORKERS):
+    """
+    Associe chaque capteur à l'edge le plus proche (≤ max_distance mètres), tuile par tuile
+
+    Returns:
+        même dict que stages.match_sensors
+    """
+    sensors_lam = stages.load_sensors(sensors_file)
+
+    # Seules les tuiles dont l'emprise élargie contient des capteurs sont lues
+    tasks = []
+    for tile_id, tile in partition['tiles'].items():
+        minx, miny, maxx, maxy = _expand(tile['bounds'], max_distance)
+        nearby = sensors_lam.cx[minx:maxx, miny:maxy]
+        if len(nearby):
+            tasks.append((tile_path(partition, tile_id), nearby, max_distance))
+
+    candidates = _process_map(_tile_sensor_candidates, tasks, workers)
+    if candidates:
+        nearest = pd.concat(candidates)
+    else:
+        nearest = pd.DataFrame(columns=['counter_id', 'name', 'osm_id', 'distance_m', 'edge_position'])
+
+    sensors = stages.sensor_matches(nearest)
+
+    print(f"   ✅ {len(sensors['sensor_to_edge'])} capteurs associés à des edges (≤{max_distance}m, {len(tasks)} tuiles)")
+    print(f"   ✅ {len(sensors['edges_with_sensors'])} edges uniques avec capteurs")
+
+    return sensors
+
+
+def partition_bike_lanes(bike_infra_file, tiles_dir):
+    """
+    Pistes cyclables en GeoParquet Lambert 93 avec emprise par ligne (lecture filtrée par tuile)
+
+    Returns:
+        dict {'lanes': chemin du GeoParquet, ou None sans infrastructure cyclable}
+    """
+    lanes_path = tiles_dir / LANES_FILENAME
+
+    if not bike_infra_file.exists():
+        print("   ⚠️  Infrastructure cyclable non trouvée, skip")
+        lanes_path.unlink(missing_ok=True)
+        return {'lanes': None}
+
+    lanes = stages.load_bike_lanes(bike_infra_file)[['geometry']]
+
+    tiles_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = lanes_path.with_suffix('.tmp')
+    lanes.to_parquet(tmp_path, write_covering_bbox=True)
+    tmp_path.replace(lanes_path)
+
+    print(f"   ✅ {len(lanes):,} pistes cyclables préparées pour la lecture par tuile")
+    return {'lanes': str(lanes_path)}
+
+
+def _tile_features(task):
+    tile_id, path, bounds, lanes_path, edges_with_sensors, buffer_m, search_radius, output_path = task
+
+    edges = read_tile(path)
+
+    if lanes_path is None:
+        bike_lanes = stages.no_bike_lanes(edges.index)
+    else:
+        # Pistes dans le halo : distance exacte jusqu'au rayon de recherche, bornée au-delà
+        lanes = gpd.read_parquet(lanes_path, bbox=_expand(bounds, search_radius))
+        if len(lanes):
+            bike_lanes = stages.bike_lane_distances(edges, lanes, buffer_m, search_radius)
+        else:
+            bike_lanes = pd.DataFrame(
+                {'bike_lane_distance_m': float(search_radius), 'has_dedicated_bike_lane': False},
+                index=edges.index
+            )
+
+    features = stages.edge_feature_table(edges, {'edges_with_sensors': edges_with_sensors}, bike_lanes)
+    features = features[EDGE_TABLE_COLUMNS]
+    write_edge_store_partition(features, output_path)
+
+    return tile_id, features[features['has_real_sensor']]
+
+
+def edge_features_tiled(partition, sensors, lanes, buffer_m, halo_m, features_dir,
+                        max_distance=None, workers=DEFAULT_WORKERS):
+    """
+    Features statiques de tous les edges, tuile par tuile (pool de processus)
+
+    Args:
+        buffer_m: rayon (m) en dessous duquel un edge a une piste cyclable dédiée
+        halo_m: halo (m) de lecture des pistes cyclables autour de chaque tuile
+        features_dir: dossier des partitions (une table Feather par tuile)
+        max_distance: rayon plafond (m) de recherche de la piste la plus proche
+                      (borné au halo ; None = halo)
+
+    Returns:
+        dict {'partitions': {tile_id: chemin du Feather},
+              'sensor_edges': table compacte des edges avec capteurs (ordre du réseau)}
+    """
+    if halo_m < buffer_m:
+        raise ValueError(f"Halo ({halo_m}m) inférieur au rayon de piste dédiée ({buffer_m}m)")
+
+    shutil.rmtree(features_dir, ignore_errors=True)
+    features_dir.mkdir(parents=True)
+
+    search_radius = halo_m if max_distance is None else max(min(max_distance, halo_m), buffer_m)
+
+    tasks = [
+        (tile_id, tile_path(partition, tile_id), tile['bounds'], lanes['lanes'],
+         sensors['edges_with_sensors'], buffer_m, search_radius, features_dir / f"tile={tile_id}.feather")
+        for tile_id, tile in partition['tiles'].items()
+    ]
+    results = _process_map(_tile_features, tasks, workers)
+
+    if results:
+        sensor_edges = pd.concat([tile_sensor_edges for _, tile_sensor_edges in results]).sort_index()
+    else:
+        sensor_edges = pd.DataFrame(columns=EDGE_TABLE_COLUMNS)
+
+    print(f"   ✅ Features calculées pour {partition['n_edges']} edges ({len(tasks)} tuiles, "
+          f"pistes cyclables jusqu'à {search_radius:g}m)")
+
+    return {
+        'partitions': {tile_id: str(features_dir / f"tile={tile_id}.feather") for tile_id, _ in results},
+        'sensor_edges': sensor_edges
+    }
+
+
+def road_graph_tiled(partition, snap_m=DEFAULT_SNAP_M):
+    """
+    Graphe du réseau entier (road_graph.build_road_graph), tuile par tuile
+
+    Seuls les sommets des géométries sont gardés en mémoire (tableaux numpy).
+    """
+    coords, parts = [], []
+    edge_osm_ids = np.zeros(partition['n_edges'], dtype=np.int64)
+    for tile_id in partition['tiles']:
+        edges = read_tile(tile_path(partition, tile_id), columns=['osm_id', 'geometry'])
+        tile_coords, tile_parts = shapely.get_coordinates(np.asarray(edges.geometry.values), return_index=True)
+        coords.append(tile_coords)
+        parts.append(edges.index.to_numpy()[tile_parts])
+        edge_osm_ids[edges.index.to_numpy()] = edges['osm_id'].to_numpy()
+
+    # Sommets dans l'ordre du réseau (tri stable : ordre des sommets de chaque way conservé)
+    parts = np.concatenate(parts)
+    order = np.argsort(parts, kind='stable')
+    graph = road_graph_from_coordinates(np.concatenate(coords)[order], parts[order], edge_osm_ids, snap_m)
+    print_summary(graph)
+    return graph
+
+
+def temporal(sensors, tiled_edges, weather_df, **kwargs):
+    """Dataset temporel (stages.temporal) sur la table des edges avec capteurs"""
+    return stages.temporal(sensors, tiled_edges['sensor_edges'], weather_df, **kwargs)
+
+
+def write_geopackage(partition, tiled_edges, gpkg_path):
+    """Écrit edges_static_v3.gpkg tuile par tuile (features + géométrie WGS84)"""
+    tmp_path = gpkg_path.with_name(f"{gpkg_path.stem}.tmp.gpkg")
+    tmp_path.unlink(missing_ok=True)
+
+    for n, (tile_id, features_path) in enumerate(tiled_edges['partitions'].items()):
+        features = pd.read_feather(features_path)
+        geometry = read_tile(tile_path(partition, tile_id), columns=['osm_id', 'geometry_wgs84'])
+        geometry = geometry.set_index('osm_id')['geometry_wgs84']
+
+        tile_static = gpd.GeoDataFrame(
+            features, geometry=geometry.reindex(features['osm_id']).values, crs="EPSG:4326"
+        )
+        tile_static.to_file(tmp_path, driver="GPKG", mode='a' if n else 'w')
+
+    tmp_path.replace(gpkg_path)
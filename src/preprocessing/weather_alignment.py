@@ -0,0 +1,151 @@
+"""
+Alignement temporel des données météo horaires
+Trie la table météo une seule fois puis répond aux requêtes
+"mesure exacte ou précédente" (ou "la plus proche") par recherche
+dichotomique (merge_asof / searchsorted), avec une fraîcheur maximale tolérée.
+
+Utilisé par le preprocessing (jointure sur tous les timestamps du dataset)
+et par la prédiction (une requête par heure prédite).
+"""
+
+import numpy as np
+import pandas as pd
+
+from data_collection.weather_store import (
+    STORE_DIRNAME, is_legacy_file, list_partitions, read_legacy_file, read_partition
+)
+
+# Variables météo utilisées comme features
+WEATHER_COLUMNS = ['temperature_c', 'precipitation_mm', 'wind_speed_kmh', 'is_raining']
+
+# Écart maximal par défaut entre un timestamp et la mesure météo retenue
+DEFAULT_MAX_STALENESS = pd.Timedelta(hours=3)
+
+
+def find_weather_files(weather_data_dir):
+    """
+    Fichiers météo par ordre de priorité : partitions de l'archive (data_collection.weather_store),
+    puis anciens fichiers weather_data_*.json du plus récent au plus ancien, puis weather_data.json
+    (liste vide si aucun)
+    """
+    legacy_files = sorted(
+        (path for path in weather_data_dir.glob("weather_data*.json") if is_legacy_file(path)),
+        key=lambda path: (path.name != "weather_data.json", path.name),
+        reverse=True
+    )
+    return list_partitions(weather_data_dir / STORE_DIRNAME) + legacy_files
+
+
+def load_weather_files(weather_files):
+    """
+    Table météo horaire de plusieurs fichiers (partitions et/ou anciens fichiers JSON) ;
+    pour une même heure, la mesure du premier fichier (find_weather_files) est retenue
+    """
+    frames = [
+        read_partition(path) if path.suffix == '.parquet' else read_legacy_file(path)
+        for path in weather_files
+    ]
+    weather_df = pd.concat(frames, ignore_index=True)
+    weather_df['timestamp'] = pd.to_datetime(weather_df['timestamp'])
+    return (
+        weather_df.drop_duplicates('timestamp', keep='first')
+        .sort_values('timestamp')
+        .reset_index(drop=True)
+    )
+
+
+def _to_datetime_ns(values):
+    """Convertit en datetime64[ns] (merge_asof exige la même résolution des deux côtés)"""
+    return pd.to_datetime(values).astype('datetime64[ns]')
+
+
+class WeatherAligner:
+    """
+    Index temporel trié sur une table météo horaire
+
+    Args:
+        weather_df: DataFrame avec une colonne 'timestamp' et les variables météo
+        max_staleness: écart maximal toléré entre un timestamp et la mesure retenue
+        direction: 'backward' (mesure exacte ou précédente) ou 'nearest' (la plus proche)
+    """
+
+    def __init__(self, weather_df, max_staleness=DEFAULT_MAX_STALENESS, direction='backward'):
+        if direction not in ('backward', 'nearest'):
+            raise ValueError(f"Direction d'alignement inconnue: {direction}")
+
+        self.max_staleness = pd.Timedelta(max_staleness)
+        self.direction = direction
+
+        weather = weather_df.copy()
+        weather['timestamp'] = _to_datetime_ns(weather['timestamp'])
+
+        # Tri unique ; en cas de doublon on garde la première mesure
+        self.weather = (
+            weather.sort_values('timestamp', kind='stable')
+            .drop_duplicates('timestamp', keep='first')
+            .reset_index(drop=True)
+        )
+        self._times = self.weather['timestamp'].to_numpy()
+
+    def __len__(self):
+        return len(self.weather)
+
+    def align(self, timestamps, columns=None):
+        """
+        Aligne un ensemble de timestamps en une seule jointure merge_asof
+
+        Args:
+            timestamps: séquence de timestamps (ordre quelconque, conservé en sortie)
+            columns: variables météo à joindre (défaut: WEATHER_COLUMNS disponibles)
+
+        Returns:
+            DataFrame avec 'timestamp', les variables météo, 'weather_timestamp'
+            (mesure retenue) et 'weather_missing' (aucune mesure dans la tolérance)
+        """
+        if columns is None:
+            columns = [c for c in WEATHER_COLUMNS if c in self.weather.columns]
+
+        left = pd.DataFrame({'timestamp': _to_datetime_ns(pd.Series(list(timestamps)))})
+        left['_order'] = np.arange(len(left))
+
+        right = self.weather[['timestamp'] + columns].copy()
+        right['weather_timestamp'] = right['timestamp']
+
+        aligned = pd.merge_asof(
+            left.sort_values('timestamp', kind='stable'),
+            right,
+            on='timestamp',
+            direction=self.direction,
+            tolerance=self.max_staleness
+        )
+
+        aligned = aligned.sort_values('_order').drop(columns='_order').reset_index(drop=True)
+        aligned['weather_missing'] = aligned['weather_timestamp'].isna()
+        return aligned
+
+    def lookup(self, timestamp):
+        """
+        Mesure météo pour un seul timestamp (recherche dichotomique)
+
+        Returns:
+            pd.Series de la mesure retenue, ou None si aucune mesure dans la tolérance
+        """
+        ts = pd.Timestamp(timestamp).to_datetime64().astype('datetime64[ns]')
+
+        # Première mesure strictement postérieure à ts
+        pos = int(np.searchsorted(self._times, ts, side='right'))
+
+        candidates = []
+        if pos > 0:
+            candidates.append(pos - 1)
+        if self.direction == 'nearest' and pos < len(self._times):
+            candidates.append(pos)
+
+        if not candidates:
+            return None
+
+        best = min(candidates, key=lambda i: abs(self._times[i] - ts))
+        if abs(self._times[best] - ts) > self.max_staleness:
+            return None
+
+        return self.weather.iloc[best]